@@ -6,7 +6,7 @@ and storing the results in Supabase. It integrates with Google's Gemini API for
 and handles CORS for both development and production environments.
 """
 
-from flask import Flask, Blueprint, request, jsonify
+from flask import Flask, Blueprint, request, jsonify, Response, stream_with_context
 from flask_restful import Api, Resource
 from dotenv import load_dotenv
 from flask_cors import CORS
@@ -17,28 +17,52 @@ from langchain_core.messages import SystemMessage, HumanMessage
 # from utils.cosine_sim import *
 from utils.prompts import *
 from utils.evaluate import *
-from utils.llm import get_llm, resolve_model_name, DEFAULT_MODEL
+from utils.llm import invoke_chat, resolve_model_name, get_rate_limiter_stats, get_llm_cache_stats, get_retry_stats, track_usage, DEFAULT_MODEL
 from utils.progress import create_progress_updater
+from utils.concurrency import get_concurrency_stats
+from utils.pipeline import stream_baseline_and_evaluate
+from utils.async_engine import run_async, stream_baseline_and_evaluate_async
+from utils.response_cache import get_response_cache_stats, CACHE_SITE_GENERATE_STEPS
+from utils.supabase_pool import SupabaseClientPool
+from utils.experiment_state import experiment_states, is_terminal, ProgressReadCache
+from utils.checkpoints import get_checkpoint_store, init_checkpoint_store
+from utils.budget import CostBudget, budget_limit
+from utils.estimate import estimate_simulation, record_run_usage, get_estimate_stats
+from utils.jobs import JobQueue, QueueFull, JobAlreadyActive, GroupLimitReached, ACTIVE_STATES
+from utils.stream_tokens import StreamTokenSigner
 try:
-    from utils.pricing import compute_prompt_and_eval_cost, compute_cost
+    from utils.pricing import (
+        compute_prompt_and_eval_cost, compute_cost, compute_cost_for_model, get_pricing_index, get_pricing_stats
+    )
+    # Load the pricing snapshot now and refresh it in the background if stale,
+    # so the first simulation is already priced at live rates
+    get_pricing_index().refresh_in_background()
 except ModuleNotFoundError:
     # Fallback when utils.pricing is not deployed (e.g. missing from build context)
     _INPUT_PER_M = 0.15
     _OUTPUT_PER_M = 0.60
     def compute_cost(input_tokens: int, output_tokens: int) -> float:
         return (input_tokens * _INPUT_PER_M / 1e6) + (output_tokens * _OUTPUT_PER_M / 1e6)
+    def compute_cost_for_model(model_name: str, input_tokens: int, output_tokens: int) -> float:
+        return compute_cost(input_tokens, output_tokens)
     def compute_prompt_and_eval_cost(pi: int, po: int, ei: int, eo: int, model_name: str = "gemini-2.0-flash"):
         # model_name accepted for signature parity with the real implementation;
         # the fallback only supports Gemini rates.
         return (round(compute_cost(pi, po), 6), round(compute_cost(ei, eo), 6))
+    def get_pricing_stats():
+        return {"models": [], "age_seconds": None}
 from utils.used_prompts import (
     GENERATE_STEPS_SYSTEM_PROMPT,
     get_generate_steps_user_prompt
 )
+import tempfile
 import threading
 import uuid
 import random
 import json
+import time
+import hashlib
+import hmac
 import re
 import logging
 import stripe
@@ -104,27 +128,114 @@ load_dotenv(dotenv_path=env_path)
 # This bypasses RLS, so it must NEVER be exposed to clients.
 service_key: str = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 
-# Function to create a Supabase client with optional JWT authentication
-def get_supabase_client(jwt=None):
-    """
-    Create a Supabase client instance with optional JWT authentication.
-    This ensures each request gets its own client to avoid concurrency issues.
-    """
+def _create_supabase_client(jwt=None):
     client = create_client(url, key)
     if jwt:
         client.auth.set_session(jwt, "")
     return client
 
 
+def _create_service_client():
+    if not service_key:
+        return None
+    return create_client(url, service_key)
+
+
+# Clients are reused per JWT until the token expires instead of being rebuilt
+# (with a fresh auth session) for every request and progress write.
+supabase_pool = SupabaseClientPool(
+    _create_supabase_client,
+    _create_service_client,
+    max_size=int(os.environ.get("SUPABASE_CLIENT_POOL_SIZE", 256)),
+)
+
+
+# Function to get a Supabase client with optional JWT authentication
+def get_supabase_client(jwt=None):
+    """
+    Return a pooled Supabase client authenticated with the given JWT.
+    Each JWT gets its own client, so one user's session never leaks into another's.
+    """
+    return supabase_pool.get(jwt)
+
+
+def drop_client_on_auth_error(jwt, exc):
+    """
+    Forget the pooled client for jwt when Supabase rejected the token (401 or a
+    JWT error), so the caller's next request authenticates a fresh session.
+    """
+    if jwt:
+        supabase_pool.invalidate_on_auth_error(jwt, exc)
+
+
 def get_service_client():
     """
-    Create a Supabase client using the service-role key. Bypasses RLS so the
+    Return the Supabase client using the service-role key. Bypasses RLS so the
     backend can update protected columns (like user_emails.credits). Returns None
     if the service key isn't configured.
     """
-    if not service_key:
+    return supabase_pool.get_service()
+
+
+# Checkpoints go to Supabase (service client) so any instance can resume a run,
+# unless CHECKPOINT_DB_PATH names a SQLite file on a mounted volume
+init_checkpoint_store(get_service_client)
+
+
+# Short-lived copies of polled progress rows; run_evaluation's writes are
+# written through via the state registry
+progress_read_cache = ProgressReadCache(ttl_seconds=float(os.environ.get("PROGRESS_CACHE_TTL", 2.0)))
+experiment_states.add_listener(progress_read_cache.apply)
+
+
+def update_experiment(supabase, experiment_id, fields):
+    """
+    Update an experiments row and publish the progress/status/url change to
+    in-process listeners (see utils.experiment_state).
+    """
+    response = supabase.table("experiments").update(fields).eq("experiment_id", experiment_id).execute()
+    experiment_states.publish(experiment_id, fields)
+    return response
+
+
+def get_user_credits(supabase, user_id):
+    """
+    Current user_emails.credits balance (USD) of a user, read with the service
+    client when configured (else the caller's client). None when the user has no
+    balance on record or it cannot be read, which means no per-user ceiling.
+    """
+    if not user_id:
         return None
-    return create_client(url, service_key)
+    client = get_service_client() or supabase
+    try:
+        row = client.table("user_emails").select("credits").eq("user_id", user_id).execute()
+    except Exception as e:
+        logger.warning(f"Could not read credits for user {user_id}: {e}")
+        return None
+    if not row.data:
+        return None
+    return row.data[0].get("credits")
+
+
+def run_cost_ceiling(supabase, data, credits=None):
+    """
+    Cost ceiling (USD) for a run of `data`: the tightest of the user's credits
+    (read unless given), the request's max_cost and SIMULATION_MAX_COST. None
+    when nothing limits it.
+    """
+    if credits is None:
+        credits = get_user_credits(supabase, data.get('user_id'))
+    return budget_limit(credits, data.get('max_cost'))
+
+
+def no_budget_response(ceiling):
+    """402 response for a run whose cost ceiling leaves nothing to spend, else None."""
+    if ceiling is not None and ceiling <= 0:
+        return {
+            "status": "error",
+            "message": "No credits remaining (cost ceiling is $0). Add credits or raise max_cost to run this simulation.",
+        }, 402
+    return None
 
 
 def credit_user_account(user_id, amount, session):
@@ -176,6 +287,10 @@ STRIPE_CURRENCY = "usd"
 STRIPE_MIN_AMOUNT = 1       # $1
 STRIPE_MAX_AMOUNT = 10000   # $10,000
 
+# Execution engine for LLM calls: "threads" (thread pools) or "asyncio" (one
+# shared event loop with up to LLM_ASYNC_CONCURRENCY in-flight calls).
+LLM_ENGINE = os.environ.get("LLM_ENGINE", "threads").lower()
+
 
 def parse_age_range(age_range_str):
     """
@@ -266,43 +381,40 @@ def generate_random_samples(attributes, num_samples=10):
     return samples
 
 
-def run_evaluation(uuid, data, model_name, jwt=None):
-    fn = None  # Initialize fn variable for cleanup
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+
+
+def sample_count(data):
+    """Number of personas a run samples: data['iters'], clamped to 10-50."""
+    num_samples = data.get('iters', 10)
     try:
-        # Create a new Supabase client for this request
-        supabase = get_supabase_client(jwt)
+        return max(10, min(50, int(num_samples)))
+    except (TypeError, ValueError):
+        return 10
 
-        # Number of sample rows (personas) to use for this run: from request, clamped to 10-50
-        num_samples = data.get('iters', 10)
-        try:
-            num_samples = max(10, min(50, int(num_samples)))
-        except (TypeError, ValueError):
-            num_samples = 10
 
-        # Always maintain 50 unique personas; use only the first num_samples for this run.
-        PERSONA_POOL_SIZE = 50
+def select_personas(supabase, data, num_samples):
+    """
+    Pick the personas for a run from the sample's stored pool, generating
+    (and storing) a new pool when the sample has fewer than 50.
 
-        sample_id = data.get('sample')['id']
-        try:
-            sample_response = supabase.table("samples").select("persona").eq("id", sample_id).execute()
-
-            if sample_response.data and sample_response.data[0].get('persona') is not None:
-                existing_personas = sample_response.data[0]['persona']
-                if isinstance(existing_personas, list):
-                    existing_personas = sorted(existing_personas, key=lambda x: x.get('number', 0))
-                if len(existing_personas) >= PERSONA_POOL_SIZE:
-                    random_samples = existing_personas[:num_samples]
-                else:
-                    attributes = data.get('sample')['attributes']
-                    persona_pool = generate_random_samples(attributes, num_samples=PERSONA_POOL_SIZE)
-                    if isinstance(persona_pool, list):
-                        persona_pool = sorted(persona_pool, key=lambda x: x.get('number', 0))
-                    random_samples = persona_pool[:num_samples]
-                    if supabase and persona_pool:
-                        try:
-                            supabase.table("samples").update({"persona": persona_pool}).eq("id", sample_id).execute()
-                        except Exception:
-                            pass
+    Returns:
+        list: num_samples persona dicts
+    """
+    # Always maintain 50 unique personas; use only the first num_samples for this run.
+    PERSONA_POOL_SIZE = 50
+
+    sample_id = data.get('sample')['id']
+    try:
+        sample_response = supabase.table("samples").select("persona").eq("id", sample_id).execute()
+
+        if sample_response.data and sample_response.data[0].get('persona') is not None:
+            existing_personas = sample_response.data[0]['persona']
+            if isinstance(existing_personas, list):
+                existing_personas = sorted(existing_personas, key=lambda x: x.get('number', 0))
+            if len(existing_personas) >= PERSONA_POOL_SIZE:
+                random_samples = existing_personas[:num_samples]
             else:
                 attributes = data.get('sample')['attributes']
                 persona_pool = generate_random_samples(attributes, num_samples=PERSONA_POOL_SIZE)
@@ -314,36 +426,90 @@ def run_evaluation(uuid, data, model_name, jwt=None):
                         supabase.table("samples").update({"persona": persona_pool}).eq("id", sample_id).execute()
                     except Exception:
                         pass
-        except Exception as e:
+        else:
             attributes = data.get('sample')['attributes']
             persona_pool = generate_random_samples(attributes, num_samples=PERSONA_POOL_SIZE)
             if isinstance(persona_pool, list):
                 persona_pool = sorted(persona_pool, key=lambda x: x.get('number', 0))
             random_samples = persona_pool[:num_samples]
+            if supabase and persona_pool:
+                try:
+                    supabase.table("samples").update({"persona": persona_pool}).eq("id", sample_id).execute()
+                except Exception:
+                    pass
+    except Exception as e:
+        attributes = data.get('sample')['attributes']
+        persona_pool = generate_random_samples(attributes, num_samples=PERSONA_POOL_SIZE)
+        if isinstance(persona_pool, list):
+            persona_pool = sorted(persona_pool, key=lambda x: x.get('number', 0))
+        random_samples = persona_pool[:num_samples]
+
+    return random_samples
+
+
+def run_evaluation(uuid, data, model_name, supabase):
+    """
+    Run one simulation end to end with the given Supabase client and record its
+    outcome on the experiment. Failures are marked on the experiment and then
+    re-raised so the job queue records them too.
+    """
+    try:
+
+        # Number of sample rows (personas) to use for this run: from request, clamped to 10-50
+        num_samples = sample_count(data)
+
+        checkpoints = get_checkpoint_store()
+        # A run interrupted earlier resumes with the personas it started with
+        random_samples = checkpoints.personas(uuid)
+        if random_samples is None:
+            random_samples = select_personas(supabase, data, num_samples)
+            checkpoints.start(uuid, random_samples)
+        checkpoint = checkpoints.load(uuid)
+        if len(checkpoint):
+            logger.info(
+                f"Experiment {uuid}: resuming with {len(checkpoint.generated)} generated "
+                f"and {len(checkpoint.evaluated)} evaluated steps from checkpoints"
+            )
 
         # Update progress to 10% - Setup complete, starting baseline
-        supabase.table("experiments").update({"progress": 10}).eq("experiment_id", uuid).execute()
+        update_experiment(supabase, uuid, {"progress": 10})
 
-        # Generate baseline prompt and get token usage (progress 10-30% via callback)
         sample = data.get('sample')
         # Add the generated personas to the sample object
         sample['persona'] = random_samples
 
-        on_baseline_row = create_progress_updater(
-            uuid, supabase, 10, 30, num_samples,
-            get_client=get_supabase_client, jwt=jwt, no_throttle=True
-        )
-        df, prompt_tokens = baseline_prompt(data, model_name, sample, progress_callback=on_baseline_row)
-
-        # Evaluate responses and get token usage (progress 30-80% via per-column callback, write every call)
+        # Generate and evaluate in one streaming pass: each step is scored as soon as
+        # it is generated (progress 10-80%, one unit per generated and per scored step)
         steps = data.get('steps', [])
-        num_cols_per_row = max(1, df.shape[1] - 1)
-        total_eval_units = df.shape[0] * num_cols_per_row
-        on_eval_unit = create_progress_updater(
-            uuid, supabase, 30, 80, total_eval_units,
-            get_client=get_supabase_client, jwt=jwt, no_throttle=True
+        # "step" (default) scores each step separately; "row" scores a persona's steps in one call.
+        # data['generation_mode'] = "conversation" switches generation to one message history per persona.
+        evaluation_mode = data.get('evaluation_mode', EVALUATION_MODE_STEP)
+        total_units = 2 * num_samples * max(1, len(steps))
+        on_pipeline_unit = create_progress_updater(
+            uuid, supabase, 10, 80, total_units,
+            no_throttle=True
         )
-        fn, eval_tokens = evaluate(df, model_name, steps, progress_callback=on_eval_unit)
+        # Live spend of this run, capped by the user's credits, the request's
+        # max_cost and SIMULATION_MAX_COST; once reached, no further LLM calls are made
+        budget = CostBudget(run_cost_ceiling(supabase, data), price=compute_cost_for_model)
+        try:
+            with track_usage(budget):
+                if LLM_ENGINE == "asyncio":
+                    df, prompt_tokens, results_df_gemini, eval_tokens = run_async(stream_baseline_and_evaluate_async(
+                        data, model_name, sample, progress_callback=on_pipeline_unit, evaluation_mode=evaluation_mode,
+                        checkpoint=checkpoint,
+                    ))
+                else:
+                    df, prompt_tokens, results_df_gemini, eval_tokens = stream_baseline_and_evaluate(
+                        data, model_name, sample, progress_callback=on_pipeline_unit, evaluation_mode=evaluation_mode,
+                        checkpoint=checkpoint,
+                    )
+        finally:
+            # Phase boundary: write the final pipeline progress and stop the flusher
+            on_pipeline_unit.close()
+        # Report is built in memory and uploaded from the buffer (no temp file)
+        fn = report_filename()
+        report_bytes = dataframe_to_excel_bytes(df, results_df_gemini, steps)
 
         df = df.replace('\n', '', regex=True)
         # sim_matrix = create_sim_matrix(df)
@@ -354,13 +520,18 @@ def run_evaluation(uuid, data, model_name, jwt=None):
         total_prompt_input_token = sum(token_dict.get('prompt_tokens', 0) for token_dict in (prompt_tokens or []))
         total_prompt_output_token = sum(token_dict.get('response_tokens', 0) for token_dict in (prompt_tokens or []))
         total_prompt_total_token = sum(token_dict.get('total_tokens', 0) for token_dict in (prompt_tokens or []))
+        if data.get('generation_mode') == GENERATION_MODE_CONVERSATION:
+            saved = sum(token_dict.get('saved_prompt_tokens', 0) for token_dict in (prompt_tokens or []))
+            cached = sum(token_dict.get('cached_prompt_tokens', 0) for token_dict in (prompt_tokens or []))
+            logger.info(f"Experiment {uuid}: conversation mode saved ~{saved} prompt tokens ({cached} served from context cache)")
 
         # Calculate total token usage for evaluation
         total_eval_input_token = sum(token_dict.get('gemini_prompt_tokens', 0) for token_dict in (eval_tokens or []))
         total_eval_output_token = sum(token_dict.get('gemini_response_tokens', 0) for token_dict in (eval_tokens or []))
         total_eval_total_token = sum(token_dict.get('gemini_total_tokens', 0) for token_dict in (eval_tokens or []))
 
-        # Store token usage and cost in Supabase
+        # Store token usage and cost in Supabase (upsert: a resumed run may have written it already).
+        # Usage restored from checkpoints is included, so this is the experiment's full cost.
         total_tokens = total_prompt_total_token + total_eval_total_token
         prompt_cost, eval_cost = compute_prompt_and_eval_cost(
             total_prompt_input_token,
@@ -370,7 +541,7 @@ def run_evaluation(uuid, data, model_name, jwt=None):
             model_name=model_name,
         )
         total_cost = prompt_cost + eval_cost
-        supabase.table("tokens").insert({
+        supabase.table("tokens").upsert({
             "id": uuid,
             "experiment_id": uuid,
             "operation": "simulation",
@@ -389,49 +560,147 @@ def run_evaluation(uuid, data, model_name, jwt=None):
 
         # Upload evaluation results to Supabase storage
         bucket_name = "llm-responses"
-        with open(fn, 'rb') as f:
-            upload_response = supabase.storage.from_(bucket_name).upload(
-                path=f'llm/{fn}',
-                file=f,
-            )
-        os.remove(fn)
+        upload_response = supabase.storage.from_(bucket_name).upload(
+            path=f'llm/{fn}',
+            file=report_bytes,
+            file_options={"content-type": XLSX_CONTENT_TYPE},
+        )
         public_url = supabase.storage.from_(bucket_name).get_public_url(
             f'llm/{fn}')
+
+        # Columnar copy of the same results for analysis tooling. Optional:
+        # a missing pyarrow or an older experiments schema only skips it.
+        try:
+            parquet_fn = fn.rsplit('.', 1)[0] + '.parquet'
+            supabase.storage.from_(bucket_name).upload(
+                path=f'llm/{parquet_fn}',
+                file=dataframe_to_parquet_bytes(df, results_df_gemini, steps),
+                file_options={"content-type": PARQUET_CONTENT_TYPE},
+            )
+            update_experiment(supabase, uuid, {
+                "results_parquet_url": supabase.storage.from_(bucket_name).get_public_url(f'llm/{parquet_fn}'),
+            })
+        except Exception as e:
+            logger.warning(f"Skipping Parquet results for experiment {uuid}: {e}")
         # sim_matrix['public_url'] = public_url
 
         # Update progress to 90% - File uploaded
-        supabase.table("experiments").update({
+        update_experiment(supabase, uuid, {
             "progress": 90,
-        }).eq("experiment_id", uuid).execute()
+        })
 
-        response = supabase.table("experiments").update({
+        response = update_experiment(supabase, uuid, {
             "url": public_url,
-        }).eq("experiment_id", uuid).execute()
+        })
+
+        if budget.exceeded:
+            # Partial results are uploaded; checkpoints are kept so the run can be
+            # resumed (POST /api/evaluate/resume) once the ceiling is raised
+            logger.warning(f"Experiment {uuid} stopped at its cost ceiling: {budget.stats()}")
+            update_experiment(supabase, uuid, {
+                "progress": 100,
+                "status": "Stopped"
+            })
+            return
 
         # Update progress to 100% - Completed
-        supabase.table("experiments").update({
+        update_experiment(supabase, uuid, {
             "progress": 100,
             "status": "Completed"
-        }).eq("experiment_id", uuid).execute()
+        })
+        checkpoints.clear(uuid)
+        # Output projections for /api/estimate
+        record_run_usage(evaluation_mode, prompt_tokens or [], eval_tokens or [], len(steps))
     except Exception as e:
+        # Checkpoints are kept so POST /api/evaluate/resume only redoes missing steps
         logger.exception("Evaluation failed")
-        # Create a new Supabase client for error handling
-        supabase = get_supabase_client(jwt)
-        supabase.table("experiments").update({
-            "status": "Failed",
-        }).eq("experiment_id", uuid).execute()
-        # Clean up temporary file
         try:
-            if fn and os.path.exists(fn):
-                os.remove(fn)
-        except:
-            pass
+            update_experiment(supabase, uuid, {
+                "status": "Failed",
+            })
+        except Exception:
+            logger.exception(f"Could not mark experiment {uuid} as failed")
+        raise
+
+
+# Runs a user with a credit balance may have queued or running at once. Each run's
+# ceiling is the whole balance, so concurrent runs could otherwise each spend it.
+SIMULATION_MAX_PER_USER = int(os.environ.get("SIMULATION_MAX_PER_USER", 1))
+
+
+def user_at_run_limit(data, credits):
+    """True when a user with a credit balance already has SIMULATION_MAX_PER_USER active runs."""
+    if credits is None or not data.get('user_id'):
+        return False
+    return job_queue.group_count(data['user_id']) >= SIMULATION_MAX_PER_USER
+
+
+def user_run_limit_response():
+    return {
+        "status": "error",
+        "message": "You already have a simulation running. Please wait for it to finish before starting another.",
+    }, 409
+
+
+def enqueue_simulation(uuid, data, model_name, credits=None):
+    """
+    Queue a simulation run; raises QueueFull, JobAlreadyActive or, for users with
+    a credit balance, GroupLimitReached.
+    """
+    credit_limited = credits is not None and data.get("user_id")
+    # The payload is persisted in plain text, so it carries the user id, never a JWT
+    job_queue.enqueue(
+        uuid,
+        {"uuid": uuid, "user_id": data.get("user_id"), "data": data, "model_name": model_name},
+        group=data.get("user_id"),
+        max_per_group=SIMULATION_MAX_PER_USER if credit_limited else None,
+    )
+
+
+def run_simulation_job(job_id, payload):
+    """Job queue handler: run one queued simulation with the service client."""
+    run_evaluation(payload["uuid"], payload["data"], payload["model_name"], get_service_client())
+
+
+def fail_abandoned_simulation(job_id, payload):
+    """
+    Job queue callback for a job whose lease expired on its final attempt (its
+    worker died each time): mark the experiment Failed, as run_evaluation does.
+    """
+    logger.error(f"Experiment {payload.get('uuid', job_id)} abandoned after its final attempt")
+    update_experiment(get_service_client(), payload.get("uuid", job_id), {"status": "Failed"})
+
+
+# Simulation queue. SIMULATION_WORKERS bounds how many simulations run at once
+# in this process; SIMULATION_QUEUE_LIMIT bounds queued + running jobs across
+# every process sharing JOBS_DB_PATH. The default file in the temp directory is
+# instance-local (in memory on Cloud Run): queued jobs survive worker restarts
+# but not the instance.
+if not service_key:
+    # Any worker on the instance may pick up a job, including ones queued by a
+    # process that has since exited, so jobs cannot rely on the caller's JWT
+    raise RuntimeError("SUPABASE_SERVICE_ROLE_KEY is required: queued simulations run with the service client")
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH")
+if not JOBS_DB_PATH:
+    logger.warning("JOBS_DB_PATH is not set; the simulation queue is instance-local and lost with the instance")
+job_queue = JobQueue(
+    JOBS_DB_PATH or os.path.join(tempfile.gettempdir(), "simulation_jobs.sqlite3"),
+    run_simulation_job,
+    max_workers=int(os.environ.get("SIMULATION_WORKERS", 2)),
+    max_pending=int(os.environ.get("SIMULATION_QUEUE_LIMIT", 20)),
+    retention_seconds=float(os.environ.get("JOBS_RETENTION_SECONDS", 7 * 24 * 3600)),
+    on_abandoned=fail_abandoned_simulation,
+)
+job_queue.start()
+
 
 class Evaluation(Resource):
     """
-    Resource for handling LLM evaluation requests with progress tracking (now async via threading).
+    Resource for handling LLM evaluation requests with progress tracking.
+    Simulations are persisted to the job queue and executed by its worker pool.
     """
     def post(self):
+        jwt = None
         try:
             auth_header = request.headers.get('Authorization')
             if not auth_header or not auth_header.startswith("Bearer "):
@@ -443,9 +712,21 @@ class Evaluation(Resource):
             data = request.get_json()['data']
             model_name = resolve_model_name(data.get('model', 'gemini-2.0-flash'))
 
-            supabase: Client = create_client(url, key)
-            if jwt:
-                supabase.auth.set_session(jwt, "")
+            # Apply backpressure before touching the experiments table
+            existing_job = job_queue.get_job(uuid)
+            if existing_job and existing_job["state"] in ACTIVE_STATES:
+                return {"status": "error", "message": "This simulation is already running."}, 409
+            if not job_queue.has_capacity():
+                return {"status": "error", "message": "Too many simulations are running. Please try again shortly."}, 503
+
+            supabase: Client = get_supabase_client(jwt)
+            # A $0 ceiling would refuse every LLM call; reject it before anything is queued
+            credits = get_user_credits(supabase, data.get('user_id'))
+            rejected = no_budget_response(run_cost_ceiling(supabase, data, credits))
+            if rejected:
+                return rejected
+            if user_at_run_limit(data, credits):
+                return user_run_limit_response()
             # Create progress tracking entry.
             # If this ID already exists (e.g. a draft being run), delete the
             # old row first so the INSERT generates a fresh Realtime event that
@@ -471,15 +752,131 @@ class Evaluation(Resource):
             response = supabase.table("experiments").insert(
                 experiment_payload
             ).execute()
-            # Start background thread for evaluation, pass model_name and jwt
-            thread = threading.Thread(target=run_evaluation, args=(uuid, data, model_name, jwt))
-            thread.start()
+            experiment_states.publish(uuid, {"progress": 0, "status": "Started", "url": None})
+            # A new run never reuses checkpoints of an earlier run with this id
+            get_checkpoint_store().clear(uuid)
+            # Queue the simulation for the worker pool
+            try:
+                enqueue_simulation(uuid, data, model_name, credits)
+            except GroupLimitReached:
+                update_experiment(supabase, uuid, {"status": "Failed"})
+                return user_run_limit_response()
+            except (QueueFull, JobAlreadyActive) as e:
+                update_experiment(supabase, uuid, {"status": "Failed"})
+                return {"status": "error", "message": str(e)}, 503
             # Return immediately with task_id
             return jsonify({"status": "started", "task_id": task_id})
         except Exception as e:
+            drop_client_on_auth_error(jwt, e)
             return jsonify({"status": "error", "message": str(e)})
 
 
+class EvaluationResume(Resource):
+    """
+    Resource for resuming a failed simulation (or one stopped at its cost
+    ceiling) from its checkpoints.
+    Only the (row, step) units that were not generated or scored before the
+    failure call the LLM again.
+    """
+    def post(self):
+        jwt = None
+        try:
+            auth_header = request.headers.get('Authorization')
+            if not auth_header or not auth_header.startswith("Bearer "):
+                jwt = None
+            else:
+                jwt = auth_header.split("Bearer ")[1]
+            uuid = (request.get_json() or {}).get('id')
+            if not uuid:
+                return {"status": "error", "message": "Missing id"}, 400
+
+            existing_job = job_queue.get_job(uuid)
+            if existing_job and existing_job["state"] in ACTIVE_STATES:
+                return {"status": "error", "message": "This simulation is already running."}, 409
+            if not job_queue.has_capacity():
+                return {"status": "error", "message": "Too many simulations are running. Please try again shortly."}, 503
+
+            # The caller's own read (RLS) decides whether they may resume it
+            supabase: Client = get_supabase_client(jwt)
+            response = supabase.table("experiments").select(
+                "status, experiment_data, model").eq("experiment_id", uuid).execute()
+            if not response.data:
+                return {"status": "not_found", "message": "Experiment not found"}, 404
+            experiment = response.data[0]
+            if (experiment.get('status') or '').lower() not in ('failed', 'stopped'):
+                return {"status": "error", "message": "Only failed or stopped simulations can be resumed."}, 409
+            if get_checkpoint_store().personas(uuid) is None:
+                return {"status": "error", "message": "No checkpoint found for this simulation; start a new run."}, 409
+
+            data = experiment['experiment_data']
+            credits = get_user_credits(supabase, data.get('user_id'))
+            rejected = no_budget_response(run_cost_ceiling(supabase, data, credits))
+            if rejected:
+                return rejected
+            if user_at_run_limit(data, credits):
+                return user_run_limit_response()
+            model_name = resolve_model_name(experiment.get('model') or data.get('model', 'gemini-2.0-flash'))
+            update_experiment(supabase, uuid, {"progress": 0, "status": "Started"})
+            try:
+                enqueue_simulation(uuid, data, model_name, credits)
+            except GroupLimitReached:
+                # Still resumable later
+                update_experiment(supabase, uuid, {"status": experiment['status']})
+                return user_run_limit_response()
+            except (QueueFull, JobAlreadyActive) as e:
+                update_experiment(supabase, uuid, {"status": "Failed"})
+                return {"status": "error", "message": str(e)}, 503
+            return jsonify({"status": "resumed", "task_id": uuid})
+        except Exception as e:
+            drop_client_on_auth_error(jwt, e)
+            logger.error(f"Error in EvaluationResume endpoint: {str(e)}")
+            return {"status": "error", "message": str(e)}, 500
+
+
+class Estimate(Resource):
+    """
+    Resource for estimating a simulation's LLM calls, tokens, cost and duration
+    before it is started. Takes the /api/evaluate payload and never calls a model.
+    """
+    def post(self):
+        try:
+            data = (request.get_json() or {}).get('data')
+            if not isinstance(data, dict) or not isinstance(data.get('steps'), list):
+                return {"status": "error", "message": "Missing experiment data"}, 400
+            model_name = resolve_model_name(data.get('model', 'gemini-2.0-flash'))
+
+            sample = data.get('sample') or {}
+            personas = sample.get('persona')
+            if not isinstance(personas, list) or not personas:
+                # run_evaluation draws its personas from these attributes; any draw prompts alike
+                personas = generate_random_samples(sample.get('attributes') or [], num_samples=sample_count(data))
+
+            try:
+                estimate = estimate_simulation(
+                    data, personas, model_name, data.get('evaluation_mode', EVALUATION_MODE_STEP)
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                return {"status": "error", "message": f"Invalid experiment data: {e}"}, 400
+
+            generation, evaluation = estimate['generation'], estimate['evaluation']
+            prompt_cost, eval_cost = compute_prompt_and_eval_cost(
+                generation['input_tokens'],
+                generation['output_tokens'],
+                evaluation['input_tokens'],
+                evaluation['output_tokens'],
+                model_name=model_name,
+            )
+            estimate['cost'] = {
+                "prompt_cost": prompt_cost,
+                "eval_cost": eval_cost,
+                "total_cost": round(prompt_cost + eval_cost, 6),
+            }
+            return jsonify({"status": "success", "model": model_name, "estimate": estimate})
+        except Exception as e:
+            logger.error(f"Error in Estimate endpoint: {str(e)}")
+            return {"status": "error", "message": str(e)}, 500
+
+
 class Progress(Resource):
     """
     Resource for checking evaluation progress.
@@ -494,8 +891,10 @@ class Progress(Resource):
         - user_id: The user identifier
         
         Returns:
-            JSON response containing progress information
+            JSON response containing progress information ({progress, status, url}),
+            or 304 Not Modified when If-None-Match matches its ETag
         """
+        jwt = None
         try:
             auth_header = request.headers.get('Authorization')
             if not auth_header or not auth_header.startswith("Bearer "):
@@ -508,34 +907,243 @@ class Progress(Resource):
             if not task_id or not user_id:
                 return {"status": "error", "message": "Missing task_id or user_id"}, 400
             
-            # Create a new Supabase client for this request
-            supabase = get_supabase_client(jwt)
-            response = supabase.table("experiments").select(
-                "*").eq("experiment_id", task_id).execute()
-            
-            if response.data:
+            viewer = ProgressReadCache.viewer_key(jwt)
+            progress_data = progress_read_cache.get(task_id, viewer)
+            if progress_data is None:
+                # Only the columns the client needs, not the experiment_data blob
+                supabase = get_supabase_client(jwt)
+                response = supabase.table("experiments").select(
+                    "progress, status, url").eq("experiment_id", task_id).execute()
+                if not response.data:
+                    return {"status": "not_found", "message": "Progress not found"}, 404
                 progress_data = response.data[0]
-                
-                # Check if experiment is already completed - return early to avoid unnecessary processing
-                status = progress_data.get('status', '').lower()
-                progress = progress_data.get('progress', 0)
-                
-                # If completed or failed, log a warning if still being polled (this shouldn't happen)
-                if status in ['completed', 'failed'] or (isinstance(progress, (int, float)) and progress >= 100):
-                    logger.debug(f"Progress check for completed experiment {task_id} (status: {status}, progress: {progress})")
-                
-                return jsonify({
-                    "status": "success",
-                    "progress": progress_data
-                })
-            else:
-                return {"status": "not_found", "message": "Progress not found"}, 404
+                progress_read_cache.put(task_id, viewer, progress_data)
+
+            # Check if experiment is already completed - return early to avoid unnecessary processing
+            status = (progress_data.get('status') or '').lower()
+            progress = progress_data.get('progress', 0)
+
+            # If completed or failed, log a warning if still being polled (this shouldn't happen)
+            if status in ['completed', 'failed', 'stopped'] or (isinstance(progress, (int, float)) and progress >= 100):
+                logger.debug(f"Progress check for completed experiment {task_id} (status: {status}, progress: {progress})")
+
+            resp = jsonify({
+                "status": "success",
+                "progress": progress_data
+            })
+            # Unchanged polls get an empty 304
+            resp.set_etag(hashlib.sha1(json.dumps(progress_data, sort_keys=True).encode("utf-8")).hexdigest())
+            resp.headers["Cache-Control"] = "private, no-cache"
+            return resp.make_conditional(request)
 
         except Exception as e:
+            drop_client_on_auth_error(jwt, e)
             logger.error(f"Error in Progress endpoint: {str(e)}")
             return {"status": "error", "message": str(e)}, 500
 
 
+# Seconds between SSE keep-alive comments, and between database reads for
+# experiments running in another process (whose updates this process never sees)
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+SSE_REMOTE_POLL_SECONDS = float(os.environ.get("SSE_REMOTE_POLL_SECONDS", 5))
+# Each open stream holds one gunicorn thread (16 per worker, see Dockerfile), so
+# only some of them may stream and every stream is closed after a while
+SSE_MAX_STREAMS = int(os.environ.get("SSE_MAX_STREAMS", 8))
+SSE_MAX_STREAM_SECONDS = float(os.environ.get("SSE_MAX_STREAM_SECONDS", 300))
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS) if SSE_MAX_STREAMS > 0 else None
+
+# Stream tokens are signed with STREAM_TOKEN_SECRET, or a key derived from the
+# service-role key so that every instance accepts every other instance's tokens
+stream_tokens = StreamTokenSigner(
+    os.environ.get("STREAM_TOKEN_SECRET")
+    or (hashlib.sha256(f"progress-stream:{service_key}".encode("utf-8")).hexdigest() if service_key else None),
+    ttl_seconds=float(os.environ.get("STREAM_TOKEN_TTL_SECONDS", 60)),
+)
+
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class ProgressStreamToken(Resource):
+    """
+    Resource issuing short-lived tokens for opening a progress stream.
+    """
+
+    def post(self):
+        """
+        Handle POST requests for a progress stream token.
+
+        Request body:
+        - task_id: The task identifier
+        - user_id: The user identifier
+
+        The caller's JWT (Authorization header) must be able to read the
+        experiment; the returned token then stands in for it on
+        /api/progress/stream, which EventSource opens without headers.
+
+        Returns:
+            JSON response containing the token and its lifetime in seconds
+        """
+        jwt = None
+        try:
+            auth_header = request.headers.get('Authorization')
+            if not auth_header or not auth_header.startswith("Bearer "):
+                return {"status": "error", "message": "Missing Authorization header"}, 401
+            jwt = auth_header.split("Bearer ")[1]
+            data = request.get_json(silent=True) or {}
+            task_id = data.get('task_id')
+            user_id = data.get('user_id')
+            if not task_id or not user_id:
+                return {"status": "error", "message": "Missing task_id or user_id"}, 400
+
+            # RLS decides whether this user may watch the experiment
+            response = get_supabase_client(jwt).table("experiments").select(
+                "experiment_id").eq("experiment_id", task_id).execute()
+            if not response.data:
+                return {"status": "not_found", "message": "Progress not found"}, 404
+
+            return {
+                "status": "success",
+                "token": stream_tokens.issue(task_id, user_id),
+                "expires_in": stream_tokens.ttl_seconds,
+            }
+        except Exception as e:
+            drop_client_on_auth_error(jwt, e)
+            logger.error(f"Error in ProgressStreamToken endpoint: {str(e)}")
+            return {"status": "error", "message": str(e)}, 500
+
+
+class ProgressStream(Resource):
+    """
+    Resource streaming experiment progress as Server-Sent Events.
+    """
+
+    def get(self):
+        """
+        Handle GET requests for a progress event stream.
+
+        Query parameters:
+        - task_id: The task identifier
+        - user_id: The user identifier
+        - token: Stream token from POST /api/progress/stream/token, for clients
+          (EventSource) that cannot send an Authorization header
+
+        The experiments row is read once (with the caller's JWT, so RLS still
+        applies, or with the service client once the stream token is verified);
+        after that, updates published by run_evaluation in this process are
+        pushed as they happen. Experiments running in another process are
+        re-read every SSE_REMOTE_POLL_SECONDS.
+
+        At most SSE_MAX_STREAMS streams are open at once; beyond that the
+        request gets a 503 and the client should poll /api/progress instead.
+        A stream that outlives SSE_MAX_STREAM_SECONDS ends with a "reconnect"
+        event, after which the client fetches a new token and reconnects.
+
+        Returns:
+            text/event-stream of "progress" events ({progress, status, url}),
+            ending with a "done" event once the experiment completes or fails
+        """
+        auth_header = request.headers.get('Authorization')
+        task_id = request.args.get('task_id')
+        user_id = request.args.get('user_id')
+
+        if not task_id or not user_id:
+            return {"status": "error", "message": "Missing task_id or user_id"}, 400
+
+        jwt = None
+        if auth_header and auth_header.startswith("Bearer "):
+            jwt = auth_header.split("Bearer ")[1]
+            get_client = lambda: get_supabase_client(jwt)
+        else:
+            claims = stream_tokens.verify(request.args.get('token'))
+            if claims is None or claims["task_id"] != task_id or claims["user_id"] != user_id:
+                return {"status": "error", "message": "Invalid or expired stream token"}, 401
+            get_client = get_service_client
+            if get_client() is None:
+                return {"status": "error", "message": "Progress streams are unavailable; poll /api/progress"}, 503
+
+        def read_state():
+            try:
+                response = get_client().table("experiments").select(
+                    "progress, status, url").eq("experiment_id", task_id).execute()
+            except Exception as e:
+                drop_client_on_auth_error(jwt, e)
+                raise
+            return response.data[0] if response.data else None
+
+        if _stream_slots is None or not _stream_slots.acquire(blocking=False):
+            return (
+                {"status": "error", "message": "Too many open progress streams; poll /api/progress"},
+                503,
+                {"Retry-After": str(int(SSE_HEARTBEAT_SECONDS))},
+            )
+        released = threading.Event()
+
+        def release_slot():
+            if not released.is_set():
+                released.set()
+                _stream_slots.release()
+
+        try:
+            initial = read_state()
+        except Exception as e:
+            release_slot()
+            logger.error(f"Error in ProgressStream endpoint: {str(e)}")
+            return {"status": "error", "message": str(e)}, 500
+        if initial is None:
+            release_slot()
+            return {"status": "not_found", "message": "Progress not found"}, 404
+
+        experiment_states.seed(task_id, initial)
+
+        def events():
+            try:
+                deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+                state, version = experiment_states.get(task_id)
+                yield _sse_event("progress", state)
+                last_sent = state
+                last_db_read = time.monotonic()
+                while not is_terminal(state):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        yield _sse_event("reconnect", state)
+                        return
+                    # Only jobs owned by this process publish to the registry
+                    local = job_queue.is_running_here(task_id)
+                    timeout = SSE_HEARTBEAT_SECONDS if local else min(SSE_HEARTBEAT_SECONDS, SSE_REMOTE_POLL_SECONDS)
+                    state, version = experiment_states.wait(task_id, version, min(timeout, remaining))
+                    if not local and time.monotonic() - last_db_read >= SSE_REMOTE_POLL_SECONDS:
+                        last_db_read = time.monotonic()
+                        try:
+                            fresh = read_state()
+                        except Exception:
+                            fresh = None
+                        if fresh is not None:
+                            experiment_states.publish(task_id, fresh)
+                            state, version = experiment_states.get(task_id)
+                    if state is None:
+                        # Registry entry was pruned; nothing more to report
+                        break
+                    if state != last_sent:
+                        yield _sse_event("progress", state)
+                        last_sent = state
+                    else:
+                        yield ": keep-alive\n\n"
+                yield _sse_event("done", state)
+            finally:
+                release_slot()
+
+        response = Response(
+            stream_with_context(events()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # Also covers clients that disconnect before the generator first runs
+        response.call_on_close(release_slot)
+        return response
+
+
 class GenerateSteps(Resource):
     """
     Resource for generating simulation steps from a user prompt using Gemini.
@@ -578,11 +1186,10 @@ class GenerateSteps(Resource):
             # Call LLM via LangChain
             logger.info(f"[{request_id}] Calling LLM ({DEFAULT_MODEL}) via LangChain")
             try:
-                llm = get_llm(DEFAULT_MODEL, temperature=0.7)
-                lc_response = llm.invoke([
+                lc_response = invoke_chat(DEFAULT_MODEL, [
                     SystemMessage(content=system_prompt),
                     HumanMessage(content=full_prompt),
-                ])
+                ], temperature=0.7, cache_site=CACHE_SITE_GENERATE_STEPS)
                 # content may be a string or a list of parts depending on the provider/version
                 raw_content = lc_response.content
                 if isinstance(raw_content, list):
@@ -595,13 +1202,13 @@ class GenerateSteps(Resource):
                 logger.info(f"[{request_id}] LLM call successful")
 
                 # Track token usage for generate_steps
+                auth_header = request.headers.get("Authorization")
+                jwt = auth_header.split("Bearer ")[1] if auth_header and auth_header.startswith("Bearer ") else None
                 try:
                     usage_meta = lc_response.usage_metadata or {}
                     prompt_count = usage_meta.get("input_tokens", 0) or 0
                     output_count = usage_meta.get("output_tokens", 0) or 0
                     total_count = usage_meta.get("total_tokens", 0) or 0
-                    auth_header = request.headers.get("Authorization")
-                    jwt = auth_header.split("Bearer ")[1] if auth_header and auth_header.startswith("Bearer ") else None
                     supabase_client = get_supabase_client(jwt)
                     user_id = data.get("user_id")
                     if not user_id and jwt:
@@ -630,6 +1237,7 @@ class GenerateSteps(Resource):
                             "total_cost": gen_prompt_cost,
                         }).execute()
                 except Exception as token_err:
+                    drop_client_on_auth_error(jwt, token_err)
                     logger.warning(f"[{request_id}] Failed to store token usage: {token_err}")
             except Exception as api_error:
                 error_msg = str(api_error)
@@ -856,12 +1464,70 @@ class CheckoutVerify(Resource):
             return {"status": "error", "message": str(e)}, 502
 
 
+# /api/metrics exposes queue depths and limits across all users, so it takes an
+# admin token (METRICS_TOKEN, or the service-role key when that is unset)
+metrics_token = os.environ.get("METRICS_TOKEN") or service_key
+
+
+def metrics_authorized(auth_header):
+    """True when auth_header is "Bearer <metrics token>"."""
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(auth_header[len("Bearer "):].encode("utf-8"), metrics_token.encode("utf-8"))
+
+
+class Metrics(Resource):
+    """
+    Resource exposing in-process load metrics used to size deployments.
+    """
+
+    def get(self):
+        """
+        Handle GET requests for runtime metrics.
+
+        Requires the metrics token as a bearer token in the Authorization header.
+
+        Returns:
+            JSON response with per-model LLM rate limiter stats, LLM client
+            cache stats, LLM retry counters per error class, adaptive
+            concurrency limits, LLM response cache stats, Supabase client pool
+            stats, progress read cache stats, job queue stats, checkpoint
+            counts, the output token projections used by /api/estimate and
+            the pricing index state
+        """
+        if not metrics_authorized(request.headers.get('Authorization')):
+            return {"status": "error", "message": "Unauthorized"}, 401
+        try:
+            return jsonify({
+                "status": "success",
+                "rate_limiter": get_rate_limiter_stats(),
+                "llm_clients": get_llm_cache_stats(),
+                "llm_retries": get_retry_stats(),
+                "llm_concurrency": get_concurrency_stats(),
+                "response_cache": get_response_cache_stats(),
+                "supabase_clients": supabase_pool.stats(),
+                "progress_cache": progress_read_cache.stats(),
+                "jobs": job_queue.stats(),
+                "checkpoints": get_checkpoint_store().stats(),
+                "estimates": get_estimate_stats(),
+                "pricing": get_pricing_stats(),
+            })
+        except Exception as e:
+            logger.error(f"Error in Metrics endpoint: {str(e)}")
+            return {"status": "error", "message": str(e)}, 500
+
+
 # Register the resources with the API
 api.add_resource(Evaluation, "/evaluate")
+api.add_resource(EvaluationResume, "/evaluate/resume")
+api.add_resource(Estimate, "/estimate")
 api.add_resource(Progress, "/progress")
+api.add_resource(ProgressStream, "/progress/stream")
+api.add_resource(ProgressStreamToken, "/progress/stream/token")
 api.add_resource(GenerateSteps, "/generate-steps")
 api.add_resource(Checkout, "/checkout")
 api.add_resource(CheckoutVerify, "/checkout/verify")
+api.add_resource(Metrics, "/metrics")
 
 # Register the API blueprint with the Flask application
 app.register_blueprint(api_bp, url_prefix="/api")
@@ -0,0 +1,94 @@
+"""
+Benchmark: full-precision vs. int8 dynamically quantized BERT for response similarity.
+
+Loads both variants of the embedding model, embeds the same synthetic responses
+with each, and reports load time, weight size, throughput, and how closely the
+int8 embeddings and the similarity matrices built from them (as in
+create_sim_matrix) track the full-precision ones. Runs on CPU; the model is
+downloaded on first use. The embedding cache is bypassed, so every text is
+embedded by the model being measured.
+
+Usage (from backend/):
+    python -m benchmarks.embedding_quantization [texts]
+"""
+
+import io
+import random
+import sys
+import time
+
+import numpy as np
+
+from utils.cosine_sim import (
+    EMBEDDING_MODEL_NAME,
+    get_bert_embeddings_batch,
+    get_model,
+    get_tokenizer,
+    preprocess_text,
+    similarity_matrices,
+)
+
+_WORDS = (
+    "the customer wants a refund because the order arrived late and damaged "
+    "please explain our return policy clearly and offer a replacement or store credit "
+    "thank you for your patience we apologise for the inconvenience caused by the delay"
+).split()
+
+
+def _sample_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 120))) for _ in range(count)]
+
+
+def _weights_mb(model):
+    import torch
+
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1e6
+
+
+def _run(quantization, texts):
+    start = time.perf_counter()
+    model = get_model(quantization)
+    load_s = time.perf_counter() - start
+    get_bert_embeddings_batch(texts[:8], quantization=quantization, use_cache=False)  # warm up
+    start = time.perf_counter()
+    embeddings = get_bert_embeddings_batch(texts, quantization=quantization, use_cache=False)
+    embed_s = time.perf_counter() - start
+    return embeddings.astype(np.float64), load_s, embed_s, _weights_mb(model)
+
+
+def main(count=200):
+    texts = _sample_texts(count)
+    get_tokenizer()
+    for text in texts:
+        preprocess_text(text)  # keep tokenization out of the timings
+
+    fp32, fp32_load, fp32_embed, fp32_mb = _run("", texts)
+    int8, int8_load, int8_embed, int8_mb = _run("int8", texts)
+
+    # Per-text agreement between the two variants
+    norms = np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1)
+    agreement = (fp32 * int8).sum(axis=1) / np.where(norms == 0, 1.0, norms)
+
+    # Similarity outputs as create_sim_matrix computes them (rows x 10 steps)
+    steps = 10
+    rows = count // steps
+    fp32_mean, fp32_stepwise = similarity_matrices(fp32[:rows * steps].reshape(rows, steps, -1))
+    int8_mean, int8_stepwise = similarity_matrices(int8[:rows * steps].reshape(rows, steps, -1))
+
+    print(f"model:                  {EMBEDDING_MODEL_NAME}")
+    print(f"texts:                  {count}")
+    print(f"load fp32 / int8:       {fp32_load:.2f} s / {int8_load:.2f} s")
+    print(f"weights fp32 / int8:    {fp32_mb:.0f} MB / {int8_mb:.0f} MB")
+    print(f"throughput fp32:        {count / fp32_embed:.1f} texts/s")
+    print(f"throughput int8:        {count / int8_embed:.1f} texts/s")
+    print(f"speedup:                {fp32_embed / int8_embed:.2f}x")
+    print(f"fp32~int8 cosine:       mean {agreement.mean():.4f}, min {agreement.min():.4f}")
+    print(f"mean matrix max diff:   {np.abs(fp32_mean - int8_mean).max():.4f}")
+    print(f"stepwise max diff:      {np.abs(np.array(fp32_stepwise) - np.array(int8_stepwise)).max():.4f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
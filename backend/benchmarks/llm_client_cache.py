@@ -0,0 +1,55 @@
+"""
+Benchmark: per-call overhead of building LLM clients vs. reusing cached ones.
+
+Measures only client construction and with_structured_output() — no requests
+are sent, so any non-empty GEMINI_KEY works.
+
+Usage (from backend/):
+    GEMINI_KEY=dummy python -m benchmarks.llm_client_cache [iterations]
+"""
+
+import os
+import sys
+import time
+
+from utils.llm import (
+    EvaluationMetrics,
+    BaseResponse,
+    _build_llm,
+    get_structured_llm,
+    resolve_model_name,
+)
+
+
+def _time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main(iterations=50):
+    os.environ.setdefault("GEMINI_KEY", "dummy")
+    model_name = resolve_model_name("gemini")
+    schemas = [EvaluationMetrics, BaseResponse]
+
+    def uncached(i):
+        # What invoke_structured did before the cache existed
+        _build_llm(model_name, 1.0).with_structured_output(schemas[i % 2], include_raw=True)
+
+    def cached(i):
+        get_structured_llm(model_name, schemas[i % 2], 1.0)
+
+    uncached_ms = _time_per_call(uncached, iterations)
+    cached(0), cached(1)  # warm the cache
+    cached_ms = _time_per_call(cached, iterations)
+
+    print(f"iterations:          {iterations}")
+    print(f"uncached per call:   {uncached_ms:.3f} ms")
+    print(f"cached per call:     {cached_ms:.4f} ms")
+    print(f"speedup:             {uncached_ms / cached_ms:,.0f}x")
+    print(f"saved on 2,000 calls: {(uncached_ms - cached_ms) * 2000 / 1000:.1f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
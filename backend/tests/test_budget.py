@@ -0,0 +1,76 @@
+import pytest
+
+from utils import budget as budget_module
+from utils.budget import CostBudget, budget_limit
+from utils.llm import BudgetExceeded
+
+
+def flat_price(model_name, input_tokens, output_tokens):
+    # $1 per million input tokens, $2 per million output tokens
+    return input_tokens / 1_000_000 + 2 * output_tokens / 1_000_000
+
+
+@pytest.fixture(autouse=True)
+def no_global_ceiling(monkeypatch):
+    monkeypatch.setattr(budget_module, "SIMULATION_MAX_COST", None)
+
+
+def test_budget_limit_without_any_ceiling_is_none():
+    assert budget_limit(None, None) is None
+    assert budget_limit(None, "") is None
+
+
+def test_budget_limit_takes_the_tightest_valid_ceiling(monkeypatch):
+    monkeypatch.setattr(budget_module, "SIMULATION_MAX_COST", "5")
+    assert budget_limit(10, "2.5", "not a number") == 2.5
+    assert budget_limit(None) == 5.0
+
+
+def test_budget_limit_keeps_a_zero_ceiling():
+    assert budget_limit(0, None) == 0.0
+    assert budget_limit(-3) == 0.0
+
+
+def test_unlimited_budget_tracks_spend_but_never_refuses():
+    budget = CostBudget(None, price=flat_price)
+    budget.add("m", {"input_tokens": 10_000_000, "output_tokens": 10_000_000})
+    budget.check()
+    assert not budget.exceeded
+    assert budget.spent == pytest.approx(30.0)
+    assert budget.stats()["refused"] == 0
+
+
+def test_zero_budget_refuses_the_first_request():
+    budget = CostBudget(0.0, price=flat_price)
+    assert budget.exceeded
+    with pytest.raises(BudgetExceeded):
+        budget.check()
+    assert budget.stats()["refused"] == 1
+
+
+def test_budget_refuses_once_spend_reaches_the_ceiling():
+    budget = CostBudget(0.01, price=flat_price)
+    budget.add("m", {"input_tokens": 4_000, "output_tokens": 1_000})  # $0.006
+    budget.check()
+    budget.add("m", {"input_tokens": 4_000, "output_tokens": 1_000})  # $0.012
+    assert budget.exceeded
+    with pytest.raises(BudgetExceeded):
+        budget.check()
+    stats = budget.stats()
+    assert stats["requests"] == 2
+    assert stats["input_tokens"] == 8_000 and stats["output_tokens"] == 2_000
+    assert stats["spent_usd"] == pytest.approx(0.012)
+
+
+def test_rates_are_priced_once_per_model():
+    calls = []
+
+    def counting_price(model_name, input_tokens, output_tokens):
+        calls.append(model_name)
+        return flat_price(model_name, input_tokens, output_tokens)
+
+    budget = CostBudget(None, price=counting_price)
+    for _ in range(3):
+        budget.add("a", {"input_tokens": 1, "output_tokens": 1})
+    budget.add("b", {"input_tokens": 1})
+    assert calls == ["a", "a", "b", "b"]
@@ -0,0 +1,223 @@
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import utils.llm as llm
+from utils.checkpoints import CheckpointStore, SupabaseCheckpointStore
+from utils.evaluate import API_ERROR_SCORE
+from utils.llm import BaseResponse, EvaluationMetrics
+from utils.pipeline import stream_baseline_and_evaluate
+from utils.prompts import GENERATION_ERROR_RESPONSE
+
+
+class FakeTable:
+    """Just enough of the postgrest query builder for SupabaseCheckpointStore."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.action = None
+        self.payload = None
+        self.window = None
+
+    def upsert(self, json, on_conflict="", ignore_duplicates=False, **kwargs):
+        self.action, self.payload, self.ignore = "upsert", json, ignore_duplicates
+        return self
+
+    def select(self, columns):
+        self.action = "select"
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(lambda row: row[column] in values)
+        return self
+
+    def order(self, column, **kwargs):
+        return self
+
+    def range(self, start, end):
+        self.window = (start, end)
+        return self
+
+    def execute(self):
+        key = lambda row: (row["experiment_id"], row["kind"], row["row_idx"], row["step"])
+        if self.action == "upsert":
+            for row in self.payload if isinstance(self.payload, list) else [self.payload]:
+                if not (self.ignore and key(row) in self.rows):
+                    self.rows[key(row)] = dict(row)
+            return self
+        matched = [row for row in sorted(self.rows.values(), key=key) if all(f(row) for f in self.filters)]
+        if self.action == "delete":
+            for row in matched:
+                del self.rows[key(row)]
+            return self
+        if self.window:
+            matched = matched[self.window[0]:self.window[1] + 1]
+        self.data = matched
+        return self
+
+
+class FakeClient:
+    def __init__(self):
+        self.rows = {}
+
+    def table(self, name):
+        return FakeTable(self.rows)
+
+
+@pytest.fixture(params=["sqlite", "supabase"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return CheckpointStore(str(tmp_path / "checkpoints.sqlite3"))
+    client = FakeClient()
+    return SupabaseCheckpointStore(lambda: client, flush_interval=3600)
+
+
+def test_start_keeps_the_first_personas(store):
+    assert store.personas("e") is None
+    store.start("e", [{"age": 30}])
+    store.start("e", [{"age": 99}])
+    assert store.personas("e") == [{"age": 30}]
+
+
+def test_units_round_trip_and_failures_are_not_saved(store):
+    store.start("e", [{}, {}])
+    checkpoint = store.load("e")
+    checkpoint.save_generation(0, "A", "hello", {"prompt_tokens": 3})
+    checkpoint.save_generation(1, "A", GENERATION_ERROR_RESPONSE, {})
+    checkpoint.save_evaluation(0, "A", {"A_Clarity": 4.0}, {"gemini_prompt_tokens": 5})
+    checkpoint.save_evaluation(1, "A", {"A_Clarity": API_ERROR_SCORE}, {})
+    store.save_generation("other", 0, "A", "not mine", {})
+
+    restored = store.load("e")
+    assert restored.generated == {(0, "A"): ("hello", {"prompt_tokens": 3})}
+    assert restored.evaluated == {(0, "A"): ({"A_Clarity": 4.0}, {"gemini_prompt_tokens": 5})}
+    assert restored.generated_for_row(0) == {"A": ("hello", {"prompt_tokens": 3})}
+    assert len(restored) == 2
+
+
+def test_clear_removes_only_that_experiment(store):
+    for experiment_id in ("e", "f"):
+        store.start(experiment_id, [{}])
+        store.save_generation(experiment_id, 0, "A", "x", {})
+    store.clear("e")
+    assert store.personas("e") is None and len(store.load("e")) == 0
+    assert store.personas("f") == [{}] and len(store.load("f")) == 1
+
+
+def test_supabase_store_pages_through_large_runs():
+    client = FakeClient()
+    store = SupabaseCheckpointStore(lambda: client, flush_interval=3600, batch_size=700)
+    for row_idx in range(50):
+        for step in range(25):
+            store.save_generation("e", row_idx, f"S{step}", "r", {})
+    assert len(store.load("e").generated) == 1250
+    assert store.stats()["pending"] == 0
+
+
+def test_supabase_store_retries_a_failed_flush():
+    client = FakeClient()
+    failing = {"on": True}
+
+    def get_client():
+        if failing["on"]:
+            raise ConnectionError("down")
+        return client
+
+    store = SupabaseCheckpointStore(get_client, flush_interval=3600)
+    store.save_generation("e", 0, "A", "r", {})
+    store.flush()
+    assert store.stats()["errors"] == 1 and store.stats()["pending"] == 1
+    failing["on"] = False
+    store.flush()
+    assert store.load("e").generated == {(0, "A"): ("r", {})}
+
+
+# --- resume through the pipeline -------------------------------------------------
+
+class FakeLLM:
+    """Counts structured calls per schema and answers every one successfully."""
+
+    def __init__(self):
+        self.calls = {"generation": 0, "evaluation": 0}
+        self.lock = threading.Lock()
+
+    def __call__(self, model_name, schema, temperature=0.0):
+        fake = self
+
+        class Runnable:
+            def invoke(self, messages):
+                with fake.lock:
+                    if schema is BaseResponse:
+                        fake.calls["generation"] += 1
+                        parsed = BaseResponse(response=f"answer {fake.calls['generation']}")
+                    else:
+                        fake.calls["evaluation"] += 1
+                        parsed = EvaluationMetrics(metric=["Clarity"], score=[4.0])
+                raw = AIMessage(content="", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12})
+                return {"parsed": parsed, "raw": raw}
+
+        return Runnable()
+
+
+def experiment(rows, steps):
+    return {
+        "seed": "",
+        "iters": rows,
+        "steps": [
+            {
+                "label": f"S{i}",
+                "instructions": f"Do step {i}",
+                "temperature": 0.5,
+                "measures": [{"title": "Clarity", "description": "Is it clear?", "range": "1-5"}],
+            }
+            for i in range(steps)
+        ],
+    }
+
+
+def run(prompt, checkpoint):
+    return stream_baseline_and_evaluate(
+        prompt, "gemini-2.0-flash", {"persona": [{"number": i} for i in range(prompt["iters"])]},
+        checkpoint=checkpoint,
+    )
+
+
+def test_resume_only_calls_the_llm_for_missing_units(tmp_path, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(llm, "get_structured_llm", fake)
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite3"))
+    prompt = experiment(rows=3, steps=2)
+
+    store.start("e", [{}] * 3)
+    first_df, _, _, _ = run(prompt, store.load("e"))
+    assert fake.calls == {"generation": 6, "evaluation": 6}
+
+    # Lose row 2's second step and row 1's evaluations, as if the run died part-way
+    conn = store._connect()
+    conn.execute("DELETE FROM generation WHERE row_idx = 2 AND step = 'S1'")
+    conn.execute("DELETE FROM evaluation WHERE row_idx = 2 AND step = 'S1'")
+    conn.execute("DELETE FROM evaluation WHERE row_idx = 1")
+    conn.close()
+
+    fake.calls = {"generation": 0, "evaluation": 0}
+    df, prompt_tokens, scores, eval_tokens = run(prompt, store.load("e"))
+    assert fake.calls == {"generation": 1, "evaluation": 3}
+    # Restored units keep their original responses; rows come back in completion order
+    first_rows = {str(row["persona"]): row for _, row in first_df.iterrows()}
+    rows = {str(row["persona"]): row for _, row in df.iterrows()}
+    assert rows.keys() == first_rows.keys()
+    restored = [(persona, step) for persona in rows for step in ("S0", "S1")
+                if rows[persona][step] == first_rows[persona][step]]
+    assert len(restored) == 5
+    assert scores[["S0_Clarity", "S1_Clarity"]].applymap(lambda cell: cell == [4.0]).all().all()
+    assert len(store.load("e")) == 12
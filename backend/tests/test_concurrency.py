@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+import utils.concurrency as concurrency
+from utils.concurrency import AIMDLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_full_window_of_healthy_calls_adds_one_slot(clock):
+    limiter = AIMDLimiter(4, max_limit=10)
+    # Three long-running calls keep the window full while a fourth slot cycles
+    for _ in range(3):
+        limiter.acquire()
+    # Each healthy completion adds 1/limit, so 4 + 1/4 + 1/4.25 + ... reaches 5
+    # a little after one window's worth of calls
+    for _ in range(5):
+        started = limiter.acquire()
+        clock[0] += 1.0
+        limiter.release(started)
+    assert limiter.limit == 5
+    assert limiter.stats()["increases"] == 5
+
+
+def test_idle_window_does_not_grow(clock):
+    limiter = AIMDLimiter(4, max_limit=10)
+    for _ in range(20):
+        clock[0] += 1.0
+        limiter.release(limiter.acquire())
+    assert limiter.limit == 4
+
+
+def test_overload_halves_once_per_wave(clock):
+    limiter = AIMDLimiter(16, min_limit=2)
+    wave = [limiter.acquire() for _ in range(3)]
+    clock[0] += 1.0
+    limiter.release(wave[0], overloaded=True)
+    assert limiter.limit == 8
+    # Calls started before the cut do not cut again
+    limiter.release(wave[1], overloaded=True)
+    assert limiter.limit == 8
+    # A call started after it does
+    clock[0] += 1.0
+    limiter.release(limiter.acquire(), overloaded=True)
+    assert limiter.limit == 4
+    stats = limiter.stats()
+    assert stats["overloads"] == 3 and stats["decreases"] == 2
+
+
+def test_limit_never_drops_below_the_floor(clock):
+    limiter = AIMDLimiter(4, min_limit=2)
+    for _ in range(5):
+        clock[0] += 1.0
+        limiter.release(limiter.acquire(), overloaded=True)
+    assert limiter.limit == 2
+
+
+def test_acquire_blocks_until_a_slot_is_released():
+    limiter = AIMDLimiter(1, max_limit=1)
+    started = limiter.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.release(limiter.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(started)
+    assert acquired.wait(2)
+    thread.join()
+    assert limiter.stats()["max_in_flight"] == 1
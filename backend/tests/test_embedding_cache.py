@@ -0,0 +1,88 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+def vec(value):
+    return np.full(DIM, value, dtype=np.float32)
+
+
+def make_cache(tmp_path, capacity=2, **kwargs):
+    return EmbeddingCache(str(tmp_path), "model", DIM, capacity, **kwargs)
+
+
+def keys_for(cache, *texts):
+    return [cache.key_for(text) for text in texts]
+
+
+def test_least_recently_used_slot_is_reused(tmp_path):
+    cache = make_cache(tmp_path)
+    a, b, c = keys_for(cache, "a", "b", "c")
+    cache.put_many([a, b], np.stack([vec(1), vec(2)]))
+    cache.get_many([a])  # b is now least recently used
+
+    cache.put_many([c], np.stack([vec(3)]))
+
+    found = cache.get_many([a, b, c])
+    assert sorted(found) == [0, 2]
+    np.testing.assert_array_equal(found[0], vec(1))
+    np.testing.assert_array_equal(found[2], vec(3))
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_written_by_another_process_are_replayed(tmp_path):
+    cache = make_cache(tmp_path)
+    script = textwrap.dedent(f"""
+        import numpy as np
+        from utils.embedding_cache import EmbeddingCache
+        cache = EmbeddingCache({str(tmp_path)!r}, "model", {DIM}, 2)
+        cache.put_many([cache.key_for("a")], np.full((1, {DIM}), 7, dtype=np.float32))
+    """)
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=Path(__file__).resolve().parents[1])
+
+    found = cache.get_many(keys_for(cache, "a"))
+    np.testing.assert_array_equal(found[0], vec(7))
+    # A fresh instance rebuilds the same mapping from the index
+    np.testing.assert_array_equal(make_cache(tmp_path).get_many(keys_for(cache, "a"))[0], vec(7))
+
+
+def test_index_is_compacted_to_live_entries(tmp_path):
+    cache = make_cache(tmp_path, compact_factor=2)
+    texts = [f"text-{i}" for i in range(5)]
+    for i, text in enumerate(texts):
+        cache.put_many(keys_for(cache, text), np.stack([vec(i)]))
+
+    stats = cache.stats()
+    assert stats["compactions"] == 1
+    assert stats["index_records"] == 2
+
+    reopened = make_cache(tmp_path)
+    found = reopened.get_many(keys_for(reopened, *texts))
+    assert sorted(found) == [3, 4]
+    np.testing.assert_array_equal(found[4], vec(4))
+
+
+def test_slot_reused_elsewhere_reads_as_a_miss(tmp_path):
+    reader = make_cache(tmp_path, capacity=1)
+    writer = make_cache(tmp_path, capacity=1)
+    a, b = keys_for(reader, "a", "b")
+    reader.put_many([a], np.stack([vec(1)]))
+
+    # The writer evicts a and stores b in the same slot
+    writer.put_many([b], np.stack([vec(2)]))
+    assert reader.get_many([a]) == {}
+
+    # Same race, but the read happens before the writer's index record is seen
+    reader.put_many([a], np.stack([vec(1)]))
+    writer.put_many([b], np.stack([vec(2)]))
+    reader._replay = lambda: None
+    assert reader.get_many([a]) == {}
+    assert reader.stats()["stale_reads"] == 1
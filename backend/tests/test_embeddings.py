@@ -0,0 +1,161 @@
+import copy
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("sklearn")
+
+import utils.cosine_sim as cosine_sim
+
+WORDS = "the a of to and in is it that was for on are as with they at be this from have or by one not but".split()
+
+
+def build_tiny_bert(tmp_path):
+    """A small random BERT and its tokenizer, so nothing is downloaded."""
+    vocab = tmp_path / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + WORDS))
+    tokenizer = transformers.BertTokenizer(str(vocab))
+    torch.manual_seed(0)
+    model = transformers.BertModel(transformers.BertConfig(
+        vocab_size=len(tokenizer.vocab), hidden_size=32, num_hidden_layers=2,
+        num_attention_heads=2, intermediate_size=64,
+    )).eval()
+    return tokenizer, model
+
+
+@pytest.fixture
+def tiny_bert(tmp_path, monkeypatch):
+    """The tiny BERT installed as the already loaded full-precision model."""
+    tokenizer, model = build_tiny_bert(tmp_path)
+    monkeypatch.setattr(cosine_sim, "_tokenizer", tokenizer)
+    monkeypatch.setattr(cosine_sim, "_models", {"": model})
+    monkeypatch.setattr(cosine_sim, "EMBEDDING_QUANTIZATION", "")
+    cosine_sim.preprocess_text.cache_clear()
+    yield model
+    cosine_sim.preprocess_text.cache_clear()
+
+
+@pytest.fixture
+def pretrained(tmp_path, monkeypatch):
+    """Nothing loaded yet; from_pretrained hands out copies of the tiny BERT and counts loads."""
+    tokenizer, model = build_tiny_bert(tmp_path)
+    loads = []
+
+    def load_tokenizer(cls, name, *args, **kwargs):
+        loads.append(("tokenizer", name))
+        return tokenizer
+
+    def load_model(cls, name, *args, **kwargs):
+        loads.append(("model", name))
+        return copy.deepcopy(model).train()
+
+    monkeypatch.setattr(transformers.BertTokenizer, "from_pretrained", classmethod(load_tokenizer))
+    monkeypatch.setattr(transformers.BertModel, "from_pretrained", classmethod(load_model))
+    monkeypatch.setattr(cosine_sim, "_tokenizer", None)
+    monkeypatch.setattr(cosine_sim, "_models", {})
+    monkeypatch.setattr(cosine_sim, "EMBEDDING_QUANTIZATION", "")
+    cosine_sim.preprocess_text.cache_clear()
+    yield loads
+    cosine_sim.preprocess_text.cache_clear()
+
+
+def single_text_embedding(text):
+    return cosine_sim.get_bert_embeddings(cosine_sim.preprocess_text(text)[:cosine_sim.MAX_SEQUENCE_LENGTH]).numpy()
+
+
+def test_padded_batches_match_single_text_embeddings(tiny_bert):
+    # Lengths vary so every batch of three pads its shorter texts
+    texts = [" ".join(WORDS[i % len(WORDS)] for i in range(start, start + length))
+             for start, length in enumerate([1, 7, 3, 20, 2, 11, 5, 16])]
+
+    batched = cosine_sim.get_bert_embeddings_batch(texts, batch_size=3, use_cache=False)
+
+    assert batched.shape == (len(texts), 32)
+    for text, row in zip(texts, batched):
+        np.testing.assert_allclose(row, single_text_embedding(text), atol=1e-5)
+
+
+def test_batch_keeps_input_order_and_zeroes_empty_texts(tiny_bert):
+    texts = ["the a of to and in is it", "", "they", "!!!", "THE a, of to and in is it"]
+
+    batched = cosine_sim.get_bert_embeddings_batch(texts, batch_size=2, use_cache=False)
+
+    np.testing.assert_allclose(batched[0], single_text_embedding(texts[0]), atol=1e-5)
+    np.testing.assert_allclose(batched[2], single_text_embedding(texts[2]), atol=1e-5)
+    # Texts with no tokens after normalization
+    assert not batched[1].any() and not batched[3].any()
+    # Texts normalizing to the same string share one embedding
+    np.testing.assert_array_equal(batched[4], batched[0])
+
+
+def test_texts_normalizing_alike_are_embedded_once(tiny_bert, monkeypatch):
+    forward_rows = []
+    forward = tiny_bert.forward
+
+    def counting_forward(input_ids, *args, **kwargs):
+        forward_rows.append(len(input_ids))
+        return forward(input_ids, *args, **kwargs)
+
+    monkeypatch.setattr(tiny_bert, "forward", counting_forward)
+    cosine_sim.get_bert_embeddings_batch(["it was", "It was!", "it  WAS", "one"], batch_size=8, use_cache=False)
+
+    assert forward_rows == [2]
+
+
+def test_import_loads_neither_torch_nor_the_model():
+    code = (
+        "import sys, utils.cosine_sim as c; "
+        "print(c._tokenizer is None, c._models == {}, 'torch' in sys.modules, 'transformers' in sys.modules)"
+    )
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=backend, capture_output=True, text=True, check=True)
+
+    assert output.stdout.split() == ["True", "True", "False", "False"]
+
+
+def test_each_variant_is_loaded_once_on_first_use(pretrained):
+    assert pretrained == []
+
+    fp32 = cosine_sim.get_model("")
+    assert cosine_sim.get_model("") is fp32
+    assert not fp32.training
+    int8 = cosine_sim.get_model("int8")
+    assert cosine_sim.get_model("int8") is int8 and int8 is not fp32
+    cosine_sim.get_tokenizer()
+    cosine_sim.get_tokenizer()
+
+    name = cosine_sim.EMBEDDING_MODEL_NAME
+    assert sorted(pretrained) == [("model", name), ("model", name), ("tokenizer", name)]
+
+
+def test_default_variant_follows_embedding_quantization(pretrained, monkeypatch):
+    monkeypatch.setattr(cosine_sim, "EMBEDDING_QUANTIZATION", "int8")
+
+    assert cosine_sim.get_model() is cosine_sim.get_model("int8")
+    assert list(cosine_sim._models) == ["int8"]
+
+
+def test_int8_model_is_quantized_and_close_to_full_precision(pretrained):
+    int8 = cosine_sim.get_model("int8")
+    quantized_linear = torch.ao.nn.quantized.dynamic.Linear
+    assert any(isinstance(module, quantized_linear) for module in int8.modules())
+    assert not any(type(module) is torch.nn.Linear for module in int8.modules())
+
+    texts = ["the a of to and in is it", "they have one", "that was for on are as with they at be this"]
+    full = cosine_sim.get_bert_embeddings_batch(texts, quantization="", use_cache=False)
+    quantized = cosine_sim.get_bert_embeddings_batch(texts, quantization="int8", use_cache=False)
+
+    assert not np.array_equal(full, quantized)
+    cosines = (full * quantized).sum(axis=1) / (np.linalg.norm(full, axis=1) * np.linalg.norm(quantized, axis=1))
+    assert cosines.min() > 0.99
+
+
+def test_unsupported_quantization_is_rejected(pretrained):
+    with pytest.raises(ValueError, match="fp16"):
+        cosine_sim.get_model("fp16")
+    assert pretrained == []
@@ -0,0 +1,34 @@
+from utils.experiment_state import ProgressReadCache
+
+
+def test_published_changes_reach_every_viewer_of_that_experiment_only():
+    cache = ProgressReadCache(ttl_seconds=60)
+    cache.put("exp-1", "alice", {"progress": 10, "status": "Started"})
+    cache.put("exp-1", "bob", {"progress": 10, "status": "Started"})
+    cache.put("exp-2", "alice", {"progress": 50, "status": "Started"})
+
+    cache.apply("exp-1", {"progress": 40})
+
+    assert cache.get("exp-1", "alice") == {"progress": 40, "status": "Started"}
+    assert cache.get("exp-1", "bob") == {"progress": 40, "status": "Started"}
+    assert cache.get("exp-2", "alice") == {"progress": 50, "status": "Started"}
+
+
+def test_evicted_viewers_are_dropped_from_the_index():
+    cache = ProgressReadCache(ttl_seconds=60, max_entries=2)
+    cache.put("exp-1", "alice", {"progress": 10})
+    cache.put("exp-1", "bob", {"progress": 10})
+    cache.put("exp-2", "carol", {"progress": 0})
+
+    # alice's entry was evicted; the publish must not resurrect or trip over it
+    cache.apply("exp-1", {"progress": 20})
+
+    assert cache.get("exp-1", "alice") is None
+    assert cache.get("exp-1", "bob") == {"progress": 20}
+    assert cache.stats()["size"] == 2
+
+
+def test_publish_for_an_uncached_experiment_is_a_no_op():
+    cache = ProgressReadCache(ttl_seconds=60)
+    cache.apply("exp-9", {"progress": 5})
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from utils.jobs import (
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    GroupLimitReached,
+    JobAlreadyActive,
+    JobQueue,
+    QueueFull,
+)
+
+
+def make_queue(tmp_path, handler=lambda job_id, payload: None, **kwargs):
+    kwargs.setdefault("poll_interval", 0.05)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"), handler, **kwargs)
+
+
+def wait_for_state(queue, job_id, state, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get_job(job_id)
+        if job and job["state"] == state:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} never reached {state}: {queue.get_job(job_id)}")
+
+
+def expire_leases(queue):
+    conn = sqlite3.connect(queue.db_path)
+    conn.execute("UPDATE jobs SET lease_expires = ?", (time.time() - 1,))
+    conn.commit()
+    conn.close()
+
+
+def test_enqueued_job_runs_and_completes(tmp_path):
+    seen = []
+    queue = make_queue(tmp_path, lambda job_id, payload: seen.append((job_id, payload)))
+    queue.enqueue("a", {"x": 1})
+    assert queue.get_job("a")["state"] == JOB_QUEUED
+    queue.start()
+    try:
+        job = wait_for_state(queue, "a", JOB_COMPLETED)
+    finally:
+        queue.stop(timeout=2)
+    assert seen == [("a", {"x": 1})]
+    assert job["attempts"] == 1 and job["error"] is None
+
+
+def test_handler_exception_marks_the_job_failed(tmp_path):
+    def handler(job_id, payload):
+        raise RuntimeError("boom")
+
+    queue = make_queue(tmp_path, handler)
+    queue.enqueue("a", {})
+    queue.start()
+    try:
+        job = wait_for_state(queue, "a", JOB_FAILED)
+    finally:
+        queue.stop(timeout=2)
+    assert job["error"] == "boom"
+
+
+def test_enqueue_refuses_active_duplicates_and_a_full_queue(tmp_path):
+    queue = make_queue(tmp_path, max_pending=2)
+    queue.enqueue("a", {})
+    with pytest.raises(JobAlreadyActive):
+        queue.enqueue("a", {})
+    queue.enqueue("b", {})
+    assert not queue.has_capacity()
+    with pytest.raises(QueueFull):
+        queue.enqueue("c", {})
+
+
+def test_enqueue_caps_active_jobs_per_group(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue("a", {}, group="user-1", max_per_group=1)
+    with pytest.raises(GroupLimitReached):
+        queue.enqueue("b", {}, group="user-1", max_per_group=1)
+    queue.enqueue("c", {}, group="user-2", max_per_group=1)
+    queue.enqueue("d", {})
+    assert queue.group_count("user-1") == 1
+    queue.start()
+    try:
+        wait_for_state(queue, "a", JOB_COMPLETED)
+    finally:
+        queue.stop(timeout=2)
+    queue.enqueue("b", {}, group="user-1", max_per_group=1)
+
+
+def test_databases_without_groups_are_upgraded(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (job_id TEXT PRIMARY KEY, payload TEXT NOT NULL, state TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, owner TEXT, lease_expires REAL, error TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.close()
+    queue = make_queue(tmp_path)
+    queue.enqueue("a", {}, group="user-1", max_per_group=1)
+    assert queue.group_count("user-1") == 1
+
+
+def test_finished_job_can_be_queued_again(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.enqueue("a", {})
+    queue._claim()
+    queue._finish("a", JOB_FAILED, error="x")
+    queue.enqueue("a", {"retry": True})
+    job = queue.get_job("a")
+    assert job["state"] == JOB_QUEUED and job["attempts"] == 0 and job["error"] is None
+
+
+def test_expired_lease_requeues_then_fails_after_final_attempt(tmp_path):
+    abandoned = []
+    queue = make_queue(tmp_path, max_attempts=2, on_abandoned=lambda job_id, payload: abandoned.append((job_id, payload)))
+    queue.enqueue("a", {"x": 1})
+
+    assert queue._claim()["job_id"] == "a"
+    assert queue.get_job("a")["state"] == JOB_RUNNING
+    assert queue.recover() == 0  # lease still valid
+
+    expire_leases(queue)
+    assert queue.recover() == 1
+    assert queue.get_job("a")["state"] == JOB_QUEUED
+    assert abandoned == []
+
+    queue._claim()
+    expire_leases(queue)
+    assert queue.recover() == 0
+    job = queue.get_job("a")
+    assert job["state"] == JOB_FAILED and job["attempts"] == 2
+    assert "final attempt" in job["error"]
+    assert abandoned == [("a", {"x": 1})]
+
+
+def test_finish_ignores_jobs_owned_by_another_worker(tmp_path):
+    first = make_queue(tmp_path)
+    second = make_queue(tmp_path)
+    first.enqueue("a", {})
+    first._claim()
+    second._finish("a", JOB_COMPLETED)
+    assert first.get_job("a")["state"] == JOB_RUNNING
+
+
+def test_prune_removes_only_old_finished_jobs(tmp_path):
+    queue = make_queue(tmp_path, retention_seconds=60)
+    for job_id in ("old-done", "old-failed", "new-done", "queued"):
+        queue.enqueue(job_id, {})
+    for job_id, state in (("old-done", JOB_COMPLETED), ("old-failed", JOB_FAILED), ("new-done", JOB_COMPLETED)):
+        queue._claim()
+        queue._finish(job_id, state)
+    conn = sqlite3.connect(queue.db_path)
+    conn.execute(
+        "UPDATE jobs SET updated_at = ? WHERE job_id IN ('old-done', 'old-failed', 'queued')",
+        (time.time() - 3600,),
+    )
+    conn.commit()
+    conn.close()
+
+    assert queue.prune() == 2
+    assert queue.get_job("old-done") is None and queue.get_job("old-failed") is None
+    assert queue.get_job("new-done")["state"] == JOB_COMPLETED
+    assert queue.get_job("queued")["state"] == JOB_QUEUED
+
+
+def test_worker_pool_bounds_concurrency(tmp_path):
+    running = []
+    peak = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def handler(job_id, payload):
+        with lock:
+            running.append(job_id)
+            peak.append(len(running))
+        release.wait(5)
+        with lock:
+            running.remove(job_id)
+
+    queue = make_queue(tmp_path, handler, max_workers=2)
+    for i in range(4):
+        queue.enqueue(f"j{i}", {})
+    queue.start()
+    try:
+        time.sleep(0.3)
+        assert queue.stats()["busy_workers"] == 2
+        release.set()
+        for i in range(4):
+            wait_for_state(queue, f"j{i}", JOB_COMPLETED)
+    finally:
+        release.set()
+        queue.stop(timeout=2)
+    assert max(peak) == 2
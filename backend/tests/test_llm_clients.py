@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+import utils.llm as llm
+from utils.llm import BaseResponse, EvaluationMetrics
+
+
+class FakeChatModel:
+    def __init__(self, model_name, temperature):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.structured = 0
+
+    def with_structured_output(self, schema, include_raw=False):
+        self.structured += 1
+        return (self, schema)
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    built = []
+
+    def build(model_name, temperature=0.0):
+        built.append((model_name, temperature))
+        return FakeChatModel(model_name, temperature)
+
+    monkeypatch.setattr(llm, "_build_llm", build)
+    monkeypatch.setattr(llm, "_llm_cache", llm._LRUCache(4))
+    monkeypatch.setattr(llm, "_structured_cache", llm._LRUCache(4))
+    return built
+
+
+def test_clients_are_reused_per_model_and_temperature(builds):
+    client = llm.get_llm("gemini-2.0-flash", 0.5)
+    assert llm.get_llm("gemini-2.0-flash", 0.5) is client
+    assert llm.get_llm("gemini-2.0-flash", 1.0) is not client
+    assert len(builds) == 2
+    assert llm.get_llm_cache_stats()["clients"]["hits"] == 1
+
+
+def test_structured_runnables_are_reused_per_schema(builds):
+    runnable = llm.get_structured_llm("gemini-2.0-flash", BaseResponse, 1.0)
+    assert llm.get_structured_llm("gemini-2.0-flash", BaseResponse, 1.0) is runnable
+    other = llm.get_structured_llm("gemini-2.0-flash", EvaluationMetrics, 1.0)
+    assert other is not runnable
+    # Both schemas share one underlying client
+    assert runnable[0] is other[0]
+    assert runnable[0].structured == 2
+    assert len(builds) == 1
+
+
+def test_least_recently_used_clients_are_evicted(builds):
+    first = llm.get_llm("gemini-2.0-flash", 0.0)
+    for temperature in (0.1, 0.2, 0.3, 0.4):
+        llm.get_llm("gemini-2.0-flash", temperature)
+    assert llm.get_llm_cache_stats()["clients"]["evictions"] == 1
+    assert llm.get_llm("gemini-2.0-flash", 0.0) is not first
+
+
+def test_concurrent_builds_of_one_key_share_the_first_client():
+    cache = llm._LRUCache(4)
+    barrier = threading.Barrier(4)
+    results = []
+
+    def build():
+        barrier.wait()
+        return object()
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("k", build))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(map(id, results))) == 1
+    assert cache.stats()["size"] == 1
@@ -0,0 +1,73 @@
+from utils.evaluate import EvaluationPacker, scores_from_packed_parsed, split_usage
+from utils.llm import PackedEvaluationMetrics, estimate_tokens
+from utils.used_prompts import get_packed_evaluation_item
+
+STEP = {
+    "label": "S0",
+    "instructions": "Describe your morning",
+    "measures": [{"title": "Clarity", "description": "Is it clear?", "range": "1-5"}],
+}
+RESPONSE = "word " * 200
+
+
+def item_tokens(position, text=RESPONSE):
+    return estimate_tokens([get_packed_evaluation_item(position, text)])
+
+
+def drain(packer, outputs):
+    packs = [pack for pack in (packer.add(row_idx, output) for row_idx, output in enumerate(outputs)) if pack]
+    rest = packer.flush()
+    return packs + ([rest] if rest else [])
+
+
+def test_packs_fill_up_to_the_token_budget():
+    fixed = EvaluationPacker("S0", STEP, token_budget=10**6).fixed_tokens
+    # Room for three responses but not four
+    budget = fixed + sum(item_tokens(i) for i in range(1, 4)) + item_tokens(4) // 2
+    packer = EvaluationPacker("S0", STEP, token_budget=budget, max_items=100)
+
+    packs = drain(packer, [RESPONSE] * 8)
+
+    assert [len(pack) for pack in packs] == [3, 3, 2]
+    assert [row_idx for pack in packs for row_idx, _ in pack] == list(range(8))
+    for pack in packs:
+        tokens = fixed + sum(item_tokens(i) for i in range(1, len(pack) + 1))
+        assert tokens <= budget
+
+
+def test_max_items_caps_a_pack():
+    packer = EvaluationPacker("S0", STEP, token_budget=10**6, max_items=2)
+    assert [len(pack) for pack in drain(packer, ["short"] * 5)] == [2, 2, 1]
+
+
+def test_oversized_response_gets_a_pack_of_its_own():
+    fixed = EvaluationPacker("S0", STEP, token_budget=10**6).fixed_tokens
+    packer = EvaluationPacker("S0", STEP, token_budget=fixed + item_tokens(1) + 1, max_items=100)
+    huge = RESPONSE * 10
+
+    packs = drain(packer, ["short", huge, "short"])
+
+    assert [[row_idx for row_idx, _ in pack] for pack in packs] == [[0], [1], [2]]
+
+
+def test_packed_scores_are_matched_by_item_number():
+    pack = [(7, "a"), (3, "b"), (9, "c")]
+    parsed = PackedEvaluationMetrics.model_validate({"metric": ["Clarity"], "items": [
+        {"item": 2, "score": [2.0]},
+        {"item": 1, "score": [5.0]},
+        {"item": 1, "score": [1.0]},  # duplicate answers are ignored
+    ]})
+
+    scores = scores_from_packed_parsed("S0", STEP["measures"], pack, parsed)
+
+    assert scores == {
+        7: {"S0_Clarity": 5.0},
+        3: {"S0_Clarity": 2.0},
+        9: {"S0_Clarity": "Poorly Defined Criteria"},
+    }
+
+
+def test_usage_split_adds_up():
+    shares = split_usage({"input_tokens": 10, "output_tokens": 3, "total_tokens": 13}, 3)
+    assert [share["input_tokens"] for share in shares] == [4, 3, 3]
+    assert sum(share["total_tokens"] for share in shares) == 13
@@ -0,0 +1,115 @@
+import logging
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import utils.async_engine as async_engine
+import utils.llm as llm
+import utils.pipeline as pipeline
+from utils.evaluate import EVALUATION_MODE_PACKED, EVALUATION_MODE_ROW, EVALUATION_MODE_STEP
+from utils.llm import BaseResponse, EvaluationMetrics, PackedEvaluationMetrics, RowEvaluationMetrics
+
+
+class FakeLLM:
+    """Structured runnable factory answering every schema the pipelines use."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, model_name, schema, temperature=0.0):
+        fake = self
+
+        def answer(messages):
+            with fake.lock:
+                fake.calls += 1
+            if schema is BaseResponse:
+                parsed = BaseResponse(response="an answer")
+            elif schema is EvaluationMetrics:
+                parsed = EvaluationMetrics(metric=["Clarity"], score=[4.0])
+            elif schema is RowEvaluationMetrics:
+                parsed = RowEvaluationMetrics.model_validate({"steps": [
+                    {"step": label, "metric": ["Clarity"], "score": [4.0]} for label in ("S0", "S1")
+                ]})
+            else:
+                parsed = PackedEvaluationMetrics.model_validate({"metric": ["Clarity"], "items": [
+                    {"item": item, "score": [4.0]} for item in range(1, 4)
+                ]})
+            raw = AIMessage(content="", usage_metadata={"input_tokens": 10, "output_tokens": 2, "total_tokens": 12})
+            return {"parsed": parsed, "raw": raw}
+
+        class Runnable:
+            def invoke(self, messages):
+                return answer(messages)
+
+            async def ainvoke(self, messages):
+                return answer(messages)
+
+        return Runnable()
+
+
+PROMPT = {
+    "seed": "",
+    "iters": 3,
+    "steps": [
+        {
+            "label": f"S{i}",
+            "instructions": f"Do step {i}",
+            "temperature": 0.5,
+            "measures": [{"title": "Clarity", "description": "Is it clear?", "range": "1-5"}],
+        }
+        for i in range(2)
+    ],
+}
+SAMPLE = {"persona": [{"number": i} for i in range(3)]}
+
+
+def run_threaded(mode):
+    return pipeline.stream_baseline_and_evaluate(PROMPT, "gemini-2.0-flash", SAMPLE, evaluation_mode=mode)
+
+
+def run_asyncio(mode):
+    return async_engine.run_async(async_engine.stream_baseline_and_evaluate_async(
+        PROMPT, "gemini-2.0-flash", SAMPLE, evaluation_mode=mode,
+    ))
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(llm, "get_structured_llm", fake)
+    return fake
+
+
+@pytest.mark.parametrize("run", [run_threaded, run_asyncio])
+@pytest.mark.parametrize("mode", [EVALUATION_MODE_STEP, EVALUATION_MODE_ROW, EVALUATION_MODE_PACKED])
+def test_every_mode_scores_every_step(run, mode):
+    df, prompt_tokens, scores, eval_tokens = run(mode)
+    assert len(df) == len(scores) == len(prompt_tokens) == len(eval_tokens) == 3
+    assert scores[["S0_Clarity", "S1_Clarity"]].applymap(lambda cell: cell == [4.0]).all().all()
+    assert sum(tokens["gemini_total_tokens"] for tokens in eval_tokens) > 0
+
+
+@pytest.mark.parametrize("run, target", [
+    (run_threaded, (pipeline, "evaluate_step")),
+    (run_asyncio, (async_engine, "evaluate_step_async")),
+])
+def test_evaluator_failure_is_logged(run, target, monkeypatch, caplog):
+    def boom(*args, **kwargs):
+        raise RuntimeError("evaluator exploded")
+
+    async def boom_async(*args, **kwargs):
+        boom()
+
+    module, name = target
+    monkeypatch.setattr(module, name, boom_async if name.endswith("_async") else boom)
+    with caplog.at_level(logging.ERROR):
+        df, _, scores, _ = run(EVALUATION_MODE_STEP)
+
+    failures = [record for record in caplog.records if record.exc_info and "evaluator exploded" in str(record.exc_info[1])]
+    assert len(failures) == 6
+    assert all("row" in record.getMessage() and "step" in record.getMessage() for record in failures)
+    # Generation is unaffected; the failed units simply have no scores
+    assert len(df) == 3
+    assert scores[["S0_Clarity", "S1_Clarity"]].applymap(lambda cell: cell == []).all().all()
@@ -0,0 +1,57 @@
+import uuid
+
+import pytest
+
+from utils.experiment_state import experiment_states
+from utils.progress import ProgressUpdater
+
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+
+    def update(self, fields):
+        self.fields = fields
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        if self.client.fail:
+            raise RuntimeError("write failed")
+        self.client.writes.append(self.fields)
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.writes = []
+
+    def table(self, name):
+        return FakeTable(self)
+
+
+@pytest.fixture
+def experiment_id():
+    return str(uuid.uuid4())
+
+
+def test_progress_is_published_after_it_is_written(experiment_id):
+    client = FakeClient()
+    updater = ProgressUpdater(experiment_id, client, 0, 100, 2, no_throttle=True)
+    updater()
+    updater.close()
+
+    assert client.writes == [{"progress": 50}]
+    assert experiment_states.get(experiment_id)[0] == {"progress": 50}
+
+
+def test_failed_write_is_not_published(experiment_id):
+    client = FakeClient(fail=True)
+    updater = ProgressUpdater(experiment_id, client, 0, 100, 2, no_throttle=True)
+    updater()
+    updater.close()
+
+    assert updater.writes == 0
+    assert experiment_states.get(experiment_id) == (None, 0)
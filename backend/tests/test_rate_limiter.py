@@ -0,0 +1,68 @@
+import pytest
+
+import utils.llm as llm
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_requests_per_minute_refill_over_time(clock):
+    limiter = llm._ModelRateLimiter(rpm=60, tpm=1_000_000)
+    assert all(limiter.try_acquire(1) == 0.0 for _ in range(60))
+
+    # Bucket empty: one request refills every second
+    assert limiter.try_acquire(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert limiter.try_acquire(1) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.try_acquire(1) == 0.0
+
+
+def test_token_budget_limits_large_requests(clock):
+    limiter = llm._ModelRateLimiter(rpm=1000, tpm=600)
+    assert limiter.try_acquire(500) == 0.0
+    # 100 tokens left, 10 refill per second
+    assert limiter.try_acquire(300) == pytest.approx(20.0)
+    # A request larger than the whole budget waits for a full bucket, not forever
+    clock.now += 60
+    assert limiter.try_acquire(10_000) == 0.0
+
+
+def test_acquire_sleeps_until_the_request_fits(clock):
+    limiter = llm._ModelRateLimiter(rpm=2, tpm=1_000_000)
+    assert limiter.acquire(1) == 0.0
+    assert limiter.acquire(1) == 0.0
+
+    waited = limiter.acquire(1)
+
+    assert waited == pytest.approx(30.0)
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+    stats = limiter.stats()
+    assert stats["requests"] == 3
+    assert stats["throttled_requests"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_settle_returns_overestimated_tokens(clock):
+    limiter = llm._ModelRateLimiter(rpm=1000, tpm=600)
+    limiter.try_acquire(600)
+    limiter.settle(estimated=600, actual=100)
+    assert limiter.try_acquire(500) == 0.0
@@ -0,0 +1,45 @@
+from utils.response_cache import (
+    CACHE_SITE_EVALUATION,
+    CACHE_SITE_GENERATION,
+    ResponseCache,
+    _parse_sites,
+)
+
+
+def make_cache(tmp_path, spec):
+    return ResponseCache(str(tmp_path / "cache.sqlite3"), _parse_sites(spec))
+
+
+def test_sites_not_opted_in_bypass_the_cache(tmp_path):
+    cache = make_cache(tmp_path, "evaluation")
+    assert cache.key_for("persona", "m", "s", ["hi"], 0.0) is None
+
+
+def test_only_deterministic_calls_are_cached(tmp_path):
+    cache = make_cache(tmp_path, "evaluation,generation")
+    for site in (CACHE_SITE_EVALUATION, CACHE_SITE_GENERATION):
+        assert cache.key_for(site, "m", "s", ["hi"], 0.0) is not None
+        assert cache.key_for(site, "m", "s", ["hi"], 0.7) is None
+        assert cache.key_for(site, "m", "s", ["hi"], 1.0) is None
+    assert cache.stats()["bypassed"] == 4
+
+
+def test_legacy_site_seeds_are_ignored(tmp_path):
+    cache = make_cache(tmp_path, "evaluation:7, persona")
+    assert cache.sites == {CACHE_SITE_EVALUATION, "persona"}
+    assert cache.key_for(CACHE_SITE_EVALUATION, "m", "s", ["hi"], 1.0) is None
+
+
+def test_key_depends_on_the_request(tmp_path):
+    cache = make_cache(tmp_path, "evaluation")
+    key = cache.key_for(CACHE_SITE_EVALUATION, "m", "s", ["hi"], 0.0)
+    assert key == cache.key_for(CACHE_SITE_EVALUATION, "m", "s", ["hi"], 0.0)
+    assert key != cache.key_for(CACHE_SITE_EVALUATION, "m", "s", ["bye"], 0.0)
+    assert key != cache.key_for(CACHE_SITE_EVALUATION, "other", "s", ["hi"], 0.0)
+
+
+def test_stored_responses_are_served_from_disk(tmp_path):
+    cache = make_cache(tmp_path, "evaluation")
+    key = cache.key_for(CACHE_SITE_EVALUATION, "m", "s", ["hi"], 0.0)
+    cache.set(key, "stored")
+    assert make_cache(tmp_path, "evaluation").get(key) == "stored"
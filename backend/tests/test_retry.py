@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import utils.llm as llm
+from utils.llm import (
+    BaseResponse,
+    RETRY_PARSE_FAILURE,
+    RETRY_RATE_LIMIT,
+    RETRY_SERVER_ERROR,
+    RETRY_TIMEOUT,
+    classify_error,
+    retry_after_seconds,
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, code, headers=None, message="request failed"):
+        super().__init__(message)
+        self.code = code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+@pytest.mark.parametrize("exc, error_class", [
+    (HTTPError(429), RETRY_RATE_LIMIT),
+    (ResourceExhausted("quota"), RETRY_RATE_LIMIT),
+    (RuntimeError("429 RESOURCE_EXHAUSTED"), RETRY_RATE_LIMIT),
+    (HTTPError(504), RETRY_TIMEOUT),
+    (asyncio.TimeoutError(), RETRY_TIMEOUT),
+    (ReadTimeout(), RETRY_TIMEOUT),
+    (HTTPError(503), RETRY_SERVER_ERROR),
+    (ConnectionResetError(), RETRY_SERVER_ERROR),
+    (HTTPError(400), None),
+    (HTTPError(401), None),
+    (ValueError("unsupported model"), None),
+])
+def test_errors_are_classified(exc, error_class):
+    assert classify_error(exc) == error_class
+
+
+def test_retry_after_is_read_from_header_or_message():
+    assert retry_after_seconds(HTTPError(429, {"Retry-After": "7"})) == 7.0
+    assert retry_after_seconds(RuntimeError("Quota exceeded, please retry in 12.5s")) == 12.5
+    assert retry_after_seconds(RuntimeError("retry_delay { seconds: 3 }")) == 3.0
+    assert retry_after_seconds(HTTPError(429)) is None
+
+
+@pytest.fixture
+def retry_stats(monkeypatch):
+    stats = llm._RetryStats(ratio=0.0, reserve=100)
+    monkeypatch.setattr(llm, "_retry_stats", stats)
+    monkeypatch.delenv("LLM_RETRY_POLICIES", raising=False)
+    return stats
+
+
+def test_server_retry_after_is_honoured(retry_stats):
+    retrier = llm._Retrier("m")
+    delay = retrier.next_delay(RETRY_RATE_LIMIT, HTTPError(429, {"Retry-After": "5"}))
+    base_delay = llm.RETRY_POLICIES[RETRY_RATE_LIMIT]["base_delay"]
+    assert 5.0 <= delay <= 5.0 + min(1.0, base_delay)
+
+
+def test_attempts_per_class_are_capped(retry_stats):
+    retrier = llm._Retrier("m")
+    attempts = int(llm.RETRY_POLICIES[RETRY_TIMEOUT]["attempts"])
+    delays = [retrier.next_delay(RETRY_TIMEOUT, TimeoutError()) for _ in range(attempts)]
+    assert all(delay is not None for delay in delays[:-1])
+    assert delays[-1] is None
+    assert retry_stats.stats()["classes"][RETRY_TIMEOUT]["exhausted"] == 1
+    # Non-retryable errors give up immediately
+    assert retrier.next_delay(None, HTTPError(400)) is None
+
+
+def test_empty_retry_budget_stops_retries(monkeypatch):
+    stats = llm._RetryStats(ratio=0.5, reserve=1)
+    monkeypatch.setattr(llm, "_retry_stats", stats)
+    first = llm._Retrier("m")
+    assert first.next_delay(RETRY_SERVER_ERROR, HTTPError(500)) is not None
+    # The reserve is spent; half a retry earned per invocation is not enough yet
+    assert llm._Retrier("m").next_delay(RETRY_SERVER_ERROR, HTTPError(500)) is None
+    assert stats.stats()["classes"][RETRY_SERVER_ERROR]["budget_denied"] == 1
+    # Two more invocations earn a full retry
+    assert llm._Retrier("m").next_delay(RETRY_SERVER_ERROR, HTTPError(500)) is not None
+
+
+class FlakyLLM:
+    """Structured runnable raising the queued outcomes, then answering."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self, model_name, schema, temperature=0.0):
+        return self
+
+    def invoke(self, messages):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        raw = AIMessage(content="", usage_metadata={"input_tokens": 5, "output_tokens": 1, "total_tokens": 6})
+        parsed = BaseResponse(response="done") if outcome == "ok" else None
+        return {"parsed": parsed, "raw": raw}
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_invoke_structured_retries_transient_failures(monkeypatch, retry_stats, no_sleep):
+    fake = FlakyLLM([HTTPError(503), HTTPError(429, {"Retry-After": "2"}), "unparsed"])
+    monkeypatch.setattr(llm, "get_structured_llm", fake)
+
+    parsed, usage = llm.invoke_structured("gemini-2.0-flash", BaseResponse, [HumanMessage(content="hi")])
+
+    assert parsed.response == "done"
+    assert fake.calls == 4
+    assert len(no_sleep) == 3 and no_sleep[1] >= 2.0
+    # The unparsed attempt is billed as well as the successful one
+    assert usage["total_tokens"] == 12
+    classes = retry_stats.stats()["classes"]
+    assert classes[RETRY_SERVER_ERROR]["recovered"] == 1
+    assert classes[RETRY_PARSE_FAILURE]["recovered"] == 1
+
+
+def test_invoke_structured_raises_non_retryable_errors(monkeypatch, retry_stats, no_sleep):
+    fake = FlakyLLM([HTTPError(400)])
+    monkeypatch.setattr(llm, "get_structured_llm", fake)
+
+    with pytest.raises(HTTPError):
+        llm.invoke_structured("gemini-2.0-flash", BaseResponse, [HumanMessage(content="hi")])
+    assert fake.calls == 1 and no_sleep == []
@@ -0,0 +1,45 @@
+from utils.evaluate import API_ERROR_SCORE, evaluate_row_batched, scores_from_row_parsed
+from utils.llm import RowEvaluationMetrics
+
+
+def step(label, *titles):
+    return {"label": label, "instructions": f"Do {label}", "measures": [{"title": t, "description": "", "range": "1-5"} for t in titles]}
+
+
+STEP_ITEMS = [
+    ("Intro", "hello", step("Intro", "Clarity", "Tone")),
+    ("Plan", "a plan", step("Plan", "Clarity")),
+]
+
+
+def parsed(*entries):
+    return RowEvaluationMetrics.model_validate({"steps": [
+        {"step": label, "metric": [], "score": scores} for label, scores in entries
+    ]})
+
+
+def test_row_scores_are_matched_by_step_title():
+    scores = scores_from_row_parsed(STEP_ITEMS, parsed(("Plan", [2.0]), (" Intro ", [4.0, 5.0])))
+    assert scores == {"Intro_Clarity": 4.0, "Intro_Tone": 5.0, "Plan_Clarity": 2.0}
+
+
+def test_unmatched_titles_fall_back_to_position():
+    scores = scores_from_row_parsed(STEP_ITEMS, parsed(("Step 1", [4.0, 5.0]), ("Step 2", [2.0])))
+    assert scores == {"Intro_Clarity": 4.0, "Intro_Tone": 5.0, "Plan_Clarity": 2.0}
+
+
+def test_missing_steps_are_marked():
+    scores = scores_from_row_parsed(STEP_ITEMS, parsed(("Intro", [4.0])))
+    assert scores == {"Intro_Clarity": 4.0, "Intro_Tone": "Poorly Defined Criteria", "Plan_Clarity": "Poorly Defined Criteria"}
+
+
+def test_failed_row_call_marks_every_step(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr("utils.evaluate.invoke_structured", fail)
+    scores, usage = evaluate_row_batched(STEP_ITEMS, "gemini-2.0-flash")
+    assert set(scores.values()) == {API_ERROR_SCORE}
+    assert set(scores) == {"Intro_Clarity", "Intro_Tone", "Plan_Clarity"}
+    assert usage["total_tokens"] == 0
+    assert evaluate_row_batched([], "gemini-2.0-flash") == ({}, usage)
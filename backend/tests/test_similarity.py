@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+from utils.cosine_sim import calculate_cosine_similarity, similarity_matrices
+
+
+def pairwise_similarities(all_embeddings):
+    """The per-pair loop create_sim_matrix used before similarity_matrices."""
+    num_rows, num_steps = all_embeddings.shape[:2]
+    similarity_tensor = np.ones((num_steps, num_steps, num_rows))
+    sums = [0] * num_steps
+    counts = [0] * num_steps
+    for i in range(num_rows):
+        for j in range(num_steps):
+            for k in range(j, num_steps):
+                similarity = calculate_cosine_similarity(all_embeddings[i, j], all_embeddings[i, k])
+                similarity_tensor[j, k, i] = similarity_tensor[k, j, i] = similarity
+            for m in range(i + 1, num_rows):
+                sums[j] += calculate_cosine_similarity(all_embeddings[i, j], all_embeddings[m, j])
+                counts[j] += 1
+    stepwise = [sums[j] / counts[j] if counts[j] else 0 for j in range(num_steps)]
+    return np.mean(similarity_tensor, axis=2), stepwise
+
+
+@pytest.mark.parametrize("shape", [(6, 4, 16), (2, 3, 8), (1, 3, 8)])
+def test_matches_the_pairwise_loop(shape):
+    embeddings = np.random.default_rng(0).normal(size=shape)
+    expected_matrix, expected_stepwise = pairwise_similarities(embeddings)
+
+    matrix, stepwise = similarity_matrices(embeddings)
+
+    np.testing.assert_allclose(matrix, expected_matrix, atol=1e-12)
+    np.testing.assert_allclose(stepwise, expected_stepwise, atol=1e-12)
+    assert len(stepwise) == shape[1]
+
+
+def test_zero_vectors_score_zero_as_before():
+    embeddings = np.random.default_rng(1).normal(size=(3, 3, 8))
+    embeddings[1, 2] = 0  # an empty response
+    expected_matrix, expected_stepwise = pairwise_similarities(embeddings)
+
+    matrix, stepwise = similarity_matrices(embeddings)
+
+    np.testing.assert_allclose(matrix, expected_matrix, atol=1e-12)
+    np.testing.assert_allclose(stepwise, expected_stepwise, atol=1e-12)
+
+
+def test_single_trial_has_zero_stepwise_similarity():
+    _, stepwise = similarity_matrices(np.ones((1, 2, 4)))
+    assert stepwise == [0, 0]
@@ -0,0 +1,22 @@
+from utils.stream_tokens import StreamTokenSigner
+
+
+def test_token_round_trips_until_it_expires():
+    signer = StreamTokenSigner("secret", ttl_seconds=60)
+    token = signer.issue("exp-1", "user-1", now=1000)
+    assert signer.verify(token, now=1059) == {"task_id": "exp-1", "user_id": "user-1"}
+    assert signer.verify(token, now=1060) is None
+
+
+def test_token_from_another_secret_is_rejected():
+    token = StreamTokenSigner("secret").issue("exp-1", "user-1")
+    assert StreamTokenSigner("other").verify(token) is None
+
+
+def test_tampered_or_malformed_tokens_are_rejected():
+    signer = StreamTokenSigner("secret")
+    token = signer.issue("exp-1", "user-1")
+    forged = signer.issue("exp-2", "user-1").split(".")[0] + "." + token.split(".")[1]
+    assert signer.verify(forged) is None
+    for bad in (None, "", "abc", "a.b.c", "!!.??"):
+        assert signer.verify(bad) is None
@@ -0,0 +1,44 @@
+import pytest
+from postgrest.exceptions import APIError
+
+from utils.supabase_pool import SupabaseClientPool, is_auth_error
+
+
+def make_pool():
+    return SupabaseClientPool(lambda jwt: object(), lambda: None)
+
+
+@pytest.mark.parametrize("exc", [
+    APIError({"code": "PGRST301", "message": "JWT expired"}),
+    APIError({"code": "PGRST303", "message": "JWT claims check failed"}),
+    APIError({"message": "invalid JWT: unable to parse or verify signature"}),
+    type("HTTPStatusError", (Exception,), {"response": type("R", (), {"status_code": 401})()})(),
+])
+def test_rejected_tokens_are_auth_errors(exc):
+    assert is_auth_error(exc)
+
+
+@pytest.mark.parametrize("exc", [
+    APIError({"code": "42501", "message": "permission denied for table experiments"}),
+    RuntimeError("connection reset"),
+])
+def test_other_failures_are_not_auth_errors(exc):
+    assert not is_auth_error(exc)
+
+
+def test_auth_error_drops_only_that_tokens_client():
+    pool = make_pool()
+    expired, other = pool.get("jwt-a"), pool.get("jwt-b")
+
+    assert pool.invalidate_on_auth_error("jwt-a", APIError({"code": "PGRST301", "message": "JWT expired"}))
+
+    assert pool.get("jwt-a") is not expired
+    assert pool.get("jwt-b") is other
+    assert pool.stats()["auth_invalidations"] == 1
+
+
+def test_other_errors_keep_the_client():
+    pool = make_pool()
+    client = pool.get("jwt-a")
+    assert not pool.invalidate_on_auth_error("jwt-a", RuntimeError("timeout"))
+    assert pool.get("jwt-a") is client
@@ -0,0 +1,213 @@
+"""
+Asyncio execution engine for baseline generation and evaluation.
+
+All coroutines run on one long-lived event loop in a background thread, so
+hundreds of LLM calls can be in flight without one OS thread each, and cached
+LangChain clients always see the same loop. Synchronous code (e.g. the job
+worker running run_evaluation) submits work with run_async().
+
+Concurrency is bounded by LLM_ASYNC_CONCURRENCY in utils.llm.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+
+from .evaluate import (
+    evaluate_step_async,
+    evaluate_row_batched_async,
+    evaluate_step_packed_async,
+    EvaluationPacker,
+    EVALUATION_MODE_STEP,
+    EVALUATION_MODE_ROW,
+    EVALUATION_MODE_PACKED,
+)
+from .prompts import (
+    process_row_with_chat_async,
+    prepare_baseline_frame,
+    assemble_baseline_frame,
+)
+from .pipeline import ScoreBoard
+from .used_prompts import BASELINE_SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_engine_loop():
+    """Return the engine's event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="async-engine", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def run_async(coro):
+    """
+    Run a coroutine on the engine loop and block the calling thread for its result.
+
+    The coroutine runs in a copy of the caller's context, so context variables
+    set by the caller (e.g. the usage tracker of utils.llm.track_usage) reach
+    every task it spawns.
+    """
+    loop = get_engine_loop()
+    context = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def copy_outcome(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        if result.set_running_or_notify_cancel():
+            loop.create_task(coro, context=context).add_done_callback(copy_outcome)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
+
+
+class _ProgressNotifier:
+    """
+    Calls a (blocking) progress callback off the event loop so Supabase writes
+    never stall in-flight LLM calls.
+    """
+
+    def __init__(self, progress_callback):
+        self.progress_callback = progress_callback
+        self._pending = []
+
+    def __call__(self):
+        if self.progress_callback:
+            loop = asyncio.get_running_loop()
+            self._pending.append(loop.run_in_executor(None, self.progress_callback))
+
+    async def drain(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+            self._pending = []
+
+
+async def stream_baseline_and_evaluate_async(
+    prompt, model_name, sample=None, progress_callback=None, evaluation_mode=EVALUATION_MODE_STEP,
+    checkpoint=None,
+):
+    """
+    Asyncio version of utils.pipeline.stream_baseline_and_evaluate: each step
+    response (or, in row mode, each completed row; in packed mode, each full
+    pack) is scored in its own task as soon as it is generated. Checkpoints are
+    restored and saved as in the threaded pipeline.
+
+    Returns:
+        tuple: (final_df, prompt_tokens, results_df, eval_tokens), as the threaded pipeline
+    """
+    steps = prompt.get('steps', [])
+    df, selected_personas = prepare_baseline_frame(prompt, sample)
+    steps_by_label = {step['label']: step for step in steps}
+    notify = _ProgressNotifier(progress_callback)
+
+    board = ScoreBoard(df.shape[0], steps, checkpoint, notify)
+    eval_tasks = []
+
+    async def record(units):
+        board.record(units)
+        # SQLite writes run off the loop
+        if checkpoint is not None and units:
+            await asyncio.to_thread(board.save, units)
+
+    async def score(row_idx, col_name, response):
+        try:
+            result = await evaluate_step_async(col_name, response, steps_by_label[col_name], model_name)
+            await record(board.step_units(row_idx, col_name, result))
+        except Exception:
+            logger.exception("Async evaluation failed for row %s step %s", row_idx, col_name)
+        finally:
+            notify()
+
+    async def score_row(row_idx, row_data):
+        step_items = board.row_items(df.columns, row_idx, row_data)
+        if not step_items:
+            return
+        try:
+            result = await evaluate_row_batched_async(step_items, model_name)
+            await record(board.row_units(row_idx, step_items, result))
+        except Exception:
+            logger.exception("Async evaluation failed for row %s", row_idx)
+        finally:
+            for _ in step_items:
+                notify()
+
+    async def score_pack(col_name, pack):
+        try:
+            result = await evaluate_step_packed_async(col_name, steps_by_label[col_name], pack, model_name)
+            await record(board.pack_units(col_name, result))
+        except Exception:
+            logger.exception("Async evaluation failed for step %s rows %s", col_name, [row_idx for row_idx, _ in pack])
+        finally:
+            for _ in pack:
+                notify()
+
+    # Packed mode: callbacks all run on the loop thread, so no lock is needed
+    packers = {label: EvaluationPacker(label, step) for label, step in steps_by_label.items()}
+
+    def on_step(row_idx, col_name, response):
+        notify()
+        if col_name not in steps_by_label:
+            return
+        if evaluation_mode != EVALUATION_MODE_ROW and board.restore(row_idx, col_name):
+            return
+        if evaluation_mode == EVALUATION_MODE_PACKED:
+            pack = packers[col_name].add(row_idx, response)
+            if pack:
+                eval_tasks.append(asyncio.ensure_future(score_pack(col_name, pack)))
+        elif evaluation_mode != EVALUATION_MODE_ROW:
+            eval_tasks.append(asyncio.ensure_future(score(row_idx, col_name, response)))
+
+    async def generate_row(row_idx):
+        row_data, tokens_dict = await process_row_with_chat_async(
+            row_idx, df, prompt, model_name, BASELINE_SYSTEM_PROMPT, selected_personas[row_idx], on_step,
+            checkpoint,
+        )
+        if evaluation_mode == EVALUATION_MODE_ROW:
+            eval_tasks.append(asyncio.ensure_future(score_row(row_idx, row_data)))
+        return row_data, tokens_dict
+
+    outcomes = await asyncio.gather(
+        *(generate_row(row_idx) for row_idx in range(df.shape[0])),
+        return_exceptions=True,
+    )
+    if evaluation_mode == EVALUATION_MODE_PACKED:
+        for label, packer in packers.items():
+            pack = packer.flush()
+            if pack:
+                eval_tasks.append(asyncio.ensure_future(score_pack(label, pack)))
+    # Evaluation tasks log their own failures; anything else (e.g. cancellation) is logged here
+    for outcome in await asyncio.gather(*eval_tasks, return_exceptions=True):
+        if isinstance(outcome, BaseException):
+            logger.error("Async evaluation task failed", exc_info=outcome)
+    await notify.drain()
+
+    completed_rows, results, prompt_tokens = [], [], []
+    for row_idx, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error("Async generation failed for row %s: %s", row_idx, outcome)
+            continue
+        completed_rows.append(row_idx)
+        results.append(outcome[0])
+        prompt_tokens.append(outcome[1])
+
+    final_df = assemble_baseline_frame(results)
+    results_df, eval_tokens = board.results(completed_rows)
+
+    return final_df, prompt_tokens, results_df, eval_tokens
@@ -0,0 +1,115 @@
+"""
+Per-experiment cost budget.
+
+A CostBudget is installed with utils.llm.track_usage around a simulation run.
+Every LLM attempt the run makes reports its token usage to it, priced with the
+model's rates, so spend is known live rather than only after the run. Once
+spend reaches the ceiling, further requests raise BudgetExceeded before they
+are sent: generation and evaluation mark the affected steps as failed, the
+pipelines drain without calling the provider again, and the caller saves the
+partial results.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .llm import BudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+# Hard ceiling (USD) for any single experiment; unset means no global ceiling
+SIMULATION_MAX_COST = os.environ.get("SIMULATION_MAX_COST")
+
+
+def budget_limit(*limits: Optional[float]) -> Optional[float]:
+    """
+    Tightest of the given ceilings (USD), ignoring None and unparseable values,
+    together with SIMULATION_MAX_COST. None when nothing limits the run.
+    """
+    values = []
+    for limit in (*limits, SIMULATION_MAX_COST):
+        try:
+            if limit is not None and limit != "":
+                values.append(max(0.0, float(limit)))
+        except (TypeError, ValueError):
+            logger.warning("Ignoring invalid cost ceiling %r", limit)
+    return min(values) if values else None
+
+
+class CostBudget:
+    """
+    Thread-safe spend tracker with an optional ceiling, usable as a
+    utils.llm.track_usage tracker.
+
+    Rates are looked up once per model (pricing the first million input and
+    output tokens), so adding usage never touches the billing API.
+
+    Args:
+        limit_usd: Ceiling in USD, or None to only track spend
+        price: price(model_name, input_tokens, output_tokens) -> USD,
+            e.g. utils.pricing.compute_cost_for_model
+    """
+
+    def __init__(self, limit_usd: Optional[float], price: Callable[[str, int, int], float]):
+        self.limit_usd = limit_usd
+        self.price = price
+        self._rates: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.spent = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.requests = 0
+        self.refused = 0
+
+    def _rates_for(self, model_name: str) -> Tuple[float, float]:
+        # Caller holds the lock
+        rates = self._rates.get(model_name)
+        if rates is None:
+            rates = (
+                self.price(model_name, 1_000_000, 0) / 1_000_000,
+                self.price(model_name, 0, 1_000_000) / 1_000_000,
+            )
+            self._rates[model_name] = rates
+        return rates
+
+    @property
+    def exceeded(self) -> bool:
+        return self.limit_usd is not None and self.spent >= self.limit_usd
+
+    def check(self) -> None:
+        """Raise BudgetExceeded once spend has reached the ceiling."""
+        if self.exceeded:
+            with self._lock:
+                self.refused += 1
+            raise BudgetExceeded(f"Cost ceiling of ${self.limit_usd:.4f} reached (spent ${self.spent:.4f})")
+
+    def add(self, model_name: str, usage: Dict[str, int]) -> None:
+        """Price one request's usage and add it to the spend."""
+        input_tokens = usage.get("input_tokens", 0) or 0
+        output_tokens = usage.get("output_tokens", 0) or 0
+        with self._lock:
+            input_rate, output_rate = self._rates_for(model_name)
+            was_exceeded = self.exceeded
+            self.spent += input_tokens * input_rate + output_tokens * output_rate
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.requests += 1
+            if self.exceeded and not was_exceeded:
+                logger.warning(
+                    "Cost ceiling of $%.4f reached after %d requests; stopping further LLM calls",
+                    self.limit_usd, self.requests,
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit_usd": self.limit_usd,
+                "spent_usd": round(self.spent, 6),
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "requests": self.requests,
+                "refused": self.refused,
+                "exceeded": self.exceeded,
+            }
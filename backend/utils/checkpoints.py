@@ -0,0 +1,444 @@
+"""
+Durable per-(row, step) checkpoints for simulation runs.
+
+Every generated response and every evaluation result is checkpointed as it is
+produced, together with the personas the run started with. When a run fails
+part-way (an exception, a failed upload, or a recycled worker whose job is
+re-queued), the next attempt reloads the checkpoints and only calls the LLM for
+the units that are still missing. Checkpoints are deleted once the experiment
+completes.
+
+Two stores share one interface:
+
+- SupabaseCheckpointStore keeps checkpoints in the simulation_checkpoints table
+  (service client), so any instance can resume a run. Unit writes are batched
+  by a background flusher.
+- CheckpointStore keeps them in a SQLite file. It is durable only when
+  CHECKPOINT_DB_PATH is on a mounted volume; the default temp-directory file is
+  instance-local.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .evaluate import API_ERROR_SCORE
+from .prompts import GENERATION_ERROR_RESPONSE
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    experiment_id TEXT PRIMARY KEY,
+    personas TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generation (
+    experiment_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    response TEXT NOT NULL,
+    usage TEXT NOT NULL,
+    PRIMARY KEY (experiment_id, row_idx, step)
+);
+CREATE TABLE IF NOT EXISTS evaluation (
+    experiment_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    usage TEXT NOT NULL,
+    PRIMARY KEY (experiment_id, row_idx, step)
+);
+"""
+
+
+class RunCheckpoint:
+    """
+    Checkpoints of one experiment: the units already completed plus writers
+    for new ones. Passed to the pipelines as checkpoint=.
+
+    Attributes:
+        generated: (row_idx, step label) -> (response, usage)
+        evaluated: (row_idx, step label) -> (scores, usage)
+    """
+
+    def __init__(
+        self,
+        store: "CheckpointStore",
+        experiment_id: str,
+        generated: Dict[Tuple[int, str], Tuple[str, Dict[str, int]]],
+        evaluated: Dict[Tuple[int, str], Tuple[Dict[str, Any], Dict[str, int]]],
+    ):
+        self.store = store
+        self.experiment_id = experiment_id
+        self.generated = generated
+        self.evaluated = evaluated
+
+    def generated_for_row(self, row_idx: int) -> Dict[str, Tuple[str, Dict[str, int]]]:
+        """Saved (response, usage) per step label for one persona row."""
+        return {step: saved for (idx, step), saved in self.generated.items() if idx == row_idx}
+
+    def save_generation(self, row_idx: int, step: str, response: str, usage: Dict[str, int]) -> None:
+        """Checkpoint a generated response; failed generations are left to be retried."""
+        if response == GENERATION_ERROR_RESPONSE:
+            return
+        self.store.save_generation(self.experiment_id, row_idx, step, response, usage)
+
+    def save_evaluation(self, row_idx: int, step: str, scores: Dict[str, Any], usage: Dict[str, int]) -> None:
+        """Checkpoint one step's scores; steps whose evaluation call failed are left to be retried."""
+        if not scores or API_ERROR_SCORE in scores.values():
+            return
+        self.store.save_evaluation(self.experiment_id, row_idx, step, scores, usage)
+
+    def __len__(self) -> int:
+        return len(self.generated) + len(self.evaluated)
+
+
+class CheckpointStore:
+    """
+    SQLite-backed checkpoint storage shared by every worker on the instance.
+
+    Write errors are logged and swallowed: losing a checkpoint only means the
+    unit is recomputed on resume, never that the running experiment fails.
+
+    Args:
+        db_path: Path of the SQLite database file (created if missing)
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.errors = 0
+
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, sql: str, params: tuple) -> None:
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(sql, params)
+            finally:
+                conn.close()
+            with self._lock:
+                self.writes += 1
+        except sqlite3.Error:
+            logger.exception("Checkpoint write failed")
+            with self._lock:
+                self.errors += 1
+
+    def start(self, experiment_id: str, personas: List[Any]) -> None:
+        """Record the personas a run was started with (kept if the run is already known)."""
+        self._write(
+            "INSERT OR IGNORE INTO runs (experiment_id, personas, created_at) VALUES (?, ?, ?)",
+            (experiment_id, json.dumps(personas, default=str), time.time()),
+        )
+
+    def personas(self, experiment_id: str) -> Optional[List[Any]]:
+        """Personas of a checkpointed run, or None when there is nothing to resume."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT personas FROM runs WHERE experiment_id = ?", (experiment_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else None
+
+    def load(self, experiment_id: str) -> RunCheckpoint:
+        """Every checkpointed unit of an experiment."""
+        conn = self._connect()
+        try:
+            generated = {
+                (row_idx, step): (response, json.loads(usage))
+                for row_idx, step, response, usage in conn.execute(
+                    "SELECT row_idx, step, response, usage FROM generation WHERE experiment_id = ?",
+                    (experiment_id,),
+                )
+            }
+            evaluated = {
+                (row_idx, step): (json.loads(scores), json.loads(usage))
+                for row_idx, step, scores, usage in conn.execute(
+                    "SELECT row_idx, step, scores, usage FROM evaluation WHERE experiment_id = ?",
+                    (experiment_id,),
+                )
+            }
+        finally:
+            conn.close()
+        return RunCheckpoint(self, experiment_id, generated, evaluated)
+
+    def save_generation(self, experiment_id: str, row_idx: int, step: str, response: str, usage: Dict[str, int]) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO generation (experiment_id, row_idx, step, response, usage) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (experiment_id, row_idx, step, response, json.dumps(usage)),
+        )
+
+    def save_evaluation(self, experiment_id: str, row_idx: int, step: str, scores: Dict[str, Any], usage: Dict[str, int]) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO evaluation (experiment_id, row_idx, step, scores, usage) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (experiment_id, row_idx, step, json.dumps(scores, default=str), json.dumps(usage)),
+        )
+
+    def clear(self, experiment_id: str) -> None:
+        """Delete every checkpoint of an experiment (after it completes, or before a fresh run)."""
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for table in ("generation", "evaluation", "runs"):
+                    conn.execute(f"DELETE FROM {table} WHERE experiment_id = ?", (experiment_id,))
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            logger.exception("Checkpoint clear failed for %s", experiment_id)
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            counts = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("runs", "generation", "evaluation")
+            }
+        finally:
+            conn.close()
+        with self._lock:
+            counts.update(writes=self.writes, errors=self.errors)
+        counts["backend"] = "sqlite"
+        return counts
+
+
+# Checkpoint kinds in the simulation_checkpoints table
+_KIND_RUN = "run"
+_KIND_GENERATION = "generation"
+_KIND_EVALUATION = "evaluation"
+_CONFLICT_COLUMNS = "experiment_id,kind,row_idx,step"
+
+
+class SupabaseCheckpointStore:
+    """
+    Checkpoint storage in the Supabase simulation_checkpoints table, readable
+    from every instance.
+
+    start() and clear() write through; unit checkpoints are queued and upserted
+    in batches every flush_interval seconds by a background thread (load()
+    flushes first, so a process always sees its own writes). Write errors are
+    logged and the batch is retried on the next flush.
+
+    Args:
+        get_client: Callable returning the service-role Supabase client
+        table: Table holding the checkpoints
+        flush_interval: Seconds between batched unit writes
+        batch_size: Rows per upsert request
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], Any],
+        *,
+        table: str = "simulation_checkpoints",
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+    ):
+        self.get_client = get_client
+        self.table = table
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, int(batch_size))
+        self._pending: Dict[Tuple[str, str, int, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Serializes flushes with clear(), so a flush never re-inserts cleared rows
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.writes = 0
+        self.errors = 0
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    def _table(self):
+        return self.get_client().table(self.table)
+
+    def _queue(self, row: Dict[str, Any]) -> None:
+        key = (row["experiment_id"], row["kind"], row["row_idx"], row["step"])
+        with self._lock:
+            self._pending[key] = row
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Upsert every queued unit checkpoint now."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            rows = list(batch.values())
+            for start in range(0, len(rows), self.batch_size):
+                chunk = rows[start:start + self.batch_size]
+                try:
+                    self._table().upsert(chunk, on_conflict=_CONFLICT_COLUMNS).execute()
+                except Exception:
+                    logger.exception("Checkpoint write failed")
+                    with self._lock:
+                        self.errors += 1
+                        # Retried next flush unless a newer write replaced them
+                        for row in rows[start:]:
+                            key = (row["experiment_id"], row["kind"], row["row_idx"], row["step"])
+                            self._pending.setdefault(key, row)
+                    return
+                with self._lock:
+                    self.writes += len(chunk)
+            with self._lock:
+                self.flushes += 1
+
+    def start(self, experiment_id: str, personas: List[Any]) -> None:
+        """Record the personas a run was started with (kept if the run is already known)."""
+        try:
+            self._table().upsert(
+                {
+                    "experiment_id": experiment_id,
+                    "kind": _KIND_RUN,
+                    "row_idx": -1,
+                    "step": "",
+                    "data": json.loads(json.dumps(personas, default=str)),
+                    "usage": {},
+                },
+                on_conflict=_CONFLICT_COLUMNS,
+                ignore_duplicates=True,
+            ).execute()
+            with self._lock:
+                self.writes += 1
+        except Exception:
+            logger.exception("Checkpoint write failed")
+            with self._lock:
+                self.errors += 1
+
+    def personas(self, experiment_id: str) -> Optional[List[Any]]:
+        """Personas of a checkpointed run, or None when there is nothing to resume."""
+        response = (
+            self._table().select("data").eq("experiment_id", experiment_id).eq("kind", _KIND_RUN).execute()
+        )
+        return response.data[0]["data"] if response.data else None
+
+    def load(self, experiment_id: str) -> RunCheckpoint:
+        """Every checkpointed unit of an experiment."""
+        self.flush()
+        generated, evaluated = {}, {}
+        page = 1000
+        offset = 0
+        while True:
+            response = (
+                self._table()
+                .select("kind, row_idx, step, data, usage")
+                .eq("experiment_id", experiment_id)
+                .in_("kind", [_KIND_GENERATION, _KIND_EVALUATION])
+                .order("kind")
+                .order("row_idx")
+                .order("step")
+                .range(offset, offset + page - 1)
+                .execute()
+            )
+            for row in response.data:
+                units = generated if row["kind"] == _KIND_GENERATION else evaluated
+                units[(row["row_idx"], row["step"])] = (row["data"], row["usage"] or {})
+            if len(response.data) < page:
+                break
+            offset += page
+        return RunCheckpoint(self, experiment_id, generated, evaluated)
+
+    def save_generation(self, experiment_id: str, row_idx: int, step: str, response: str, usage: Dict[str, int]) -> None:
+        self._queue({
+            "experiment_id": experiment_id,
+            "kind": _KIND_GENERATION,
+            "row_idx": row_idx,
+            "step": step,
+            "data": response,
+            "usage": usage,
+        })
+
+    def save_evaluation(self, experiment_id: str, row_idx: int, step: str, scores: Dict[str, Any], usage: Dict[str, int]) -> None:
+        self._queue({
+            "experiment_id": experiment_id,
+            "kind": _KIND_EVALUATION,
+            "row_idx": row_idx,
+            "step": step,
+            "data": json.loads(json.dumps(scores, default=str)),
+            "usage": usage,
+        })
+
+    def clear(self, experiment_id: str) -> None:
+        """Delete every checkpoint of an experiment (after it completes, or before a fresh run)."""
+        with self._flush_lock:
+            with self._lock:
+                self._pending = {key: row for key, row in self._pending.items() if key[0] != experiment_id}
+            try:
+                self._table().delete().eq("experiment_id", experiment_id).execute()
+            except Exception:
+                logger.exception("Checkpoint clear failed for %s", experiment_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "supabase",
+                "pending": len(self._pending),
+                "writes": self.writes,
+                "flushes": self.flushes,
+                "errors": self.errors,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def init_checkpoint_store(get_service_client: Optional[Callable[[], Any]] = None):
+    """
+    Create the process-wide store: SQLite at CHECKPOINT_DB_PATH when set (it must
+    be on a mounted volume to survive the instance), else the Supabase table via
+    get_service_client, else an instance-local SQLite file in the temp directory.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            db_path = os.environ.get("CHECKPOINT_DB_PATH")
+            if db_path:
+                _store = CheckpointStore(db_path)
+            elif get_service_client is not None and get_service_client() is not None:
+                _store = SupabaseCheckpointStore(get_service_client)
+            else:
+                logger.warning(
+                    "No service client or CHECKPOINT_DB_PATH; checkpoints are instance-local "
+                    "and failed runs can only be resumed on this instance"
+                )
+                _store = CheckpointStore(os.path.join(tempfile.gettempdir(), "simulation_checkpoints.sqlite3"))
+        return _store
+
+
+def get_checkpoint_store():
+    """Process-wide checkpoint store (see init_checkpoint_store)."""
+    return _store or init_checkpoint_store()
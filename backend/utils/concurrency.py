@@ -0,0 +1,216 @@
+"""
+Adaptive (AIMD) concurrency limits for LLM calls.
+
+Every LLM request takes a slot from its model's limiter for as long as it is
+in flight, whichever stage (generation or evaluation) and engine (threads or
+asyncio) issues it. The limit grows by about one slot per window of healthy
+responses and is halved when the provider answers with a 429 or a timeout,
+so the process converges on what the provider actually sustains instead of a
+fixed pool size. Thread pools are sized to the ceiling (LLM_CONCURRENCY_MAX)
+and left to block on the limiter.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+# Slots a model starts with, and the range the limit may move in
+LLM_CONCURRENCY_INITIAL = int(os.environ.get("LLM_CONCURRENCY_INITIAL", 8))
+LLM_CONCURRENCY_MIN = int(os.environ.get("LLM_CONCURRENCY_MIN", 2))
+LLM_CONCURRENCY_MAX = int(os.environ.get("LLM_CONCURRENCY_MAX", 64))
+# Growth pauses while recent latency exceeds this multiple of long-run latency
+LLM_CONCURRENCY_LATENCY_TOLERANCE = float(os.environ.get("LLM_CONCURRENCY_LATENCY_TOLERANCE", 2.0))
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight calls.
+
+    acquire() blocks (acquire_async() awaits) until a slot is free and
+    returns the start time to pass back to release(). release() reports the
+    outcome:
+
+    - success with recent latency within latency_tolerance of the long-run
+      average: limit += increase / limit (about +increase per full window)
+    - overloaded (429, timeout): limit *= decrease, at most once per wave -
+      calls started before the last cut do not cut again
+    - anything else: limit unchanged
+
+    Args:
+        initial: Starting limit
+        min_limit: Floor for the limit
+        max_limit: Ceiling for the limit
+        increase: Slots added per window of healthy responses
+        decrease: Factor applied to the limit on overload
+        latency_tolerance: Short/long latency ratio above which growth pauses
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        *,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters: deque = deque()
+        self._last_decrease = 0.0
+        self._latency_short = None  # EWMA, alpha 0.2
+        self._latency_long = None  # EWMA, alpha 0.02
+
+        self.waiting = 0
+        self.increases = 0
+        self.decreases = 0
+        self.overloads = 0
+        self.max_in_flight = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _take(self) -> bool:
+        # Caller holds the lock
+        if self._in_flight < int(self._limit):
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            return True
+        return False
+
+    def _wake(self) -> None:
+        # Caller holds the lock; wake as many waiters as there are free slots
+        free = int(self._limit) - self._in_flight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        while free > 0 and self._async_waiters:
+            loop, future = self._async_waiters.popleft()
+            if future.done():
+                continue
+            loop.call_soon_threadsafe(_resolve, future)
+            free -= 1
+
+    def acquire(self) -> float:
+        """Block until a slot is free; returns the start time for release()."""
+        with self._cond:
+            if not self._take():
+                self.waiting += 1
+                try:
+                    while not self._take():
+                        self._cond.wait()
+                finally:
+                    self.waiting -= 1
+        return time.monotonic()
+
+    async def acquire_async(self) -> float:
+        """Asyncio version of acquire: waits on a future instead of blocking the loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._take():
+                    return time.monotonic()
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+                self.waiting += 1
+            try:
+                # Timeout only guards against a wake-up racing the append above
+                await asyncio.wait_for(future, timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self.waiting -= 1
+                    try:
+                        self._async_waiters.remove((loop, future))
+                    except ValueError:
+                        pass
+
+    def release(self, started: float, *, overloaded: bool = False, succeeded: bool = True) -> None:
+        """Free the slot taken at started and adjust the limit from the call's outcome."""
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            if overloaded:
+                self.overloads += 1
+                if started >= self._last_decrease:
+                    self._limit = max(self.min_limit, self._limit * self.decrease)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif succeeded:
+                latency = now - started
+                if self._latency_short is None:
+                    self._latency_short = self._latency_long = latency
+                else:
+                    self._latency_short += 0.2 * (latency - self._latency_short)
+                    self._latency_long += 0.02 * (latency - self._latency_long)
+                healthy = self._latency_short <= self.latency_tolerance * self._latency_long
+                # Only grow when the window is actually being used
+                if healthy and self._in_flight + 1 >= int(self._limit) and self._limit < self.max_limit:
+                    self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+                    self.increases += 1
+            self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "limit": int(self._limit),
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "waiting": self.waiting,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "overloads": self.overloads,
+                "latency_ewma_seconds": round(self._latency_short, 3) if self._latency_short is not None else None,
+                "latency_baseline_seconds": round(self._latency_long, 3) if self._latency_long is not None else None,
+            }
+
+
+def _resolve(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters: Dict[str, AIMDLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_concurrency_limiter(model_name: str) -> AIMDLimiter:
+    """Process-wide limiter for a resolved model name, configured from LLM_CONCURRENCY_*."""
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            limiter = AIMDLimiter(
+                LLM_CONCURRENCY_INITIAL,
+                min_limit=LLM_CONCURRENCY_MIN,
+                max_limit=LLM_CONCURRENCY_MAX,
+                latency_tolerance=LLM_CONCURRENCY_LATENCY_TOLERANCE,
+            )
+            _limiters[model_name] = limiter
+        return limiter
+
+
+def get_concurrency_stats() -> Dict[str, Dict[str, Any]]:
+    """Current limit, in-flight calls and adjustments for every model seen so far."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def executor_workers(tasks: int) -> int:
+    """Thread pool size for a batch of LLM-bound tasks: enough threads to fill the highest limit."""
+    return max(1, min(int(tasks), LLM_CONCURRENCY_MAX))
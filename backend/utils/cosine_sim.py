@@ -1,21 +1,93 @@
 """
 This module provides functionality for computing semantic similarity between text sequences using BERT embeddings.
 It includes utilities for text preprocessing, embedding generation, and similarity calculations.
+
+torch, transformers and the model weights are loaded on first use (get_tokenizer,
+get_model), so importing the module is cheap for processes that never compute
+similarity.
 """
 
-from transformers import BertTokenizer, BertModel
-import torch
+import os
 import re
 import random
+import threading
 import pandas as pd
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from functools import lru_cache
 
-# Initialize BERT tokenizer and model
-tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-model = BertModel.from_pretrained("bert-base-uncased")
-model.eval()  # Set model to evaluation mode for consistent results
+from .embedding_cache import get_embedding_cache
+
+# Hugging Face checkpoint the tokenizer and model are loaded from
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "bert-base-uncased")
+# "int8" serves embeddings from a dynamically quantized copy of the model (CPU only)
+EMBEDDING_QUANTIZATION = os.environ.get("EMBEDDING_QUANTIZATION", "").strip().lower()
+# BERT's position embeddings stop at 512 tokens; longer texts are truncated
+MAX_SEQUENCE_LENGTH = 512
+# Texts per forward pass in get_bert_embeddings_batch
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+# Intra-op CPU threads for inference (unset keeps torch's default of one per core)
+EMBEDDING_THREADS = os.environ.get("EMBEDDING_THREADS")
+
+_tokenizer = None
+_models = {}
+_load_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Return the BERT tokenizer, loading it on first use."""
+    global _tokenizer
+    with _load_lock:
+        if _tokenizer is None:
+            from transformers import BertTokenizer
+            _tokenizer = BertTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+        return _tokenizer
+
+
+def get_model(quantization=None):
+    """
+    Return the BERT model in evaluation mode, loading it on first use.
+
+    Args:
+        quantization (str, optional): "" for the full-precision model or "int8" for a
+            copy whose Linear layers are dynamically quantized to int8 (smaller and
+            faster on CPU, embeddings differ slightly). Defaults to EMBEDDING_QUANTIZATION.
+
+    Returns:
+        transformers.BertModel: The loaded model (one instance per variant)
+    """
+    quantization = EMBEDDING_QUANTIZATION if quantization is None else quantization
+    if quantization not in ("", "int8"):
+        raise ValueError(f"Unsupported embedding quantization: {quantization!r}")
+    with _load_lock:
+        model = _models.get(quantization)
+        if model is None:
+            import torch
+            from transformers import BertModel
+
+            if EMBEDDING_THREADS:
+                torch.set_num_threads(int(EMBEDDING_THREADS))
+            model = BertModel.from_pretrained(EMBEDDING_MODEL_NAME)
+            model.eval()  # Set model to evaluation mode for consistent results
+            if quantization == "int8":
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+            _models[quantization] = model
+        return model
+
+
+def normalize_text(text):
+    """
+    Normalize text the way preprocess_text does before tokenizing: lowercase, with
+    special characters removed and whitespace collapsed. Texts that normalize to the
+    same string get the same embedding.
+    """
+    # Normalize text to lowercase
+    text = text.lower()
+    # Remove special characters and extra spaces
+    return re.sub(r"[^a-zA-Z0-9\s]+|\s+", " ", text).strip()
+
 
 @lru_cache(maxsize=128)
 def preprocess_text(text, random_mask_option=False, indexed_tokens=True):
@@ -30,12 +102,10 @@ def preprocess_text(text, random_mask_option=False, indexed_tokens=True):
     Returns:
         Union[List[int], List[str]]: Either token indices or tokenized text based on indexed_tokens parameter
     """
-    # Normalize text to lowercase
-    text = text.lower()
-    # Remove special characters and extra spaces
-    text = re.sub(r"[^a-zA-Z0-9\s]+|\s+", " ", text).strip()
+    text = normalize_text(text)
 
     # Tokenize input text
+    tokenizer = get_tokenizer()
     tokenized_text = tokenizer.tokenize(text)
 
     # Optional random masking for MLM training
@@ -53,16 +123,20 @@ def preprocess_text(text, random_mask_option=False, indexed_tokens=True):
         return tokenized_text
 
 
-def get_bert_embeddings(indexed_tokens):
+def get_bert_embeddings(indexed_tokens, quantization=None):
     """
     Generate BERT embeddings for a sequence of token indices.
     
     Args:
         indexed_tokens (List[int]): List of token indices from the BERT tokenizer
+        quantization (str, optional): Model variant, as for get_model
         
     Returns:
         torch.Tensor: BERT embeddings for the input sequence
     """
+    import torch
+
+    model = get_model(quantization)
     # Prepare input tensors
     input_ids = torch.tensor([indexed_tokens])
     attention_mask = torch.tensor([[1] * len(indexed_tokens)])
@@ -77,6 +151,82 @@ def get_bert_embeddings(indexed_tokens):
     return sentence_embedding
 
 
+def get_bert_embeddings_batch(texts, batch_size=None, quantization=None, use_cache=True):
+    """
+    Generate BERT sentence embeddings for many texts with batched forward passes.
+
+    Each text is preprocessed exactly as for get_bert_embeddings (preprocess_text,
+    no special tokens) and truncated to MAX_SEQUENCE_LENGTH tokens. Texts that
+    normalize to the same string are embedded once, and embeddings already in the
+    persistent embedding cache (utils.embedding_cache) are not recomputed. The rest
+    are sorted by length so each batch is padded only to its own longest sequence,
+    and padding is hidden from the model by the attention mask, so every
+    embedding matches a single-text forward pass.
+
+    Args:
+        texts (List[str]): Texts to embed
+        batch_size (int, optional): Texts per forward pass (defaults to EMBEDDING_BATCH_SIZE)
+        quantization (str, optional): Model variant, as for get_model
+        use_cache (bool): Read and fill the embedding cache; pass False to time or
+            compare the model itself (e.g. benchmarks.embedding_quantization)
+
+    Returns:
+        numpy.ndarray: (len(texts), hidden_size) embeddings in input order; texts with
+            no tokens get a zero vector
+    """
+    import torch
+
+    quantization = EMBEDDING_QUANTIZATION if quantization is None else quantization
+    model = get_model(quantization)
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    embeddings = np.zeros((len(texts), model.config.hidden_size), dtype=np.float32)
+
+    # Input positions of each distinct normalized text
+    positions = {}
+    for i, text in enumerate(texts):
+        normalized = normalize_text(text)
+        if normalized:
+            positions.setdefault(normalized, []).append(i)
+    pending = list(positions)
+
+    cache = None
+    if use_cache:
+        cache = get_embedding_cache(f"{EMBEDDING_MODEL_NAME}:{quantization or 'fp32'}", model.config.hidden_size)
+    if cache is not None:
+        keys = {text: cache.key_for(text) for text in pending}
+        cached = cache.get_many([keys[text] for text in pending])
+        for j, vector in cached.items():
+            embeddings[positions[pending[j]]] = vector
+        pending = [text for j, text in enumerate(pending) if j not in cached]
+
+    token_ids = {text: preprocess_text(text)[:MAX_SEQUENCE_LENGTH] for text in pending}
+    order = sorted((text for text in pending if token_ids[text]), key=lambda text: len(token_ids[text]))
+    computed = np.zeros((len(order), model.config.hidden_size), dtype=np.float32)
+    pad_id = get_tokenizer().pad_token_id or 0
+
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        width = len(token_ids[batch[-1]])
+        input_ids = torch.full((len(batch), width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), width), dtype=torch.long)
+        for row, text in enumerate(batch):
+            input_ids[row, :len(token_ids[text])] = torch.tensor(token_ids[text])
+            attention_mask[row, :len(token_ids[text])] = 1
+
+        with torch.no_grad():
+            outputs = model(input_ids, attention_mask=attention_mask)
+
+        # Same sentence representation as get_bert_embeddings: the first position
+        computed[start:start + len(batch)] = outputs.last_hidden_state[:, 0, :].numpy()
+
+    for text, vector in zip(order, computed):
+        embeddings[positions[text]] = vector
+    if cache is not None and order:
+        cache.put_many([keys[text] for text in order], computed)
+
+    return embeddings
+
+
 def calculate_cosine_similarity(embedding1, embedding2):
     """
     Calculate cosine similarity between two embeddings.
@@ -94,6 +244,48 @@ def calculate_cosine_similarity(embedding1, embedding2):
     return similarity[0][0]
 
 
+def _l2_normalize(embeddings):
+    """Scale vectors along the last axis to unit length; zero vectors stay zero."""
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+
+
+def similarity_matrices(all_embeddings):
+    """
+    Compute the within-trial and across-trial similarities of a set of embeddings.
+
+    The (rows, steps, dim) tensor is normalized once and both results come from
+    batched matrix products instead of one cosine_similarity call per pair.
+    Zero vectors have similarity 0 with everything, as in calculate_cosine_similarity.
+
+    Args:
+        all_embeddings (numpy.ndarray): Embeddings of shape (rows, steps, dim)
+
+    Returns:
+        tuple: (mean_similarity_matrix, stepwise_similarity) where:
+            - mean_similarity_matrix (numpy.ndarray): (steps, steps) similarity between
+              steps of the same trial, averaged over trials
+            - stepwise_similarity (list): For each step, the mean similarity over all
+              pairs of different trials (0 when there is only one trial)
+    """
+    num_rows, num_steps = all_embeddings.shape[:2]
+    unit = _l2_normalize(np.asarray(all_embeddings, dtype=np.float64))
+
+    # (rows, steps, steps): cosine similarity between every pair of steps of a trial
+    within_trial = unit @ unit.transpose(0, 2, 1)
+    mean_similarity_matrix = np.mean(within_trial, axis=0)
+
+    # (steps, rows, rows): cosine similarity between every pair of trials at a step
+    by_step = unit.transpose(1, 0, 2)
+    across_trials = by_step @ by_step.transpose(0, 2, 1)
+    first, second = np.triu_indices(num_rows, k=1)
+    if len(first) == 0:
+        return mean_similarity_matrix, [0] * num_steps
+    stepwise_similarity = list(across_trials[:, first, second].mean(axis=1))
+
+    return mean_similarity_matrix, stepwise_similarity
+
+
 def create_sim_matrix(df):
     """
     Create similarity matrices for a DataFrame of text sequences.
@@ -111,53 +303,14 @@ def create_sim_matrix(df):
     """
     num_rows = len(df)
     num_steps = len(df.columns) - 1  # Exclude the first column
-    embedding_dim = get_bert_embeddings(preprocess_text("sample")).shape[0]
-
-    # Initialize array to store all embeddings
-    all_embeddings = np.zeros((num_rows, num_steps, embedding_dim))
-
-    # Generate embeddings for all text sequences
-    for i in range(num_rows):
-        for j in range(num_steps):
-            text = preprocess_text(df.iloc[i, j + 1])  # Skip the first column
-            all_embeddings[i, j] = get_bert_embeddings(text)
-
-    # Initialize similarity tensor and stepwise similarity arrays
-    similarity_tensor = np.ones((num_steps, num_steps, num_rows))
-    stepwise_similarity = [0] * num_steps
-    stepwise_similarity_sums = [0] * num_steps
-    stepwise_similarity_counts = [0] * num_steps
-
-    # Calculate both trial-wise and stepwise similarities
-    for i in range(num_rows):
-        embeddings = all_embeddings[i]  # Current trial embeddings
-
-        # Calculate trial-wise similarities (within same trial)
-        for j in range(num_steps):
-            for k in range(j, num_steps):
-                similarity = calculate_cosine_similarity(embeddings[j], embeddings[k])
-                similarity_tensor[j, k, i] = similarity
-                similarity_tensor[k, j, i] = similarity  # Symmetric matrix
-
-            # Calculate stepwise similarities (across trials)
-            step_embeddings = all_embeddings[:, j, :]
-            for m in range(i + 1, num_rows):
-                step_similarity = calculate_cosine_similarity(
-                    step_embeddings[i], step_embeddings[m]
-                )
-                stepwise_similarity_sums[j] += step_similarity
-                stepwise_similarity_counts[j] += 1
-
-    # Calculate average stepwise similarities
-    for step in range(num_steps):
-        stepwise_similarity[step] = (
-            stepwise_similarity_sums[step] / stepwise_similarity_counts[step]
-            if stepwise_similarity_counts[step] > 0
-            else 0
-        )
 
-    # Calculate mean similarity matrix across all trials
-    mean_similarity_matrix = np.mean(similarity_tensor, axis=2)
+    # Embed every cell in batched forward passes (row-major, skipping the first column)
+    texts = [df.iloc[i, j + 1] for i in range(num_rows) for j in range(num_steps)]
+    all_embeddings = get_bert_embeddings_batch(texts).astype(np.float64).reshape(
+        num_rows, num_steps, get_model().config.hidden_size
+    )
+
+    mean_similarity_matrix, stepwise_similarity = similarity_matrices(all_embeddings)
 
     # Convert results to DataFrames
     mean_similarity_df = pd.DataFrame(
@@ -0,0 +1,282 @@
+"""
+Persistent cache of text embeddings.
+
+Embeddings are keyed by a hash of (model id, normalized text) and stored in a
+memory-mapped float32 matrix, one row per slot, beside an append-only index
+of (key, slot) records. Storing an embedding fills a slot and appends one
+record; the latest record for a slot wins, so handing the slot of an evicted
+entry to a new one never rewrites earlier records. Once every slot is taken,
+the least recently used entry's slot is reused. When the index has grown to
+several times the capacity it is compacted: rewritten in recency order and
+atomically replaced.
+
+Processes on one instance can share the files. Slot writes and index appends
+happen under an exclusive file lock after replaying records other processes
+appended, and each slot also stores its key, which reads verify so a slot
+reused elsewhere reads as a miss. Recency is tracked per process, so eviction
+across processes is approximately least recently used.
+"""
+
+import contextlib
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Index record: 16-byte key digest, little-endian uint32 slot
+_RECORD = struct.Struct("<16sI")
+_KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    """
+    Fixed-capacity, file-backed store of embeddings for one model.
+
+    Args:
+        directory: Directory holding the matrix, key and index files (created if missing)
+        model_id: Identifies the model and variant; part of every key and of the file names
+        dim: Embedding width
+        capacity: Maximum entries kept before least-recently-used slots are reused
+        compact_factor: Index records per slot of capacity that trigger compaction
+    """
+
+    def __init__(self, directory: str, model_id: str, dim: int, capacity: int = 50_000, compact_factor: int = 4):
+        self.model_id = model_id
+        self.dim = int(dim)
+        self.capacity = max(1, int(capacity))
+        self.compact_factor = max(2, int(compact_factor))
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{hashlib.sha256(model_id.encode('utf-8')).hexdigest()[:16]}-{self.dim}")
+        self.vectors_path = base + ".f32"
+        self.keys_path = base + ".keys"
+        self.index_path = base + ".index"
+        self._lock_path = base + ".lock"
+
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[bytes, int]" = OrderedDict()  # key -> slot, least recently used first
+        self._slot_keys: Dict[int, bytes] = {}
+        self._free: List[int] = []
+        self._next_slot = 0
+        self._index_offset = 0
+        self._index_inode = None
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+            "compactions": 0,
+            "stale_reads": 0,
+        }
+
+        with self._lock, self._file_lock():
+            self._open()
+            self._replay()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a+b") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _open(self) -> None:
+        # Caller holds both locks. Files written with another capacity or width are discarded.
+        vector_bytes = self.capacity * self.dim * 4
+        key_bytes = self.capacity * _KEY_BYTES
+        paths = (self.vectors_path, self.keys_path, self.index_path)
+        fresh = not (
+            os.path.exists(self.vectors_path)
+            and os.path.getsize(self.vectors_path) == vector_bytes
+            and os.path.exists(self.keys_path)
+            and os.path.getsize(self.keys_path) == key_bytes
+        )
+        if fresh:
+            if any(os.path.exists(path) for path in paths):
+                logger.info("Embedding cache files for %s do not match the configured size; starting empty", self.model_id)
+            for path in paths:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+        mode = "w+" if fresh else "r+"
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+        self._keys = np.memmap(self.keys_path, dtype=np.uint8, mode=mode, shape=(self.capacity, _KEY_BYTES))
+
+    def _replay(self) -> None:
+        # Caller holds self._lock. Applies index records appended since the last call,
+        # or rebuilds the mapping when the index was compacted (replaced) elsewhere.
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            stat = None
+        inode = stat.st_ino if stat is not None else None
+        if inode != self._index_inode:
+            self._slots.clear()
+            self._slot_keys.clear()
+            self._free.clear()
+            self._next_slot = 0
+            self._index_offset = 0
+            self._index_inode = inode
+        if stat is None or stat.st_size - self._index_offset < _RECORD.size:
+            return
+
+        with open(self.index_path, "rb") as handle:
+            handle.seek(self._index_offset)
+            data = handle.read(stat.st_size - self._index_offset)
+        # A record still being appended is picked up on the next replay
+        usable = len(data) - len(data) % _RECORD.size
+        for key, slot in _RECORD.iter_unpack(data[:usable]):
+            if slot < self.capacity:
+                self._assign(key, slot)
+        self._index_offset += usable
+
+    def _assign(self, key: bytes, slot: int) -> None:
+        # Caller holds self._lock
+        previous_key = self._slot_keys.get(slot)
+        if previous_key is not None and previous_key != key:
+            self._slots.pop(previous_key, None)
+        previous_slot = self._slots.get(key)
+        if previous_slot is not None and previous_slot != slot:
+            # Two processes stored the same text; the older slot is free again
+            self._slot_keys.pop(previous_slot, None)
+            self._free.append(previous_slot)
+        with contextlib.suppress(ValueError):
+            self._free.remove(slot)
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+        self._slot_keys[slot] = key
+        self._next_slot = max(self._next_slot, slot + 1)
+
+    def _allocate(self) -> int:
+        # Caller holds both locks
+        if self._free:
+            return self._free.pop()
+        if self._next_slot < self.capacity:
+            return self._next_slot
+        key, slot = self._slots.popitem(last=False)
+        del self._slot_keys[slot]
+        self._counters["evictions"] += 1
+        return slot
+
+    def key_for(self, text: str) -> bytes:
+        """Cache key for an already normalized text."""
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode("utf-8")).digest()[:_KEY_BYTES]
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[int, np.ndarray]:
+        """Cached embeddings for keys, as {position in keys: vector}; misses are left out."""
+        found = {}
+        with self._lock:
+            self._replay()
+            for position, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    continue
+                # The key is checked on both sides of the copy in case another process reuses the slot
+                if self._keys[slot].tobytes() == key:
+                    vector = np.array(self._vectors[slot])
+                    if self._keys[slot].tobytes() == key:
+                        self._slots.move_to_end(key)
+                        found[position] = vector
+                        continue
+                self._counters["stale_reads"] += 1
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray) -> None:
+        """Store embeddings (one row of vectors per key); keys already cached are skipped."""
+        with self._lock, self._file_lock():
+            self._replay()
+            records = []
+            for key, vector in zip(keys, vectors):
+                if key in self._slots:
+                    continue
+                slot = self._allocate()
+                # Clear the key first so readers never pair it with a half-written vector
+                self._keys[slot] = 0
+                self._vectors[slot] = vector
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._assign(key, slot)
+                records.append(_RECORD.pack(key, slot))
+            if not records:
+                return
+            self._vectors.flush()
+            self._keys.flush()
+            # The record is appended only after its slot is written
+            with open(self.index_path, "ab") as handle:
+                handle.write(b"".join(records))
+            if self._index_inode is None:
+                self._index_inode = os.stat(self.index_path).st_ino
+            self._index_offset += len(records) * _RECORD.size
+            self._counters["writes"] += len(records)
+            if self._index_offset // _RECORD.size > self.compact_factor * self.capacity:
+                self._compact()
+
+    def _compact(self) -> None:
+        # Caller holds both locks: one record per live entry, in recency order
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            handle.write(b"".join(_RECORD.pack(key, slot) for key, slot in self._slots.items()))
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self._index_inode = stat.st_ino
+        self._index_offset = stat.st_size
+        self._counters["compactions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._slots)
+            stats["capacity"] = self.capacity
+            stats["index_records"] = self._index_offset // _RECORD.size
+        stats["model_id"] = self.model_id
+        return stats
+
+
+_caches: Dict[Tuple[str, int], Optional[EmbeddingCache]] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_id: str, dim: int) -> Optional[EmbeddingCache]:
+    """
+    Process-wide cache for a model, configured from EMBEDDING_CACHE_DIR and
+    EMBEDDING_CACHE_MAX_ENTRIES. None when caching is disabled (max entries 0)
+    or the cache files cannot be opened.
+    """
+    capacity = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 50_000))
+    if capacity <= 0:
+        return None
+    with _caches_lock:
+        if (model_id, dim) not in _caches:
+            directory = os.environ.get("EMBEDDING_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "embedding_cache")
+            try:
+                _caches[(model_id, dim)] = EmbeddingCache(directory, model_id, dim, capacity)
+            except OSError:
+                # Remembered as None so the failure is logged once per process
+                logger.exception("Embedding cache unavailable; embeddings will not be cached")
+                _caches[(model_id, dim)] = None
+        return _caches[(model_id, dim)]
+
+
+def get_embedding_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Hit/miss/write/eviction counts for every embedding cache opened by this process."""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {cache.model_id: cache.stats() for cache in caches.values() if cache is not None}
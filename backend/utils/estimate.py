@@ -0,0 +1,230 @@
+"""
+Pre-run token, cost and duration estimates for simulations.
+
+estimate_simulation() builds the messages a run would send with the same
+builders the run uses (utils.prompts for generation, utils.evaluate for every
+evaluation mode), filling earlier steps with placeholder responses of the
+projected length, and counts them with the local estimate_tokens. History
+growth from replaying earlier steps (or from conversation mode) is therefore
+counted exactly as it will be sent. Output tokens are projected from running
+averages of completed runs (record_run_usage) and duration from the current
+adaptive concurrency limit, the model's rate limits and observed call latency.
+Nothing here calls a model.
+"""
+
+import copy
+import os
+import threading
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage
+
+from .concurrency import get_concurrency_limiter
+from .evaluate import (
+    build_evaluation_messages,
+    build_row_evaluation_messages,
+    build_packed_evaluation_messages,
+    EvaluationPacker,
+    EVALUATION_MODE_ROW,
+    EVALUATION_MODE_PACKED,
+)
+from .llm import estimate_tokens, get_rate_limiter, resolve_model_name
+from .prompts import (
+    build_step_messages,
+    build_conversation_messages,
+    init_row_data,
+    persona_dict_to_string,
+    prepare_baseline_frame,
+    GENERATION_MODE_CONVERSATION,
+)
+from .used_prompts import BASELINE_SYSTEM_PROMPT
+
+# Projections used until completed runs have been observed
+ESTIMATE_GENERATION_OUTPUT_TOKENS = int(os.environ.get("ESTIMATE_GENERATION_OUTPUT_TOKENS", 120))
+ESTIMATE_EVALUATION_OUTPUT_TOKENS = int(os.environ.get("ESTIMATE_EVALUATION_OUTPUT_TOKENS", 40))
+ESTIMATE_CALL_SECONDS = float(os.environ.get("ESTIMATE_CALL_SECONDS", 4.0))
+
+# Usage-history keys
+_GENERATION = "generation"
+
+
+class _OutputHistory:
+    """Exponentially weighted output tokens per unit (generated or scored step), by key."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._averages: Dict[str, float] = {}
+        self._runs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, output_tokens: int, units: int) -> None:
+        # Runs served from the response cache report no usage and would drag the average down
+        if units <= 0 or output_tokens <= 0:
+            return
+        per_unit = output_tokens / units
+        with self._lock:
+            average = self._averages.get(key)
+            self._averages[key] = per_unit if average is None else average + self.alpha * (per_unit - average)
+            self._runs[key] = self._runs.get(key, 0) + 1
+
+    def average(self, key: str, default: int) -> int:
+        with self._lock:
+            average = self._averages.get(key)
+        return max(1, round(average)) if average is not None else default
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                key: {"output_tokens_per_step": round(average, 1), "runs": self._runs[key]}
+                for key, average in self._averages.items()
+            }
+
+
+_history = _OutputHistory()
+
+
+def _evaluation_key(evaluation_mode: str) -> str:
+    return f"evaluation:{evaluation_mode}"
+
+
+def record_run_usage(evaluation_mode: str, prompt_tokens: List[Dict[str, int]], eval_tokens: List[Dict[str, int]], steps_per_row: int) -> None:
+    """Fold a completed run's per-row token usage into the output projections."""
+    units = len(prompt_tokens) * steps_per_row
+    _history.record(_GENERATION, sum(t.get('response_tokens', 0) for t in prompt_tokens), units)
+    _history.record(
+        _evaluation_key(evaluation_mode),
+        sum(t.get('gemini_response_tokens', 0) for t in eval_tokens),
+        len(eval_tokens) * steps_per_row,
+    )
+
+
+def get_estimate_stats() -> Dict[str, Dict[str, float]]:
+    """Observed output tokens per step, by stage."""
+    return _history.stats()
+
+
+def _placeholder(tokens: int) -> str:
+    # estimate_tokens counts ~4 characters per token
+    return "x" * (4 * tokens)
+
+
+def _estimate_generation(df, steps, personas, conversation_mode: bool, response: str) -> Dict[str, int]:
+    steps_by_label = {step['label']: step for step in steps}
+    calls = input_tokens = 0
+    for row_idx, persona in enumerate(personas):
+        persona_str = persona_dict_to_string(persona)
+        row_data, tokens_dict = init_row_data(row_idx, df)
+        prompt_list = []
+        conversation = [] if conversation_mode else None
+        # Mirrors process_row_with_chat, with every response replaced by the placeholder
+        for col_idx, col_name in enumerate(df.columns):
+            step = steps_by_label.get(col_name)
+            if step is None:
+                row_data[col_name] = "No matching instructions found"
+                continue
+            if conversation is not None:
+                messages = build_conversation_messages(
+                    df, steps, BASELINE_SYSTEM_PROMPT, persona_str, prompt_list, conversation, row_data,
+                    col_idx, col_name, step['instructions'], tokens_dict
+                )
+            else:
+                messages = build_step_messages(
+                    df, steps, BASELINE_SYSTEM_PROMPT, persona_str, prompt_list, row_data,
+                    col_idx, col_name, step['instructions']
+                )
+            calls += 1
+            input_tokens += estimate_tokens(messages)
+            row_data[col_name] = response
+            if conversation is not None:
+                conversation.append(AIMessage(content=response))
+    return {"calls": calls, "input_tokens": input_tokens}
+
+
+def _estimate_evaluation(df, steps, rows: int, evaluation_mode: str, response: str) -> Dict[str, int]:
+    # Every row's placeholder response is the same, so per-step requests are built once
+    step_items = [(step['label'], response, step) for step in steps if step['label'] in df.columns]
+    if evaluation_mode == EVALUATION_MODE_ROW:
+        if not step_items:
+            return {"calls": 0, "input_tokens": 0}
+        return {"calls": rows, "input_tokens": rows * estimate_tokens(build_row_evaluation_messages(step_items))}
+
+    calls = input_tokens = 0
+    for label, output, step in step_items:
+        if evaluation_mode == EVALUATION_MODE_PACKED:
+            packer = EvaluationPacker(label, step)
+            packs = [packer.add(row_idx, output) for row_idx in range(rows)] + [packer.flush()]
+            for pack in packs:
+                if pack:
+                    calls += 1
+                    input_tokens += estimate_tokens(build_packed_evaluation_messages(label, step, pack))
+        else:
+            calls += rows
+            input_tokens += rows * estimate_tokens(build_evaluation_messages(label, output, step))
+    return {"calls": calls, "input_tokens": input_tokens}
+
+
+def estimate_simulation(prompt, personas, model_name: str, evaluation_mode: str) -> Dict[str, Any]:
+    """
+    Estimate the LLM calls, tokens and wall-clock time of a simulation run.
+
+    Args:
+        prompt (dict): The /api/evaluate experiment payload (seed, steps, iters, generation_mode)
+        personas (list): Persona for each row, as run_evaluation would pass them
+        model_name (str): Resolved model name
+        evaluation_mode (str): EVALUATION_MODE_STEP, EVALUATION_MODE_ROW or EVALUATION_MODE_PACKED
+
+    Returns:
+        dict: generation and evaluation {calls, input_tokens, output_tokens},
+            duration_seconds, and the assumptions behind them
+    """
+    # prepare_baseline_frame renames repeated step labels in place
+    prompt = copy.deepcopy(prompt)
+    df, selected_personas = prepare_baseline_frame(prompt, {'persona': list(personas)})
+    steps = prompt.get('steps', [])
+    rows = len(selected_personas)
+    scored_steps = sum(1 for step in steps if step['label'] in df.columns)
+
+    generation_output = _history.average(_GENERATION, ESTIMATE_GENERATION_OUTPUT_TOKENS)
+    evaluation_output = _history.average(_evaluation_key(evaluation_mode), ESTIMATE_EVALUATION_OUTPUT_TOKENS)
+    response = _placeholder(generation_output)
+
+    generation = _estimate_generation(
+        df, steps, selected_personas, prompt.get('generation_mode') == GENERATION_MODE_CONVERSATION, response
+    )
+    generation["output_tokens"] = generation["calls"] * generation_output
+    evaluation = _estimate_evaluation(df, steps, rows, evaluation_mode, response)
+    evaluation["output_tokens"] = rows * scored_steps * evaluation_output
+
+    # Each persona's steps run one after another; rows, and evaluation, share the
+    # concurrency limit and the model's rate limits
+    model_name = resolve_model_name(model_name)
+    concurrency = get_concurrency_limiter(model_name).stats()
+    call_seconds = concurrency["latency_baseline_seconds"] or ESTIMATE_CALL_SECONDS
+    rate_limiter = get_rate_limiter(model_name)
+    calls = generation["calls"] + evaluation["calls"]
+    tokens = sum(stage["input_tokens"] + stage["output_tokens"] for stage in (generation, evaluation))
+    duration = max(
+        len(steps) * call_seconds,
+        calls * call_seconds / max(1, concurrency["limit"]),
+        60.0 * calls / max(1, rate_limiter.rpm),
+        60.0 * tokens / max(1, rate_limiter.tpm),
+    )
+    if evaluation["calls"]:
+        # The last generated steps are scored after generation ends
+        duration += call_seconds
+
+    return {
+        "rows": rows,
+        "steps": len(steps),
+        "generation": generation,
+        "evaluation": evaluation,
+        "duration_seconds": round(duration, 1),
+        "assumptions": {
+            "generation_output_tokens_per_step": generation_output,
+            "evaluation_output_tokens_per_step": evaluation_output,
+            "call_seconds": round(call_seconds, 2),
+            "concurrency_limit": concurrency["limit"],
+            "rpm": rate_limiter.rpm,
+            "tpm": rate_limiter.tpm,
+        },
+    }
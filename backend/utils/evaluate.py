@@ -3,21 +3,52 @@ This module provides functionality for evaluating AI model responses using both
 It includes utilities for processing evaluation results and generating Excel reports with detailed metrics.
 """
 
+import io
+import json
 import pandas as pd
-import concurrent.futures
 import os
+import uuid as uuid_lib
 from datetime import datetime
+from typing import Callable, NamedTuple
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
 from supabase import create_client, Client
 
 from langchain_core.messages import SystemMessage, HumanMessage
 
-from .llm import invoke_structured, EvaluationMetrics, get_llm, DEFAULT_MODEL
+from .llm import (
+    invoke_structured,
+    invoke_structured_async,
+    invoke_chat,
+    EvaluationMetrics,
+    RowEvaluationMetrics,
+    PackedEvaluationMetrics,
+    DEFAULT_MODEL,
+    estimate_tokens,
+)
+from .response_cache import CACHE_SITE_EVALUATION, CACHE_SITE_PERSONA
 from .used_prompts import (
     get_persona_generation_user_prompt,
     get_evaluation_system_prompt,
-    get_evaluation_user_prompt
+    get_evaluation_user_prompt,
+    get_row_evaluation_system_prompt,
+    get_row_evaluation_user_prompt,
+    get_packed_evaluation_system_prompt,
+    get_packed_evaluation_user_prompt,
+    get_packed_evaluation_item,
 )
 
+# Evaluation modes: "step" makes one LLM call per (row, step); "row" scores all
+# steps of a persona in a single call; "packed" scores many personas' responses
+# to the same step in one call, filled up to EVAL_PACK_TOKEN_BUDGET input tokens.
+EVALUATION_MODE_STEP = "step"
+EVALUATION_MODE_ROW = "row"
+EVALUATION_MODE_PACKED = "packed"
+
+EVAL_PACK_TOKEN_BUDGET = int(os.environ.get("EVAL_PACK_TOKEN_BUDGET", 8000))
+EVAL_PACK_MAX_ITEMS = int(os.environ.get("EVAL_PACK_MAX_ITEMS", 25))
+
 
 def generate_persona_from_attributes(sample, key_g, supabase_client=None):
     """
@@ -52,8 +83,10 @@ def generate_persona_from_attributes(sample, key_g, supabase_client=None):
     persona_prompt = get_persona_generation_user_prompt(attributes_text)
 
     try:
-        llm = get_llm(DEFAULT_MODEL, temperature=0.7)
-        response = llm.invoke([HumanMessage(content=persona_prompt)])
+        response = invoke_chat(
+            DEFAULT_MODEL, [HumanMessage(content=persona_prompt)], temperature=0.7,
+            cache_site=CACHE_SITE_PERSONA,
+        )
         generated_persona = response.content.strip()
 
         # Update the sample in the database if supabase client is provided
@@ -71,8 +104,6 @@ def generate_persona_from_attributes(sample, key_g, supabase_client=None):
         return sample.get('persona', '')
 
 
-
-
 def extract_unique_measures(steps):
     """
     Extracts all unique measure information from steps data.
@@ -106,157 +137,303 @@ def extract_unique_measures(steps):
     return unique_measures
 
 
-def dataframe_to_excel(df_response, df_gemini, steps=None):
+def build_report_sheets(df_response, df_gemini, steps=None):
     """
-    Converts evaluation results into an Excel file with multiple sheets.
-    
+    Prepares the report's sheets: simulation steps, personas, responses and metrics,
+    all sorted by persona number.
+
     Args:
         df_response (pd.DataFrame): Original response dataframe
         df_gemini (pd.DataFrame): Gemini evaluation results
         steps (list): List of step dictionaries containing 'label' and 'instructions' keys
-        
+
     Returns:
-        str: Filename of the generated Excel file
+        list: (sheet_name, DataFrame) tuples in workbook order
     """
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    fn = f'multiple_sheets_{timestamp}.xlsx'
-
-    with pd.ExcelWriter(fn, engine='openpyxl') as writer:
-        # Add simulation steps as the first sheet if steps are provided
-        if steps:
-            steps_data = []
-            for step in steps:
-                step_info = {
-                    'label': step['label'], 
-                    'instructions': step['instructions'],
-                    'temperature': step.get('temperature', 'N/A')
-                }
-                # Add measures information
-                measures_info = []
-                for measure in step.get('measures', []):
-                    measures_info.append(f"{measure['title']}: {measure['description']} (Range: {measure['range']})")
-                step_info['measures'] = '; '.join(measures_info)
-                steps_data.append(step_info)
-            
-            steps_df = pd.DataFrame(steps_data)
-            steps_df.to_excel(writer, sheet_name='Simulation Steps', index=False)
-        
-        # Determine sort order based on persona "number" field
-        sort_indices = None
-        if 'persona' in df_response.columns:
-            # Extract persona numbers and create sort order
-            persona_numbers = []
-            for idx in range(len(df_response)):
-                persona = df_response.iloc[idx]['persona']
-                if isinstance(persona, dict) and 'number' in persona:
-                    persona_numbers.append((idx, persona['number']))
-                else:
-                    # If no number field, use index + 1 as fallback
-                    persona_numbers.append((idx, idx + 1))
-            
-            # Sort by number and get the sorted indices
-            persona_numbers.sort(key=lambda x: x[1])
-            sort_indices = [x[0] for x in persona_numbers]
-        
-        # Sort dataframes by persona number order
-        if sort_indices:
-            df_response_sorted = df_response.iloc[sort_indices].reset_index(drop=True)
-            if not df_gemini.empty and len(df_gemini) == len(df_response):
-                df_gemini_sorted = df_gemini.iloc[sort_indices].reset_index(drop=True)
+    sheets = []
+    # Add simulation steps as the first sheet if steps are provided
+    if steps:
+        steps_data = []
+        for step in steps:
+            step_info = {
+                'label': step['label'], 
+                'instructions': step['instructions'],
+                'temperature': step.get('temperature', 'N/A')
+            }
+            # Add measures information
+            measures_info = []
+            for measure in step.get('measures', []):
+                measures_info.append(f"{measure['title']}: {measure['description']} (Range: {measure['range']})")
+            step_info['measures'] = '; '.join(measures_info)
+            steps_data.append(step_info)
+
+        steps_df = pd.DataFrame(steps_data)
+        sheets.append(('Simulation Steps', steps_df))
+
+    # Determine sort order based on persona "number" field
+    sort_indices = None
+    if 'persona' in df_response.columns:
+        # Extract persona numbers and create sort order
+        persona_numbers = []
+        for idx in range(len(df_response)):
+            persona = df_response.iloc[idx]['persona']
+            if isinstance(persona, dict) and 'number' in persona:
+                persona_numbers.append((idx, persona['number']))
             else:
-                df_gemini_sorted = df_gemini.copy()
+                # If no number field, use index + 1 as fallback
+                persona_numbers.append((idx, idx + 1))
+
+        # Sort by number and get the sorted indices
+        persona_numbers.sort(key=lambda x: x[1])
+        sort_indices = [x[0] for x in persona_numbers]
+
+    # Sort dataframes by persona number order
+    if sort_indices:
+        df_response_sorted = df_response.iloc[sort_indices].reset_index(drop=True)
+        if not df_gemini.empty and len(df_gemini) == len(df_response):
+            df_gemini_sorted = df_gemini.iloc[sort_indices].reset_index(drop=True)
         else:
-            df_response_sorted = df_response.copy()
             df_gemini_sorted = df_gemini.copy()
-        
-        # Create Personas sheet
-        personas_data = []
-        all_keys = set()
-        
-        if 'persona' in df_response_sorted.columns:
-            # First pass: collect all unique keys from all personas (excluding 'number')
-            for idx in range(len(df_response_sorted)):
-                persona = df_response_sorted.iloc[idx]['persona']
-                if isinstance(persona, dict):
-                    # Collect all keys except 'number' since we'll remove it from display
-                    keys = {k for k in persona.keys() if k != 'number'}
-                    all_keys.update(keys)
-            
-            # Second pass: build rows with all columns
-            for idx in range(len(df_response_sorted)):
-                persona = df_response_sorted.iloc[idx]['persona']
-                row = {'ID': idx + 1}
-                
-                if isinstance(persona, dict):
-                    # Add each attribute as its own column (excluding 'number')
-                    for key in all_keys:
-                        row[key] = persona.get(key, 'N/A')
-                else:
-                    # If persona is not a dict, put it in a single column
-                    row['Persona'] = str(persona) if persona else 'N/A'
-                
-                personas_data.append(row)
-        
-        if personas_data:
-            # Ensure consistent column order: ID first, then sorted attribute keys (excluding 'number')
-            if all_keys:
-                column_order = ['ID'] + sorted(all_keys)
-                personas_df = pd.DataFrame(personas_data)
-                # Reorder columns to match desired order
-                personas_df = personas_df.reindex(columns=column_order, fill_value='N/A')
+    else:
+        df_response_sorted = df_response.copy()
+        df_gemini_sorted = df_gemini.copy()
+
+    # Create Personas sheet
+    personas_data = []
+    all_keys = set()
+
+    if 'persona' in df_response_sorted.columns:
+        # First pass: collect all unique keys from all personas (excluding 'number')
+        for idx in range(len(df_response_sorted)):
+            persona = df_response_sorted.iloc[idx]['persona']
+            if isinstance(persona, dict):
+                # Collect all keys except 'number' since we'll remove it from display
+                keys = {k for k in persona.keys() if k != 'number'}
+                all_keys.update(keys)
+
+        # Second pass: build rows with all columns
+        for idx in range(len(df_response_sorted)):
+            persona = df_response_sorted.iloc[idx]['persona']
+            row = {'ID': idx + 1}
+
+            if isinstance(persona, dict):
+                # Add each attribute as its own column (excluding 'number')
+                for key in all_keys:
+                    row[key] = persona.get(key, 'N/A')
             else:
-                personas_df = pd.DataFrame(personas_data)
-            personas_df.to_excel(writer, sheet_name='Personas', index=False)
-        
-        # Add ID column to responses sheet (1-10, matching persona index)
-        # Remove persona column from Responses sheet (it's in Personas sheet)
-        df_response_with_id = df_response_sorted.copy()
-        if 'persona' in df_response_with_id.columns:
-            df_response_with_id = df_response_with_id.drop(columns=['persona'])
-        df_response_with_id.insert(0, 'ID', range(1, len(df_response_sorted) + 1))
-        df_response_with_id.to_excel(writer, sheet_name='Responses', index=False)
-        
-        # Add ID column to metrics sheet (1-10, matching persona index)
-        # Unwrap single-element list cells so numbers display without brackets
-        if not df_gemini_sorted.empty:
-            df_gemini_with_id = df_gemini_sorted.copy()
-            df_gemini_with_id.insert(0, 'ID', range(1, len(df_gemini_sorted) + 1))
-            for col in df_gemini_with_id.columns:
-                if col == 'ID':
-                    continue
-                df_gemini_with_id[col] = df_gemini_with_id[col].apply(
-                    lambda x: x[0] if isinstance(x, list) and len(x) > 0 else x
-                )
-            df_gemini_with_id.to_excel(writer, sheet_name='Metrics', index=False)
-    
-    return fn
+                # If persona is not a dict, put it in a single column
+                row['Persona'] = str(persona) if persona else 'N/A'
+
+            personas_data.append(row)
+
+    if personas_data:
+        # Ensure consistent column order: ID first, then sorted attribute keys (excluding 'number')
+        if all_keys:
+            column_order = ['ID'] + sorted(all_keys)
+            personas_df = pd.DataFrame(personas_data)
+            # Reorder columns to match desired order
+            personas_df = personas_df.reindex(columns=column_order, fill_value='N/A')
+        else:
+            personas_df = pd.DataFrame(personas_data)
+        sheets.append(('Personas', personas_df))
+
+    # Add ID column to responses sheet (1-10, matching persona index)
+    # Remove persona column from Responses sheet (it's in Personas sheet)
+    df_response_with_id = df_response_sorted.copy()
+    if 'persona' in df_response_with_id.columns:
+        df_response_with_id = df_response_with_id.drop(columns=['persona'])
+    df_response_with_id.insert(0, 'ID', range(1, len(df_response_sorted) + 1))
+    sheets.append(('Responses', df_response_with_id))
+
+    # Add ID column to metrics sheet (1-10, matching persona index)
+    # Unwrap single-element list cells so numbers display without brackets
+    if not df_gemini_sorted.empty:
+        df_gemini_with_id = df_gemini_sorted.copy()
+        df_gemini_with_id.insert(0, 'ID', range(1, len(df_gemini_sorted) + 1))
+        for col in df_gemini_with_id.columns:
+            if col == 'ID':
+                continue
+            df_gemini_with_id[col] = df_gemini_with_id[col].apply(
+                lambda x: x[0] if isinstance(x, list) and len(x) > 0 else x
+            )
+        sheets.append(('Metrics', df_gemini_with_id))
+
+    return sheets
+
+
+def _excel_value(value):
+    # Same conversions pandas applies when writing cells: blanks for missing
+    # values, native Python scalars, and str() for anything else (lists, dicts)
+    if value is None:
+        return None
+    if isinstance(value, (list, dict, tuple, set)):
+        return str(value)
+    if pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    return str(value)
+
+
+def dataframe_to_excel_bytes(df_response, df_gemini, steps=None):
+    """
+    Builds the Excel report in memory with openpyxl's write-only workbook.
 
+    Rows are streamed straight into the sheet XML instead of being held as cell
+    objects, so memory stays flat as the number of personas grows.
+
+    Args:
+        df_response (pd.DataFrame): Original response dataframe
+        df_gemini (pd.DataFrame): Gemini evaluation results
+        steps (list): List of step dictionaries containing 'label' and 'instructions' keys
 
-def process_row(row_idx, df_row, steps, model_name, progress_callback=None):
+    Returns:
+        bytes: Contents of the .xlsx file
     """
-    Processes a single row by evaluating responses using Gemini model.
-    
+    workbook = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    header_border = Border(
+        left=Side(style='thin'), right=Side(style='thin'),
+        top=Side(style='thin'), bottom=Side(style='thin'),
+    )
+    header_alignment = Alignment(horizontal='center', vertical='top')
+
+    for sheet_name, sheet_df in build_report_sheets(df_response, df_gemini, steps):
+        worksheet = workbook.create_sheet(title=sheet_name)
+        header = []
+        for column in sheet_df.columns:
+            cell = WriteOnlyCell(worksheet, value=_excel_value(column))
+            cell.font = header_font
+            cell.border = header_border
+            cell.alignment = header_alignment
+            header.append(cell)
+        worksheet.append(header)
+        for row in sheet_df.itertuples(index=False, name=None):
+            worksheet.append([_excel_value(value) for value in row])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _numeric_metric(value):
+    # Metric cells hold a score or an error marker such as 'API Error'
+    if isinstance(value, list):
+        value = value[0] if value else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def dataframe_to_parquet_bytes(df_response, df_gemini, steps=None):
+    """
+    Builds a columnar copy of the results as a zstd-compressed Parquet file.
+
+    One row per persona, in the same order and with the same IDs as the Excel
+    report. Columns are "ID", "persona.<attribute>" (strings), "response.<step>"
+    (strings) and "metric.<step>_<measure>" (float64; error markers become null).
+    The steps are stored as JSON in the file's "steps" metadata key.
+
+    Requires pyarrow; raises ImportError when it is not installed.
+
+    Returns:
+        bytes: Contents of the .parquet file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sheets = dict(build_report_sheets(df_response, df_gemini, steps))
+    columns = {}
+    responses = sheets['Responses']
+    columns['ID'] = pa.array(responses['ID'].tolist(), type=pa.int32())
+
+    personas = sheets.get('Personas')
+    if personas is not None:
+        for col in personas.columns:
+            if col == 'ID':
+                continue
+            columns[f'persona.{col}'] = pa.array(
+                [None if _excel_value(v) is None else str(v) for v in personas[col]], type=pa.string()
+            )
+
+    for col in responses.columns:
+        if col == 'ID':
+            continue
+        columns[f'response.{col}'] = pa.array(
+            [None if _excel_value(v) is None else str(v) for v in responses[col]], type=pa.string()
+        )
+
+    metrics = sheets.get('Metrics')
+    if metrics is not None and len(metrics) == len(responses):
+        for col in metrics.columns:
+            if col == 'ID':
+                continue
+            columns[f'metric.{col}'] = pa.array(
+                [_numeric_metric(v) for v in metrics[col]], type=pa.float64()
+            )
+
+    table = pa.table(columns).replace_schema_metadata({'steps': json.dumps(steps or [])})
+    buffer = pa.BufferOutputStream()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue().to_pybytes()
+
+
+def report_filename(extension='xlsx'):
+    """Unique report name; the random suffix keeps runs finishing in the same second apart."""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return f'multiple_sheets_{timestamp}_{uuid_lib.uuid4().hex[:8]}.{extension}'
+
+
+def build_step_measures_prompt(current_measures):
+    """
+    Builds the measure sections of the evaluation system prompt for one step.
+
     Args:
-        row_idx (int): Index of the row being processed
-        df_row (pd.Series): Row of data to evaluate
-        steps (list): List of step dictionaries containing measures
-        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
-        progress_callback (callable, optional): Called after each column completes for progress tracking
-        
+        current_measures (list): Measure dictionaries for the step
+
     Returns:
-        tuple: Contains:
-            - dict: Gemini evaluation scores
-            - dict: Token usage statistics
+        str: Markdown block describing each measure, its range and reference points
+    """
+    measures = ""
+    for measure in current_measures:
+        range_str = measure['range']
+        # Parse range to extract min and max (e.g., "0 - 10" or "1-5")
+        try:
+            if ' - ' in range_str:
+                min_val, max_val = map(float, range_str.split(' - '))
+            elif '-' in range_str:
+                min_val, max_val = map(float, range_str.split('-'))
+            else:
+                min_val, max_val = 0, 10  # Default fallback
+        except:
+            min_val, max_val = 0, 10  # Default fallback
+
+        measures += f"\n### {measure['title']}\n"
+        measures += f"**Description:** {measure['description']}\n"
+        measures += f"**Range:** {measure['range']} (minimum: {min_val}, maximum: {max_val})\n"
+        if measure.get('desiredValues'):
+            measures += f"**Scoring Reference Points:**\n"
+            for desiredValue in measure['desiredValues']:
+                measures += f"  - {desiredValue['label']}: Use value {desiredValue['value']} as an anchor point for this quality level\n"
+        else:
+            measures += f"**Scoring:** Use the full range from {min_val} to {max_val} based on quality\n"
+    return measures
+
+
+def init_row_scores(steps):
     """
+    Creates the empty score layout for one row: one list per step/measure pair.
 
-    row_scores = {}
-    all_token_usage = {
-        'gemini_prompt_tokens': 0,
-        'gemini_response_tokens': 0,
-        'gemini_total_tokens': 0,
-    }
+    Args:
+        steps (list): List of step dictionaries containing measures
 
-    # Initialize row_scores with all possible metrics
+    Returns:
+        dict: Mapping of "<step label>_<measure title>" to an empty list
+    """
+    row_scores = {}
     if steps:
         for step_idx, step in enumerate(steps):
             step_label = step.get('label', f'Step_{step_idx + 1}')
@@ -264,181 +441,391 @@ def process_row(row_idx, df_row, steps, model_name, progress_callback=None):
             for measure in measures:
                 step_metric_name = f"{step_label}_{measure.get('title', '')}"
                 row_scores[step_metric_name] = []
-    
-    # Process each column individually
-    print(f"[process_row {row_idx}] len(df_row)={len(df_row)}, has_callback={progress_callback is not None}", flush=True)
-    for col in range(1, len(df_row)):
-        step_label = df_row.index[col]
-        step_output = df_row.iloc[col]  # This is the actual output/response
-        
-        # Get the step index (col - 1 because first column is usually ID)
-        step_idx = col - 1
-        
-        if step_idx < len(steps):
-            current_step = steps[step_idx]
-            current_measures = current_step.get('measures', [])
-            step_instructions = current_step.get('instructions', '')  # Get actual step instructions from steps
-            
-            # Build measures string for this specific step only with detailed scoring guidance
-            measures = ""
-            for measure in current_measures:
-                range_str = measure['range']
-                # Parse range to extract min and max (e.g., "0 - 10" or "1-5")
-                try:
-                    if ' - ' in range_str:
-                        min_val, max_val = map(float, range_str.split(' - '))
-                    elif '-' in range_str:
-                        min_val, max_val = map(float, range_str.split('-'))
-                    else:
-                        min_val, max_val = 0, 10  # Default fallback
-                except:
-                    min_val, max_val = 0, 10  # Default fallback
-                
-                measures += f"\n### {measure['title']}\n"
-                measures += f"**Description:** {measure['description']}\n"
-                measures += f"**Range:** {measure['range']} (minimum: {min_val}, maximum: {max_val})\n"
-                if measure.get('desiredValues'):
-                    measures += f"**Scoring Reference Points:**\n"
-                    for desiredValue in measure['desiredValues']:
-                        measures += f"  - {desiredValue['label']}: Use value {desiredValue['value']} as an anchor point for this quality level\n"
-                else:
-                    measures += f"**Scoring:** Use the full range from {min_val} to {max_val} based on quality\n"
-            
-            # Create user prompt for this specific step
-            step_measures_list = ""
-            for idx, measure in enumerate(current_measures):
-                step_measures_list += f"{idx + 1}. {measure['title']}\n"
-            
-            user_prompt = get_evaluation_user_prompt(step_label, step_instructions, step_output, step_measures_list)
-            
-            # Create system prompt with only relevant measures for this step
-            system_prompt = get_evaluation_system_prompt(measures)
-            
-            try:
-                # Invoke LLM with structured output via LangChain
-                messages = [
-                    SystemMessage(content=system_prompt),
-                    HumanMessage(content=user_prompt),
-                ]
-                parsed, usage = invoke_structured(
-                    model_name, EvaluationMetrics, messages, temperature=1.0
-                )
-
-                # Track token usage
-                all_token_usage['gemini_prompt_tokens'] += usage['input_tokens']
-                all_token_usage['gemini_response_tokens'] += usage['output_tokens']
-                all_token_usage['gemini_total_tokens'] += usage['total_tokens']
-
-                # Process scores for this step's measures
-                for idx, measure in enumerate(current_measures):
-                    step_metric_name = f"{step_label}_{measure.get('title', '')}"
-
-                    if step_metric_name in row_scores:
-                        try:
-                            if parsed is not None and idx < len(parsed.score):
-                                row_scores[step_metric_name].append(parsed.score[idx])
-                            else:
-                                row_scores[step_metric_name].append('Poorly Defined Criteria')
-                        except (IndexError, KeyError):
-                            row_scores[step_metric_name].append('Error in scoring')
+    return row_scores
 
-            except Exception:
-                # Add error scores for this step's measures
-                for measure in current_measures:
-                    step_metric_name = f"{step_label}_{measure.get('title', '')}"
-                    if step_metric_name in row_scores:
-                        row_scores[step_metric_name].append('API Error')
 
-        if progress_callback:
-            progress_callback()
+def build_evaluation_messages(step_label, step_output, step):
+    """
+    Builds the system and user messages that score one step output.
+
+    Args:
+        step_label (str): Column label of the step being evaluated
+        step_output (str): The response produced for the step
+        step (dict): Step dictionary containing 'instructions' and 'measures'
+
+    Returns:
+        list: [SystemMessage, HumanMessage]
+    """
+    current_measures = step.get('measures', [])
+    step_instructions = step.get('instructions', '')  # Get actual step instructions from steps
+
+    # Build measures string for this specific step only with detailed scoring guidance
+    measures = build_step_measures_prompt(current_measures)
+
+    # Create user prompt for this specific step
+    step_measures_list = ""
+    for idx, measure in enumerate(current_measures):
+        step_measures_list += f"{idx + 1}. {measure['title']}\n"
+
+    user_prompt = get_evaluation_user_prompt(step_label, step_instructions, step_output, step_measures_list)
+
+    # Create system prompt with only relevant measures for this step
+    system_prompt = get_evaluation_system_prompt(measures)
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt),
+    ]
+
+
+def scores_from_parsed(step_label, current_measures, parsed):
+    """
+    Maps a parsed EvaluationMetrics response onto "<step label>_<measure title>" keys.
+
+    Args:
+        step_label (str): Column label of the evaluated step
+        current_measures (list): Measure dictionaries for the step, in prompt order
+        parsed (EvaluationMetrics or None): Structured response (None if parsing failed)
+
+    Returns:
+        dict: Score or error marker per metric name
+    """
+    scores = {}
+    for idx, measure in enumerate(current_measures):
+        step_metric_name = f"{step_label}_{measure.get('title', '')}"
+        try:
+            if parsed is not None and idx < len(parsed.score):
+                scores[step_metric_name] = parsed.score[idx]
+            else:
+                scores[step_metric_name] = 'Poorly Defined Criteria'
+        except (IndexError, KeyError):
+            scores[step_metric_name] = 'Error in scoring'
+    return scores
+
+
+# Marker for measures whose evaluation call failed (retried on resume)
+API_ERROR_SCORE = 'API Error'
+
+
+def error_scores(step_label, current_measures, marker=API_ERROR_SCORE):
+    """Returns the same marker for every measure of a step."""
+    return {f"{step_label}_{measure.get('title', '')}": marker for measure in current_measures}
+
+
+def scores_for_step(scores, step_label, step):
+    """Picks one step's metrics out of a row-batched scores dict."""
+    names = (f"{step_label}_{measure.get('title', '')}" for measure in step.get('measures', []))
+    return {name: scores[name] for name in names if name in scores}
+
 
-    # If row had no step columns (only persona), still report completion
-    if progress_callback and len(df_row) <= 1:
-        progress_callback()
+_NO_USAGE = {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0}
+
+
+class _EvaluationCall(NamedTuple):
+    """One structured evaluation request, shared by the sync and asyncio evaluators."""
+    schema: type
+    messages: list
+    # on_result(parsed, usage) and on_error() both build the evaluator's return value
+    on_result: Callable
+    on_error: Callable
+
+
+def _run_evaluation(call, model_name):
+    try:
+        # Invoke LLM with structured output via LangChain
+        parsed, usage = invoke_structured(
+            model_name, call.schema, call.messages, temperature=1.0,
+            cache_site=CACHE_SITE_EVALUATION,
+        )
+    except Exception:
+        # Error markers for the scored measures
+        return call.on_error()
+    return call.on_result(parsed, usage)
 
-    return row_scores, None, all_token_usage
 
-def evaluate(df, model_name, steps=None, progress_callback=None):
+async def _run_evaluation_async(call, model_name):
+    try:
+        parsed, usage = await invoke_structured_async(
+            model_name, call.schema, call.messages, temperature=1.0,
+            cache_site=CACHE_SITE_EVALUATION,
+        )
+    except Exception:
+        return call.on_error()
+    return call.on_result(parsed, usage)
+
+
+def _step_call(step_label, step_output, step):
+    current_measures = step.get('measures', [])
+    return _EvaluationCall(
+        EvaluationMetrics,
+        build_evaluation_messages(step_label, step_output, step),
+        lambda parsed, usage: (scores_from_parsed(step_label, current_measures, parsed), usage),
+        lambda: (error_scores(step_label, current_measures), dict(_NO_USAGE)),
+    )
+
+
+def evaluate_step(step_label, step_output, step, model_name):
     """
-    Evaluates multiple rows in parallel using threading and combines the results into a DataFrame.
+    Scores a single step output against that step's measures.
 
     Args:
-        df (pd.DataFrame): Input dataframe containing responses to evaluate
+        step_label (str): Column label of the step being evaluated
+        step_output (str): The response produced for the step
+        step (dict): Step dictionary containing 'instructions' and 'measures'
         model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
-        steps (list): List of step dictionaries containing 'label', 'instructions', and 'measures' keys
-        progress_callback (callable, optional): Called after each row completes for progress tracking
 
     Returns:
         tuple: Contains:
-            - str: Filename of the generated Excel report
-            - list: List of token usage statistics for each row
+            - dict: Score (or error marker) per "<step label>_<measure title>"
+            - dict: Token usage with input_tokens, output_tokens and total_tokens
     """
+    return _run_evaluation(_step_call(step_label, step_output, step), model_name)
+
+
+async def evaluate_step_async(step_label, step_output, step, model_name):
+    """
+    Asyncio version of evaluate_step.
+
+    Returns:
+        tuple: (scores, usage), as evaluate_step
+    """
+    return await _run_evaluation_async(_step_call(step_label, step_output, step), model_name)
 
-    if steps:
-        all_metrics_to_evaluate = []
-        
-        for step_idx, step in enumerate(steps):
-            step_label = step.get('label', f'Step_{step_idx + 1}')
-            measures = step.get('measures', [])
-            
-            for measure_idx, measure in enumerate(measures):
-                measure_title = measure.get('title', '')
-                
-                # Create step-specific metric name
-                step_metric_name = f"{step_label}_{measure_title}"
-                measure_obj = {
-                    'name': step_metric_name,
-                    'description': measure.get('description', ''),
-                    'range': measure.get('range', '1-5'),
-                    'desiredValues': measure.get('desiredValues', [])
-                }
-                all_metrics_to_evaluate.append(measure_obj)
-        
-        metrics_to_evaluate = [m["name"] for m in all_metrics_to_evaluate]
-        metric_description = {m["name"]: m["description"] for m in all_metrics_to_evaluate}
-    else:
-        metrics_to_evaluate = []
-        metric_description = {}
-
-    # No need to build system prompt here - it will be built per column in process_row
-
-    # Total work units = rows * columns per row (each column is a Gemini API call)
-    num_cols_per_row = max(1, df.shape[1] - 1)  # exclude first column (seed/persona)
-    total_units = df.shape[0] * num_cols_per_row
-
-    # Debug: verify we have work to do and callback is passed
-    print(f"[evaluate] df.shape={df.shape}, total_units={total_units}, has_callback={progress_callback is not None}", flush=True)
-
-    # Process rows in parallel using ThreadPoolExecutor
-    # progress_callback is called per column inside process_row for more frequent updates
-    max_workers = 2
-    results_gemini = []
-    results_gpt4 = []
-    tokens_ls = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(process_row, idx, df.iloc[idx], steps, model_name, progress_callback): idx
-            for idx in range(df.shape[0])
-        }
-
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                result = future.result()
-                results_gemini.append(result[0])
-                # Handle None GPT-4 results since evaluation is commented out
-                gpt4_result = result[1]
-                if gpt4_result is not None:
-                    results_gpt4.append(gpt4_result)
-                tokens_ls.append(result[2])
-            except Exception:
-                pass
 
-    # Convert results to DataFrames
+def build_row_evaluation_messages(step_items):
+    """
+    Builds one request that scores every step of a persona row.
+
+    Args:
+        step_items (list): (step_label, step_output, step) tuples in column order
 
-    results_df_gemini = pd.DataFrame(results_gemini)
-    # Create empty DataFrame for GPT-4 since evaluation is commented out
+    Returns:
+        list: [SystemMessage, HumanMessage]
+    """
+    measures_by_step = ""
+    step_sections = []
+    for step_label, step_output, step in step_items:
+        current_measures = step.get('measures', [])
+        measures_by_step += f"\n## Step: {step_label}\n"
+        measures_by_step += build_step_measures_prompt(current_measures)
+
+        step_measures_list = ""
+        for idx, measure in enumerate(current_measures):
+            step_measures_list += f"{idx + 1}. {measure['title']}\n"
+        step_sections.append({
+            'label': step_label,
+            'instructions': step.get('instructions', ''),
+            'output': step_output,
+            'measures_list': step_measures_list,
+        })
+
+    return [
+        SystemMessage(content=get_row_evaluation_system_prompt(measures_by_step)),
+        HumanMessage(content=get_row_evaluation_user_prompt(step_sections)),
+    ]
+
+
+def scores_from_row_parsed(step_items, parsed):
+    """
+    Splits a RowEvaluationMetrics response back into per-metric scores.
 
-    # Generate Excel report
-    excel_file = dataframe_to_excel(df, results_df_gemini, steps)
+    Entries are matched to steps by title, falling back to position when the
+    model did not echo a title exactly.
 
-    return excel_file, tokens_ls
+    Returns:
+        dict: Score or error marker per "<step label>_<measure title>"
+    """
+    entries = list(parsed.steps) if parsed is not None else []
+    by_label = {entry.step.strip(): entry for entry in entries}
+
+    scores = {}
+    for idx, (step_label, _, step) in enumerate(step_items):
+        entry = by_label.get(str(step_label).strip())
+        if entry is None and len(entries) == len(step_items):
+            entry = entries[idx]
+        scores.update(scores_from_parsed(step_label, step.get('measures', []), entry))
+    return scores
+
+
+def _row_call(step_items):
+    def on_error():
+        scores = {}
+        for step_label, _, step in step_items:
+            scores.update(error_scores(step_label, step.get('measures', [])))
+        return scores, dict(_NO_USAGE)
+
+    return _EvaluationCall(
+        RowEvaluationMetrics,
+        build_row_evaluation_messages(step_items),
+        lambda parsed, usage: (scores_from_row_parsed(step_items, parsed), usage),
+        on_error,
+    )
+
+
+def evaluate_row_batched(step_items, model_name):
+    """
+    Scores all steps of one persona row with a single structured LLM call.
+
+    Args:
+        step_items (list): (step_label, step_output, step) tuples in column order
+        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
+
+    Returns:
+        tuple: (scores, usage), as evaluate_step but covering every step
+    """
+    if not step_items:
+        return {}, dict(_NO_USAGE)
+    return _run_evaluation(_row_call(step_items), model_name)
+
+
+async def evaluate_row_batched_async(step_items, model_name):
+    """
+    Asyncio version of evaluate_row_batched.
+
+    Returns:
+        tuple: (scores, usage)
+    """
+    if not step_items:
+        return {}, dict(_NO_USAGE)
+    return await _run_evaluation_async(_row_call(step_items), model_name)
+
+
+class EvaluationPacker:
+    """
+    Groups responses to one step into packed evaluation requests.
+
+    Items are added in arrival order and a pack is released as soon as the next
+    item would push the request past token_budget (estimated input tokens,
+    including the rubric) or max_items. A single oversized item still gets a
+    pack of its own.
+    """
+
+    def __init__(self, step_label, step, token_budget=None, max_items=None):
+        self.step_label = step_label
+        self.step = step
+        self.token_budget = token_budget or EVAL_PACK_TOKEN_BUDGET
+        self.max_items = max_items or EVAL_PACK_MAX_ITEMS
+        # Everything in the request except the responses themselves
+        self.fixed_tokens = estimate_tokens(build_packed_evaluation_messages(step_label, step, []))
+        self._items = []
+        self._tokens = self.fixed_tokens
+
+    def add(self, row_idx, step_output):
+        """Add a response; returns a full pack [(row_idx, output), ...] when one is ready."""
+        item_tokens = estimate_tokens([get_packed_evaluation_item(len(self._items) + 1, step_output)])
+        ready = None
+        if self._items and (
+            self._tokens + item_tokens > self.token_budget or len(self._items) >= self.max_items
+        ):
+            ready = self.flush()
+        self._items.append((row_idx, step_output))
+        self._tokens += item_tokens
+        return ready
+
+    def flush(self):
+        """Release whatever is buffered (or None if empty)."""
+        if not self._items:
+            return None
+        pack, self._items, self._tokens = self._items, [], self.fixed_tokens
+        return pack
+
+
+def build_packed_evaluation_messages(step_label, step, pack):
+    """
+    Builds one request that scores every response in pack against the step's measures.
+
+    Args:
+        step_label (str): Column label of the step being evaluated
+        step (dict): Step dictionary containing 'instructions' and 'measures'
+        pack (list): (row_idx, step_output) tuples; responses are numbered 1..N in this order
+
+    Returns:
+        list: [SystemMessage, HumanMessage]
+    """
+    current_measures = step.get('measures', [])
+    step_measures_list = ""
+    for idx, measure in enumerate(current_measures):
+        step_measures_list += f"{idx + 1}. {measure['title']}\n"
+
+    responses = "".join(
+        get_packed_evaluation_item(item_number, step_output)
+        for item_number, (_, step_output) in enumerate(pack, start=1)
+    )
+    user_prompt = get_packed_evaluation_user_prompt(
+        step_label, step.get('instructions', ''), responses, step_measures_list
+    )
+    system_prompt = get_packed_evaluation_system_prompt(build_step_measures_prompt(current_measures))
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt),
+    ]
+
+
+def split_usage(usage, n):
+    # Spread one call's token usage over the n units it scored so per-unit totals still add up
+    shares = [dict(_NO_USAGE) for _ in range(n)]
+    for key in _NO_USAGE:
+        base, extra = divmod(usage.get(key, 0), n)
+        for i in range(n):
+            shares[i][key] = base + (1 if i < extra else 0)
+    return shares
+
+
+def scores_from_packed_parsed(step_label, current_measures, pack, parsed):
+    """
+    Splits a PackedEvaluationMetrics response back into per-row scores by item number.
+
+    Returns:
+        dict: row_idx -> {"<step label>_<measure title>": score or error marker}
+    """
+    by_item = {}
+    if parsed is not None:
+        for entry in parsed.items:
+            # First answer for an item wins; duplicates are ignored rather than mixed
+            by_item.setdefault(entry.item, entry)
+    return {
+        row_idx: scores_from_parsed(step_label, current_measures, by_item.get(item_number))
+        for item_number, (row_idx, _) in enumerate(pack, start=1)
+    }
+
+
+def _packed_call(step_label, step, pack):
+    current_measures = step.get('measures', [])
+    rows = [row_idx for row_idx, _ in pack]
+
+    def by_row(scores_by_row, usage):
+        return scores_by_row, dict(zip(rows, split_usage(usage, len(pack))))
+
+    return _EvaluationCall(
+        PackedEvaluationMetrics,
+        build_packed_evaluation_messages(step_label, step, pack),
+        lambda parsed, usage: by_row(scores_from_packed_parsed(step_label, current_measures, pack, parsed), usage),
+        lambda: by_row({row_idx: error_scores(step_label, current_measures) for row_idx in rows}, dict(_NO_USAGE)),
+    )
+
+
+def evaluate_step_packed(step_label, step, pack, model_name):
+    """
+    Scores several rows' responses to one step in a single structured LLM call.
+
+    Args:
+        step_label (str): Column label of the step being evaluated
+        step (dict): Step dictionary containing 'instructions' and 'measures'
+        pack (list): (row_idx, step_output) tuples from EvaluationPacker
+        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
+
+    Returns:
+        tuple: (scores_by_row, usage_by_row), both keyed by row_idx
+    """
+    return _run_evaluation(_packed_call(step_label, step, pack), model_name)
+
+
+async def evaluate_step_packed_async(step_label, step, pack, model_name):
+    """
+    Asyncio version of evaluate_step_packed.
+
+    Returns:
+        tuple: (scores_by_row, usage_by_row)
+    """
+    return await _run_evaluation_async(_packed_call(step_label, step, pack), model_name)
@@ -0,0 +1,170 @@
+"""
+In-process registry of experiment progress/status.
+
+run_evaluation and the progress updater publish every progress, status and
+url change here as they write it to Supabase, so readers in the same process
+(the SSE progress stream) can wait for changes instead of polling the
+experiments table. ProgressReadCache keeps short-lived copies of polled rows
+and is refreshed by the same publishes.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Experiment fields tracked by the registry
+STATE_FIELDS = ("progress", "status", "url")
+
+# Statuses after which an experiment no longer changes
+TERMINAL_STATUSES = ("completed", "failed", "stopped")
+
+
+def is_terminal(state: Optional[Dict[str, Any]]) -> bool:
+    """True when the state's status is Completed, Failed or Stopped."""
+    return bool(state) and str(state.get("status") or "").lower() in TERMINAL_STATUSES
+
+
+class ExperimentStateRegistry:
+    """
+    Thread-safe map of experiment_id -> latest {progress, status, url}.
+
+    Every change bumps a per-experiment version number; wait() blocks until
+    the version moves past the one a reader last saw. Finished experiments are
+    forgotten retention_seconds after their last update.
+    """
+
+    def __init__(self, retention_seconds: float = 600.0):
+        self.retention_seconds = retention_seconds
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._updated: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Call listener(experiment_id, changes) after every published change."""
+        self._listeners.append(listener)
+
+    def publish(self, experiment_id: str, fields: Dict[str, Any]) -> None:
+        """Merge the tracked fields of an experiments-table update into the registry."""
+        changes = {k: v for k, v in fields.items() if k in STATE_FIELDS}
+        if not changes:
+            return
+        with self._cond:
+            state = self._states.setdefault(experiment_id, {})
+            if all(state.get(k) == v for k, v in changes.items()):
+                return
+            state.update(changes)
+            self._versions[experiment_id] = self._versions.get(experiment_id, 0) + 1
+            self._updated[experiment_id] = time.time()
+            self._prune()
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener(experiment_id, changes)
+
+    def seed(self, experiment_id: str, fields: Dict[str, Any]) -> None:
+        """Record a state read from the database without overriding newer in-process values."""
+        with self._cond:
+            if experiment_id in self._states:
+                return
+        self.publish(experiment_id, fields)
+
+    def get(self, experiment_id: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Return (state copy or None, version)."""
+        with self._cond:
+            state = self._states.get(experiment_id)
+            return (dict(state) if state is not None else None), self._versions.get(experiment_id, 0)
+
+    def wait(self, experiment_id: str, version: int, timeout: float) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Block up to timeout seconds for a version newer than version; returns get()."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._versions.get(experiment_id, 0) <= version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            state = self._states.get(experiment_id)
+            return (dict(state) if state is not None else None), self._versions.get(experiment_id, 0)
+
+    def _prune(self) -> None:
+        # Caller holds the lock
+        cutoff = time.time() - self.retention_seconds
+        stale = [
+            experiment_id for experiment_id, updated in self._updated.items()
+            if updated < cutoff and is_terminal(self._states.get(experiment_id))
+        ]
+        for experiment_id in stale:
+            self._states.pop(experiment_id, None)
+            self._versions.pop(experiment_id, None)
+            self._updated.pop(experiment_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            running = sum(1 for state in self._states.values() if not is_terminal(state))
+            return {"tracked": len(self._states), "running": running}
+
+
+class ProgressReadCache:
+    """
+    Short-TTL cache of {progress, status, url} rows read by the polling endpoint.
+
+    Entries are keyed by experiment and viewer (a hash of the JWT), so a row
+    is only served to a caller whose own read already passed RLS. Published
+    changes are written through to every viewer's entry for that experiment
+    and restart its TTL, so polls never see a value older than this
+    process's last write. Viewers are indexed by experiment so a publish only
+    touches that experiment's entries.
+    """
+
+    def __init__(self, ttl_seconds: float = 2.0, max_entries: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._viewers: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def viewer_key(jwt: Optional[str]) -> str:
+        return hashlib.sha256(jwt.encode("utf-8")).hexdigest() if jwt else "anon"
+
+    def get(self, experiment_id: str, viewer: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get((experiment_id, viewer))
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds:
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
+            return None
+
+    def put(self, experiment_id: str, viewer: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[(experiment_id, viewer)] = (dict(state), time.monotonic())
+            self._entries.move_to_end((experiment_id, viewer))
+            self._viewers.setdefault(experiment_id, set()).add(viewer)
+            while len(self._entries) > self.max_entries:
+                (evicted_id, evicted_viewer), _ = self._entries.popitem(last=False)
+                viewers = self._viewers[evicted_id]
+                viewers.discard(evicted_viewer)
+                if not viewers:
+                    del self._viewers[evicted_id]
+
+    def apply(self, experiment_id: str, changes: Dict[str, Any]) -> None:
+        """Registry listener: write a published change through to cached entries."""
+        now = time.monotonic()
+        with self._lock:
+            for viewer in self._viewers.get(experiment_id, ()):
+                key = (experiment_id, viewer)
+                self._entries[key] = ({**self._entries[key][0], **changes}, now)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared by run_evaluation, the progress updater and the progress endpoints
+experiment_states = ExperimentStateRegistry()
@@ -0,0 +1,417 @@
+"""
+Durable job queue and bounded worker pool for simulation runs.
+
+Jobs are persisted to a local SQLite database before they are acknowledged, and
+a fixed number of worker threads pull them off the queue. Each running job holds
+a lease that its owner keeps extending; when a gunicorn worker is recycled the
+lease lapses and the job is put back on the queue for the next worker. Finished
+jobs are pruned once they are older than the retention period.
+
+The queue is only as durable as the file it lives in: on a local or in-memory
+filesystem (Cloud Run's /tmp) it survives worker restarts but not the loss of
+the instance. Payloads are stored in plain text, so they must not carry
+credentials.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid as uuid_lib
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job states. A job only ever moves queued -> running -> completed/failed, or
+# back from running to queued when its lease expires (crash recovery).
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    group_key TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds the maximum number of active jobs."""
+
+
+class JobAlreadyActive(Exception):
+    """Raised when a job with the same id is still queued or running."""
+
+
+class GroupLimitReached(Exception):
+    """Raised when the job's group already holds its maximum number of active jobs."""
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a bounded pool of worker threads.
+
+    Args:
+        db_path: Path of the SQLite database file (created if missing)
+        handler: Callable invoked as handler(job_id, payload) for each job
+        max_workers: Number of jobs executed concurrently by this process
+        max_pending: Maximum number of queued + running jobs before enqueue is refused
+        lease_seconds: How long a running job may go without a heartbeat before
+            it is considered abandoned and re-queued
+        max_attempts: Number of times a job is started before it is marked failed
+        poll_interval: Seconds between queue polls when idle
+        retention_seconds: How long completed and failed jobs are kept before pruning
+        on_abandoned: Optional callable invoked as on_abandoned(job_id, payload) for each
+            job that recover() marks failed after its lease expired on the final attempt
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        handler: Callable[[str, Dict[str, Any]], None],
+        *,
+        max_workers: int = 2,
+        max_pending: int = 20,
+        lease_seconds: float = 120.0,
+        max_attempts: int = 3,
+        poll_interval: float = 1.0,
+        retention_seconds: float = 7 * 24 * 3600,
+        on_abandoned: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    ):
+        self.db_path = db_path
+        self.handler = handler
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, int(max_attempts))
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.on_abandoned = on_abandoned
+        self.owner = f"{os.getpid()}-{uuid_lib.uuid4().hex[:8]}"
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._running_ids = set()
+        self._lock = threading.Lock()
+
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "group_key" not in columns:
+                # Databases created before jobs were grouped
+                conn.execute("ALTER TABLE jobs ADD COLUMN group_key TEXT")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def pending_count(self) -> int:
+        """Number of jobs currently queued or running across all processes."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", ACTIVE_STATES
+            ).fetchone()
+            return row[0]
+        finally:
+            conn.close()
+
+    def has_capacity(self) -> bool:
+        """True when another job can be enqueued without exceeding max_pending."""
+        return self.pending_count() < self.max_pending
+
+    def group_count(self, group: str) -> int:
+        """Number of jobs of a group currently queued or running across all processes."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?) AND group_key = ?", (*ACTIVE_STATES, group)
+            ).fetchone()
+            return row[0]
+        finally:
+            conn.close()
+
+    def enqueue(
+        self,
+        job_id: str,
+        payload: Dict[str, Any],
+        *,
+        group: Optional[str] = None,
+        max_per_group: Optional[int] = None,
+    ) -> None:
+        """
+        Persist a job and wake an idle worker.
+
+        Args:
+            job_id: Job identifier
+            payload: JSON-serializable handler argument
+            group: Optional key (e.g. a user id) shared by related jobs
+            max_per_group: Maximum active jobs of the group, checked atomically with the insert
+
+        Raises:
+            QueueFull: max_pending active jobs already exist
+            JobAlreadyActive: a job with this id is still queued or running
+            GroupLimitReached: max_per_group active jobs of the group already exist
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                active = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", ACTIVE_STATES
+                ).fetchone()[0]
+                if active >= self.max_pending:
+                    raise QueueFull(f"{active} simulations are already queued or running")
+                existing = conn.execute(
+                    "SELECT state FROM jobs WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                if existing and existing["state"] in ACTIVE_STATES:
+                    raise JobAlreadyActive(f"Job {job_id} is already {existing['state']}")
+                if group is not None and max_per_group is not None:
+                    in_group = conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE state IN (?, ?) AND group_key = ?", (*ACTIVE_STATES, group)
+                    ).fetchone()[0]
+                    if in_group >= max_per_group:
+                        raise GroupLimitReached(f"{in_group} jobs of this group are already queued or running")
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs "
+                    "(job_id, payload, state, attempts, owner, lease_expires, error, created_at, updated_at, group_key) "
+                    "VALUES (?, ?, ?, 0, NULL, NULL, NULL, ?, ?, ?)",
+                    (job_id, json.dumps(payload), JOB_QUEUED, now, now, group),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        logger.info("Job %s queued", job_id)
+        self._wakeup.set()
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job's state row (without payload), or None if unknown."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT job_id, state, attempts, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def is_running_here(self, job_id: str) -> bool:
+        """True when this process's workers are currently running the job."""
+        with self._lock:
+            return job_id in self._running_ids
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts per state plus this process's pool utilisation."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        finally:
+            conn.close()
+        counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED)}
+        counts.update({row[0]: row[1] for row in rows})
+        with self._lock:
+            busy = len(self._running_ids)
+        return {
+            "states": counts,
+            "max_pending": self.max_pending,
+            "workers": self.max_workers,
+            "busy_workers": busy,
+        }
+
+    # ------------------------------------------------------------------
+    # Consumer side
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Recover abandoned jobs, prune old ones and start the worker and heartbeat threads."""
+        if self._threads:
+            return
+        self.recover()
+        self.prune()
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        hb = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        hb.start()
+        self._threads.append(hb)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask worker threads to exit after their current job."""
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def recover(self) -> int:
+        """
+        Re-queue running jobs whose lease has expired; fail those out of attempts
+        and report them to on_abandoned.
+
+        Returns:
+            Number of jobs put back on the queue
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            abandoned = conn.execute(
+                "SELECT job_id, payload FROM jobs WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (JOB_RUNNING, now, self.max_attempts),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, "
+                "error = 'Lease expired after final attempt', updated_at = ? WHERE job_id = ?",
+                [(JOB_FAILED, now, row["job_id"]) for row in abandoned],
+            )
+            failed = len(abandoned)
+            requeued = conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE state = ? AND lease_expires < ?",
+                (JOB_QUEUED, now, JOB_RUNNING, now),
+            ).rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if requeued or failed:
+            logger.warning("Recovered abandoned jobs: %d re-queued, %d failed", requeued, failed)
+        if requeued:
+            self._wakeup.set()
+        if self.on_abandoned is not None:
+            for row in abandoned:
+                try:
+                    self.on_abandoned(row["job_id"], json.loads(row["payload"]))
+                except Exception:
+                    logger.exception("on_abandoned failed for job %s", row["job_id"])
+        return requeued
+
+    def prune(self) -> int:
+        """
+        Delete completed and failed jobs last updated more than retention_seconds ago.
+
+        Returns:
+            Number of jobs deleted
+        """
+        conn = self._connect()
+        try:
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+                (JOB_COMPLETED, JOB_FAILED, time.time() - self.retention_seconds),
+            ).rowcount
+        finally:
+            conn.close()
+        if removed:
+            logger.info("Pruned %d finished jobs", removed)
+        return removed
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id, payload, attempts FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_id = ?",
+                (JOB_RUNNING, self.owner, now + self.lease_seconds, now, row["job_id"]),
+            )
+            conn.execute("COMMIT")
+            return row
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: str, state: str, error: Optional[str] = None) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE job_id = ? AND owner = ?",
+                (state, error, time.time(), job_id, self.owner),
+            )
+        finally:
+            conn.close()
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                logger.exception("Failed to claim job")
+                row = None
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id = row["job_id"]
+            with self._lock:
+                self._running_ids.add(job_id)
+            logger.info("Job %s started (attempt %d)", job_id, row["attempts"] + 1)
+            try:
+                self.handler(job_id, json.loads(row["payload"]))
+                self._finish(job_id, JOB_COMPLETED)
+                logger.info("Job %s completed", job_id)
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                self._finish(job_id, JOB_FAILED, error=str(e))
+            finally:
+                with self._lock:
+                    self._running_ids.discard(job_id)
+
+    def _heartbeat_loop(self) -> None:
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            with self._lock:
+                running = list(self._running_ids)
+            try:
+                if running:
+                    conn = self._connect()
+                    try:
+                        conn.executemany(
+                            "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND owner = ?",
+                            [(time.time() + self.lease_seconds, job_id, self.owner) for job_id in running],
+                        )
+                    finally:
+                        conn.close()
+                self.recover()
+                self.prune()
+            except sqlite3.Error:
+                logger.exception("Job heartbeat failed")
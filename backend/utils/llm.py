@@ -5,11 +5,30 @@ Provides a unified interface for creating LLM instances and invoking
 structured outputs with token usage tracking.
 """
 
+import asyncio
+import email.utils
+import json
+import logging
 import os
-from typing import Any, Dict, List, Tuple, Type
+import random
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type
 
+from langchain_core.messages import AIMessage
 from pydantic import BaseModel
 
+from .concurrency import get_concurrency_limiter
+from .response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
+
 
 class BaseResponse(BaseModel):
     """Structured response for simulation steps."""
@@ -23,6 +42,30 @@ class EvaluationMetrics(BaseModel):
     score: List[float]
 
 
+class StepEvaluationMetrics(BaseModel):
+    """Scores for one step inside a row-batched evaluation."""
+    step: str
+    metric: List[str]
+    score: List[float]
+
+
+class RowEvaluationMetrics(BaseModel):
+    """Structured response for row-batched evaluation: one entry per step."""
+    steps: List[StepEvaluationMetrics]
+
+
+class ItemScores(BaseModel):
+    """Scores for one numbered response inside a packed evaluation."""
+    item: int
+    score: List[float]
+
+
+class PackedEvaluationMetrics(BaseModel):
+    """Structured response for packed evaluation: many responses to one step."""
+    metric: List[str]
+    items: List[ItemScores]
+
+
 # Maps short/friendly names (sent from the frontend) to canonical API model IDs.
 # NOTE: gemini-2.0-flash was retired by Google (generateContent now returns 404),
 # so the legacy names are remapped to the current flash model.
@@ -39,6 +82,14 @@ MODEL_NAME_MAP: Dict[str, str] = {
 
 DEFAULT_MODEL = "gemini-2.5-flash"
 
+# Requests-per-minute and tokens-per-minute budgets per resolved model name,
+# shared by every experiment running in this process. Override with the
+# LLM_RATE_LIMITS env var, e.g. '{"gemini-2.5-flash": {"rpm": 500, "tpm": 500000}}'.
+MODEL_RATE_LIMITS: Dict[str, Dict[str, int]] = {
+    "gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000},
+}
+DEFAULT_RATE_LIMIT: Dict[str, int] = {"rpm": 300, "tpm": 500_000}
+
 
 def resolve_model_name(model_name: str) -> str:
     """Normalize a model name to a canonical API model ID."""
@@ -47,9 +98,410 @@ def resolve_model_name(model_name: str) -> str:
     return MODEL_NAME_MAP.get(model_name, model_name)
 
 
+def estimate_tokens(messages: List) -> int:
+    """Rough local token count for a list of LangChain messages (~4 chars per token)."""
+    chars = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return max(1, chars // 4)
+
+
+class _ModelRateLimiter:
+    """
+    Token buckets for one model: one refilled at rpm/60 requests per second and
+    one at tpm/60 tokens per second. Callers that do not fit wait until the
+    buckets refill instead of sending a request that would be rejected with 429.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.total_requests = 0
+        self.total_waited = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def try_acquire(self, tokens: int) -> float:
+        """Take capacity for one request if available; otherwise return seconds to wait."""
+        # A single request larger than the whole budget would never fit; let it
+        # through once the bucket is full rather than blocking forever.
+        tokens = min(tokens, self.tpm)
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._requests >= 1 and self._tokens >= tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0.0
+            wait_requests = (1 - self._requests) * 60.0 / self.rpm if self._requests < 1 else 0.0
+            wait_tokens = (tokens - self._tokens) * 60.0 / self.tpm if self._tokens < tokens else 0.0
+            return max(wait_requests, wait_tokens, 0.001)
+
+    def acquire(self, tokens: int) -> float:
+        """Block until the request fits in both budgets. Returns seconds waited."""
+        start = time.monotonic()
+        wait = self.try_acquire(tokens)
+        if wait:
+            with self._lock:
+                self.waiting += 1
+            try:
+                while wait:
+                    time.sleep(wait)
+                    wait = self.try_acquire(tokens)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        waited = time.monotonic() - start
+        self._record(waited)
+        return waited
+
+    async def acquire_async(self, tokens: int) -> float:
+        """Asyncio version of acquire: waits with asyncio.sleep instead of blocking the loop."""
+        start = time.monotonic()
+        wait = self.try_acquire(tokens)
+        if wait:
+            with self._lock:
+                self.waiting += 1
+            try:
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.try_acquire(tokens)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        waited = time.monotonic() - start
+        self._record(waited)
+        return waited
+
+    def _record(self, waited: float) -> None:
+        with self._lock:
+            self.total_requests += 1
+            if waited > 0.001:
+                self.total_waited += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct the token bucket once the real usage of a request is known."""
+        if actual <= 0:
+            return
+        with self._lock:
+            # May go negative: over-budget requests are paid back by later callers
+            self._tokens = min(self.tpm, self._tokens + estimated - actual)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queue_depth": self.waiting,
+                "requests": self.total_requests,
+                "throttled_requests": self.total_waited,
+                "total_wait_seconds": round(self.total_wait_seconds, 3),
+                "avg_wait_seconds": round(self.total_wait_seconds / self.total_requests, 4) if self.total_requests else 0.0,
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+_rate_limiters: Dict[str, _ModelRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def _rate_limit_config(model_name: str) -> Dict[str, int]:
+    overrides = {}
+    raw = os.environ.get("LLM_RATE_LIMITS")
+    if raw:
+        try:
+            overrides = json.loads(raw)
+        except ValueError:
+            overrides = {}
+    limits = dict(DEFAULT_RATE_LIMIT)
+    limits.update(MODEL_RATE_LIMITS.get(model_name, {}))
+    limits.update(overrides.get(model_name, {}))
+    return limits
+
+
+def get_rate_limiter(model_name: str) -> _ModelRateLimiter:
+    """Return the process-wide rate limiter for a (resolved) model name."""
+    model_name = resolve_model_name(model_name)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model_name)
+        if limiter is None:
+            limits = _rate_limit_config(model_name)
+            limiter = _ModelRateLimiter(int(limits["rpm"]), int(limits["tpm"]))
+            _rate_limiters[model_name] = limiter
+        return limiter
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth, request counts and wait times for every model seen so far."""
+    with _rate_limiters_lock:
+        limiters = dict(_rate_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+# Retryable error classes (see classify_error)
+RETRY_RATE_LIMIT = "rate_limit"
+RETRY_TIMEOUT = "timeout"
+RETRY_SERVER_ERROR = "server_error"
+RETRY_PARSE_FAILURE = "parse_failure"
+
+# Per-class retry policy: attempts is the most calls made for one invocation
+# when every failure is of that class; the backoff before retry n is drawn
+# uniformly from [0, min(max_delay, base_delay * 2 ** (n - 1))] (full jitter),
+# or follows the server's Retry-After when it sends one. Override with the
+# LLM_RETRY_POLICIES env var, e.g. '{"rate_limit": {"attempts": 8}}'.
+RETRY_POLICIES: Dict[str, Dict[str, float]] = {
+    RETRY_RATE_LIMIT: {"attempts": 6, "base_delay": 2.0, "max_delay": 60.0},
+    RETRY_TIMEOUT: {"attempts": 3, "base_delay": 1.0, "max_delay": 20.0},
+    RETRY_SERVER_ERROR: {"attempts": 4, "base_delay": 1.0, "max_delay": 30.0},
+    RETRY_PARSE_FAILURE: {"attempts": 2, "base_delay": 0.0, "max_delay": 0.0},
+}
+
+# Longest one invocation may spend sleeping between attempts
+LLM_RETRY_MAX_ELAPSED = float(os.environ.get("LLM_RETRY_MAX_ELAPSED", 180))
+# Retry budget: every invocation earns LLM_RETRY_BUDGET_RATIO retries, on top
+# of a reserve of LLM_RETRY_BUDGET_RESERVE, so an outage cannot multiply load.
+LLM_RETRY_BUDGET_RATIO = float(os.environ.get("LLM_RETRY_BUDGET_RATIO", 0.2))
+LLM_RETRY_BUDGET_RESERVE = float(os.environ.get("LLM_RETRY_BUDGET_RESERVE", 20))
+
+_RETRY_DELAY_PATTERN = re.compile(
+    r"(?:retry[_ ]?delay\W*(?:seconds\W*)?|retry in\s+)(\d+(?:\.\d+)?)", re.IGNORECASE
+)
+
+
+def _retry_policies() -> Dict[str, Dict[str, float]]:
+    policies = {name: dict(policy) for name, policy in RETRY_POLICIES.items()}
+    raw = os.environ.get("LLM_RETRY_POLICIES")
+    if raw:
+        try:
+            for name, policy in json.loads(raw).items():
+                policies.setdefault(name, {"attempts": 1, "base_delay": 0.0, "max_delay": 0.0}).update(policy)
+        except (ValueError, AttributeError):
+            logger.warning("Ignoring invalid LLM_RETRY_POLICIES")
+    return policies
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """
+    Map an exception from an LLM call to a retryable error class, or None
+    when retrying cannot help (bad request, auth, unsupported model, ...).
+
+    Works from HTTP status codes and exception names so it covers the
+    google.api_core, httpx and asyncio errors raised by any provider client.
+    """
+    code = getattr(exc, "code", None)
+    if callable(code):
+        # grpc errors expose code() returning a StatusCode enum
+        code = getattr(exc, "status_code", None)
+    names = " ".join(cls.__name__ for cls in type(exc).__mro__)
+    text = str(exc)
+    if code == 429 or "ResourceExhausted" in names or "TooManyRequests" in names or "RESOURCE_EXHAUSTED" in text:
+        return RETRY_RATE_LIMIT
+    if (
+        code in (408, 504)
+        or isinstance(exc, (TimeoutError, asyncio.TimeoutError))
+        or "Timeout" in names
+        or "DeadlineExceeded" in names
+    ):
+        return RETRY_TIMEOUT
+    if (isinstance(code, int) and 500 <= code < 600) or isinstance(exc, ConnectionError) or any(
+        name in names for name in ("ServerError", "ServiceUnavailable", "InternalServerError", "BadGateway", "ConnectError", "RemoteProtocolError")
+    ):
+        return RETRY_SERVER_ERROR
+    return None
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Server-requested delay for a failed call: an HTTP Retry-After header,
+    a google.rpc.RetryInfo detail, or a "retry in Ns" hint in the message.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(value)
+                if parsed is not None:
+                    return max(0.0, parsed.timestamp() - time.time())
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return getattr(delay, "seconds", 0) + getattr(delay, "nanos", 0) / 1e9
+    match = _RETRY_DELAY_PATTERN.search(str(exc))
+    return float(match.group(1)) if match else None
+
+
+class _RetryStats:
+    """Process-wide retry budget and per-class counters."""
+
+    def __init__(self, ratio: float, reserve: float):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = reserve
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {}
+
+    def _class(self, error_class: str) -> Dict[str, float]:
+        return self._counters.setdefault(error_class, {
+            "retries": 0, "recovered": 0, "exhausted": 0, "budget_denied": 0, "sleep_seconds": 0.0,
+        })
+
+    def deposit(self) -> None:
+        """Called once per invocation: earn a fraction of a retry."""
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def withdraw(self, error_class: str) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                self._class(error_class)["budget_denied"] += 1
+                return False
+            self._balance -= 1
+            return True
+
+    def count(self, error_class: str, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._class(error_class)[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_class = {
+                name: {key: round(value, 3) if key == "sleep_seconds" else int(value) for key, value in counters.items()}
+                for name, counters in self._counters.items()
+            }
+            return {"budget_balance": round(self._balance, 2), "classes": by_class}
+
+
+_retry_stats = _RetryStats(LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_RESERVE)
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """Retry budget balance and retries/recoveries/give-ups per error class."""
+    return _retry_stats.stats()
+
+
+class _Retrier:
+    """Retry bookkeeping for one invocation, shared by the sync and async paths."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.policies = _retry_policies()
+        self.retries: Dict[str, int] = {}
+        self.slept = 0.0
+        _retry_stats.deposit()
+
+    def next_delay(self, error_class: Optional[str], exc: Optional[BaseException] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if error_class is None:
+            return None
+        policy = self.policies.get(error_class, {"attempts": 1})
+        retry = self.retries.get(error_class, 0) + 1
+        if retry >= policy.get("attempts", 1):
+            _retry_stats.count(error_class, "exhausted")
+            return None
+        cap = min(policy.get("max_delay", 0.0), policy.get("base_delay", 0.0) * 2 ** (retry - 1))
+        delay = random.uniform(0, cap)
+        server_delay = retry_after_seconds(exc) if exc is not None else None
+        if server_delay is not None:
+            # Never earlier than the server asked; jitter spreads the herd after it
+            delay = server_delay + random.uniform(0, min(1.0, policy.get("base_delay", 0.0)))
+        if self.slept + delay > LLM_RETRY_MAX_ELAPSED or not _retry_stats.withdraw(error_class):
+            _retry_stats.count(error_class, "exhausted")
+            return None
+        self.retries[error_class] = retry
+        self.slept += delay
+        _retry_stats.count(error_class, "retries")
+        _retry_stats.count(error_class, "sleep_seconds", delay)
+        logger.warning(
+            "LLM call to %s failed (%s: %s); retry %d in %.1fs",
+            self.model_name, error_class, str(exc)[:200] if exc is not None else "no parsed output", retry, delay,
+        )
+        return delay
+
+    def succeeded(self) -> None:
+        for error_class in self.retries:
+            _retry_stats.count(error_class, "recovered")
+
+
+class _LRUCache:
+    """Small thread-safe LRU map used to keep LLM clients alive across calls."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+        # Build outside the lock: client construction is slow and may race with
+        # another thread building the same key, in which case the first one wins.
+        value = factory()
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Clients keyed by (model, temperature) and structured-output runnables keyed by
+# (model, temperature, schema). Reusing them keeps the HTTP/gRPC transport and
+# derived JSON schema alive instead of rebuilding them for every call.
+_LLM_CACHE_SIZE = int(os.environ.get("LLM_CLIENT_CACHE_SIZE", 32))
+_llm_cache = _LRUCache(_LLM_CACHE_SIZE)
+_structured_cache = _LRUCache(_LLM_CACHE_SIZE)
+
+
+def get_llm_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss/eviction counts for the client and structured-runnable caches."""
+    return {"clients": _llm_cache.stats(), "structured": _structured_cache.stats()}
+
+
 def get_llm(model_name: str, temperature: float = 0.0):
     """
-    Create a LangChain chat model instance for the given model name.
+    Return a (cached) LangChain chat model instance for the given model name.
 
     Args:
         model_name: Model identifier or short name (e.g. "gemini", "gemini-2.0-flash")
@@ -59,7 +511,42 @@ def get_llm(model_name: str, temperature: float = 0.0):
         LangChain BaseChatModel instance
     """
     model_name = resolve_model_name(model_name)
+    return _llm_cache.get_or_create(
+        (model_name, float(temperature)),
+        lambda: _build_llm(model_name, temperature),
+    )
+
+
+def get_structured_llm(model_name: str, schema: Type[BaseModel], temperature: float = 0.0):
+    """
+    Return a (cached) structured-output runnable that yields {"raw", "parsed", ...}.
+
+    Args:
+        model_name: Model identifier
+        schema: Pydantic model class for structured output
+        temperature: Sampling temperature
+
+    Returns:
+        LangChain Runnable built with with_structured_output(schema, include_raw=True)
+    """
+    model_name = resolve_model_name(model_name)
+    return _structured_cache.get_or_create(
+        (model_name, float(temperature), schema),
+        lambda: get_llm(model_name, temperature).with_structured_output(schema, include_raw=True),
+    )
+
+
+def _build_llm(model_name: str, temperature: float = 0.0):
+    """
+    Create a new LangChain chat model instance for a resolved model name.
+
+    Args:
+        model_name: Canonical model identifier
+        temperature: Sampling temperature (0.0 – 1.0)
 
+    Returns:
+        LangChain BaseChatModel instance
+    """
     if model_name.startswith("gemini"):
         from langchain_google_genai import ChatGoogleGenerativeAI
         return ChatGoogleGenerativeAI(
@@ -79,20 +566,110 @@ def get_llm(model_name: str, temperature: float = 0.0):
 
 def _extract_usage(raw_message) -> Dict[str, int]:
     """Extract token usage from a LangChain AIMessage."""
-    usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
     if raw_message and hasattr(raw_message, "usage_metadata") and raw_message.usage_metadata:
         meta = raw_message.usage_metadata
         usage["input_tokens"] = meta.get("input_tokens", 0) or 0
         usage["output_tokens"] = meta.get("output_tokens", 0) or 0
         usage["total_tokens"] = meta.get("total_tokens", 0) or 0
+        # Input tokens served from the provider's context cache (already included in input_tokens)
+        usage["cached_tokens"] = (meta.get("input_token_details") or {}).get("cache_read", 0) or 0
     return usage
 
 
+def _zero_usage() -> Dict[str, int]:
+    return {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+
+
+@lru_cache(maxsize=None)
+def _schema_id(schema: Type[BaseModel]) -> str:
+    # The schema's JSON form is part of the key so editing a schema invalidates old
+    # entries; it only changes with the code, so it is serialized once per class
+    return json.dumps(schema.model_json_schema(), sort_keys=True)
+
+
+def _structured_cache_key(model_name, schema, messages, temperature, cache_site) -> Optional[str]:
+    cache = get_response_cache()
+    if not cache_site or cache_site not in cache.sites:
+        return None
+    return cache.key_for(
+        cache_site, resolve_model_name(model_name), _schema_id(schema), messages, temperature
+    )
+
+
+def _cached_structured(schema: Type[BaseModel], key: Optional[str]):
+    if key is None:
+        return None
+    value = get_response_cache().get(key)
+    if value is None:
+        return None
+    try:
+        return schema.model_validate_json(value)
+    except ValueError:
+        return None
+
+
+# Error classes that tell the adaptive concurrency limiter to back off
+_OVERLOAD_CLASSES = (RETRY_RATE_LIMIT, RETRY_TIMEOUT)
+
+
+class BudgetExceeded(Exception):
+    """Raised in place of an LLM request once the active usage tracker's budget is spent."""
+
+
+# Usage tracker of the current context (see track_usage). Asyncio tasks inherit
+# it; worker threads only see it when run through contextvars.copy_context().run.
+_usage_tracker: ContextVar = ContextVar("llm_usage_tracker", default=None)
+
+
+@contextmanager
+def track_usage(tracker):
+    """
+    Report every LLM request made in this context to tracker (e.g. a
+    utils.budget.CostBudget): tracker.check() runs before each attempt and may
+    raise BudgetExceeded to refuse it; tracker.add(model_name, usage) runs after
+    each attempt that returns, including ones whose output fails to parse.
+    """
+    token = _usage_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _usage_tracker.reset(token)
+
+
+def _report_usage(model_name: str, usage: Dict[str, int]) -> None:
+    tracker = _usage_tracker.get()
+    if tracker is not None:
+        tracker.add(resolve_model_name(model_name), usage)
+
+
+def _check_budget() -> None:
+    tracker = _usage_tracker.get()
+    if tracker is not None:
+        tracker.check()
+
+
+def _limited_call(model_name: str, limiter: _ModelRateLimiter, estimated: int, call):
+    # One attempt: adaptive concurrency slot, then rate-limit budget, then the request
+    _check_budget()
+    concurrency = get_concurrency_limiter(resolve_model_name(model_name))
+    started = concurrency.acquire()
+    try:
+        limiter.acquire(estimated)
+        result = call()
+    except BaseException as exc:
+        concurrency.release(started, overloaded=classify_error(exc) in _OVERLOAD_CLASSES, succeeded=False)
+        raise
+    concurrency.release(started)
+    return result
+
+
 def invoke_structured(
     model_name: str,
     schema: Type[BaseModel],
     messages: List,
     temperature: float = 0.0,
+    cache_site: Optional[str] = None,
 ) -> Tuple[Any, Dict[str, int]]:
     """
     Invoke an LLM with structured output and return (parsed_result, usage_dict).
@@ -102,18 +679,204 @@ def invoke_structured(
         schema: Pydantic model class for structured output
         messages: List of LangChain message objects (SystemMessage, HumanMessage, etc.)
         temperature: Sampling temperature
+        cache_site: Call site name (see utils.response_cache); responses are cached only
+            when this site is listed in LLM_CACHE_SITES and temperature is 0
+
+    Rate limits, timeouts, 5xx errors and unparseable output are retried with
+    per-class backoff (see RETRY_POLICIES); other errors, and retryable ones once
+    their attempts or the retry budget run out, are raised to the caller.
 
     Returns:
         (parsed, usage) where:
-            - parsed is the validated Pydantic object (or None on parse failure)
-            - usage has keys: input_tokens, output_tokens, total_tokens
+            - parsed is the validated Pydantic object (or None if every attempt failed to parse)
+            - usage has keys: input_tokens, output_tokens, total_tokens (all 0 on a cache hit),
+              summed over every attempt
     """
-    llm = get_llm(model_name, temperature)
-    structured_llm = llm.with_structured_output(schema, include_raw=True)
-    result = structured_llm.invoke(messages)
+    key = _structured_cache_key(model_name, schema, messages, temperature, cache_site)
+    cached = _cached_structured(schema, key)
+    if cached is not None:
+        return cached, _zero_usage()
 
-    parsed = result.get("parsed")
-    raw = result.get("raw")
-    usage = _extract_usage(raw)
+    structured_llm = get_structured_llm(model_name, schema, temperature)
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages)
+    retrier = _Retrier(model_name)
+    usage = _zero_usage()
+    while True:
+        try:
+            result = _limited_call(model_name, limiter, estimated, lambda: structured_llm.invoke(messages))
+        except Exception as exc:
+            delay = retrier.next_delay(classify_error(exc), exc)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        parsed = result.get("parsed")
+        attempt_usage = _extract_usage(result.get("raw"))
+        limiter.settle(estimated, attempt_usage["total_tokens"])
+        _report_usage(model_name, attempt_usage)
+        # Failed attempts are billed too, so their usage is kept
+        usage = {name: usage[name] + attempt_usage[name] for name in usage}
+        if parsed is not None:
+            retrier.succeeded()
+            break
+        delay = retrier.next_delay(RETRY_PARSE_FAILURE)
+        if delay is None:
+            break
+        time.sleep(delay)
+
+    if key is not None and parsed is not None:
+        get_response_cache().set(key, parsed.model_dump_json())
 
     return parsed, usage
+
+
+# Maximum in-flight async LLM calls per event loop (see invoke_structured_async).
+LLM_ASYNC_CONCURRENCY = int(os.environ.get("LLM_ASYNC_CONCURRENCY", 200))
+_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _get_async_semaphore() -> asyncio.Semaphore:
+    # asyncio primitives belong to one loop, so keep one semaphore per loop
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_ASYNC_CONCURRENCY)
+        _async_semaphores[loop] = semaphore
+    return semaphore
+
+
+async def _limited_call_async(model_name: str, limiter: _ModelRateLimiter, estimated: int, call):
+    # Asyncio version of _limited_call; LLM_ASYNC_CONCURRENCY stays a hard per-loop cap
+    _check_budget()
+    concurrency = get_concurrency_limiter(resolve_model_name(model_name))
+    async with _get_async_semaphore():
+        started = await concurrency.acquire_async()
+        try:
+            await limiter.acquire_async(estimated)
+            result = await call()
+        except BaseException as exc:
+            # Includes cancellation, so the slot is never leaked
+            concurrency.release(started, overloaded=classify_error(exc) in _OVERLOAD_CLASSES, succeeded=False)
+            raise
+        concurrency.release(started)
+        return result
+
+
+async def invoke_structured_async(
+    model_name: str,
+    schema: Type[BaseModel],
+    messages: List,
+    temperature: float = 0.0,
+    cache_site: Optional[str] = None,
+) -> Tuple[Any, Dict[str, int]]:
+    """
+    Asyncio version of invoke_structured built on the runnable's ainvoke.
+
+    In-flight calls are capped by the model's adaptive concurrency limit
+    (utils.concurrency, shared with the threaded path) and LLM_ASYNC_CONCURRENCY
+    per event loop, and still go through the shared per-model rate limiter. Cached clients bind
+    their async transport to the first loop that uses them, so call this from
+    the engine loop in utils.async_engine rather than ad-hoc loops.
+
+    Returns:
+        (parsed, usage), as invoke_structured
+    """
+    key = _structured_cache_key(model_name, schema, messages, temperature, cache_site)
+    if key is not None:
+        # The disk tier is SQLite, so look it up off the event loop
+        cached = await asyncio.to_thread(_cached_structured, schema, key)
+        if cached is not None:
+            return cached, _zero_usage()
+
+    structured_llm = get_structured_llm(model_name, schema, temperature)
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages)
+    retrier = _Retrier(model_name)
+    usage = _zero_usage()
+    while True:
+        # Concurrency slots are only held while a request is in flight, not during backoff
+        try:
+            result = await _limited_call_async(
+                model_name, limiter, estimated, lambda: structured_llm.ainvoke(messages)
+            )
+        except Exception as exc:
+            delay = retrier.next_delay(classify_error(exc), exc)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        parsed = result.get("parsed")
+        attempt_usage = _extract_usage(result.get("raw"))
+        limiter.settle(estimated, attempt_usage["total_tokens"])
+        _report_usage(model_name, attempt_usage)
+        usage = {name: usage[name] + attempt_usage[name] for name in usage}
+        if parsed is not None:
+            retrier.succeeded()
+            break
+        delay = retrier.next_delay(RETRY_PARSE_FAILURE)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+    if key is not None and parsed is not None:
+        await asyncio.to_thread(get_response_cache().set, key, parsed.model_dump_json())
+
+    return parsed, usage
+
+
+def invoke_chat(
+    model_name: str,
+    messages: List,
+    temperature: float = 0.0,
+    cache_site: Optional[str] = None,
+):
+    """
+    Invoke an LLM for free-form text through the shared rate limiter, retrying
+    transient errors as invoke_structured does.
+
+    Args:
+        model_name: Model identifier
+        messages: List of LangChain message objects
+        temperature: Sampling temperature
+        cache_site: Call site name for the response cache (see invoke_structured)
+
+    Returns:
+        The LangChain AIMessage returned by the model; on a cache hit, a
+        rebuilt AIMessage with zero usage_metadata
+    """
+    cache = get_response_cache()
+    key = cache.key_for(cache_site, resolve_model_name(model_name), "text", messages, temperature)
+    if key is not None:
+        value = cache.get(key)
+        if value is not None:
+            return AIMessage(
+                content=json.loads(value),
+                usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+            )
+
+    llm = get_llm(model_name, temperature)
+
+    limiter = get_rate_limiter(model_name)
+    estimated = estimate_tokens(messages)
+    retrier = _Retrier(model_name)
+    while True:
+        try:
+            response = _limited_call(model_name, limiter, estimated, lambda: llm.invoke(messages))
+            break
+        except Exception as exc:
+            delay = retrier.next_delay(classify_error(exc), exc)
+            if delay is None:
+                raise
+            time.sleep(delay)
+    retrier.succeeded()
+    usage = _extract_usage(response)
+    limiter.settle(estimated, usage["total_tokens"])
+    _report_usage(model_name, usage)
+
+    if key is not None:
+        cache.set(key, json.dumps(response.content))
+
+    return response
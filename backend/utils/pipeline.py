@@ -0,0 +1,272 @@
+"""
+Streaming generation + evaluation pipeline.
+
+Instead of waiting for every persona row to finish generating before scoring
+starts, each (row, step) response is pushed onto a bounded queue the moment it
+is produced and scored concurrently by a pool of evaluation workers. Generation
+blocks on the queue when evaluation falls behind, so memory stays bounded.
+"""
+
+import concurrent.futures
+import contextvars
+import logging
+import queue
+import threading
+
+import pandas as pd
+
+from .evaluate import (
+    evaluate_step,
+    evaluate_row_batched,
+    evaluate_step_packed,
+    init_row_scores,
+    scores_for_step,
+    split_usage,
+    EvaluationPacker,
+    EVALUATION_MODE_STEP,
+    EVALUATION_MODE_ROW,
+    EVALUATION_MODE_PACKED,
+)
+from .prompts import (
+    process_row_with_chat,
+    prepare_baseline_frame,
+    assemble_baseline_frame,
+)
+from .concurrency import executor_workers
+from .used_prompts import BASELINE_SYSTEM_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Sentinel telling an evaluation worker to exit
+_DONE = object()
+
+
+class ScoreBoard:
+    """
+    Evaluation scores and token usage per row for one streaming run, shared by
+    this pipeline and utils.async_engine.
+
+    Results are recorded as units (row_idx, col_name, scores, usage), one per
+    scored (row, step), which is also the granularity of checkpoint entries.
+
+    Args:
+        row_count (int): Rows in the run
+        steps (list): Step dictionaries containing measures
+        checkpoint (RunCheckpoint, optional): Source of restored units and sink for new ones
+        on_restored (callable, optional): Called once per unit restored from the checkpoint
+    """
+
+    def __init__(self, row_count, steps, checkpoint=None, on_restored=None):
+        self.steps_by_label = {step['label']: step for step in steps}
+        self.checkpoint = checkpoint
+        self.on_restored = on_restored
+        self._lock = threading.Lock()
+        self.row_scores = {row_idx: init_row_scores(steps) for row_idx in range(row_count)}
+        self.row_eval_tokens = {
+            row_idx: {'gemini_prompt_tokens': 0, 'gemini_response_tokens': 0, 'gemini_total_tokens': 0}
+            for row_idx in range(row_count)
+        }
+
+    def record(self, units):
+        with self._lock:
+            for row_idx, _, scores, usage in units:
+                for metric_name, score in scores.items():
+                    if metric_name in self.row_scores[row_idx]:
+                        self.row_scores[row_idx][metric_name].append(score)
+                tokens = self.row_eval_tokens[row_idx]
+                tokens['gemini_prompt_tokens'] += usage['input_tokens']
+                tokens['gemini_response_tokens'] += usage['output_tokens']
+                tokens['gemini_total_tokens'] += usage['total_tokens']
+
+    def save(self, units):
+        if self.checkpoint is not None:
+            for unit in units:
+                self.checkpoint.save_evaluation(*unit)
+
+    def restore(self, row_idx, col_name):
+        """Record a step scored by an earlier attempt; False if it still needs scoring."""
+        saved = self.checkpoint.evaluated.get((row_idx, col_name)) if self.checkpoint is not None else None
+        if saved is None:
+            return False
+        self.record([(row_idx, col_name, *saved)])
+        if self.on_restored:
+            self.on_restored()
+        return True
+
+    def row_items(self, columns, row_idx, row_data):
+        """(step_label, step_output, step) for a completed row's steps that still need scoring."""
+        return [
+            (label, row_data[label], self.steps_by_label[label])
+            for label in columns
+            if label in self.steps_by_label and label in row_data and not self.restore(row_idx, label)
+        ]
+
+    def step_units(self, row_idx, col_name, result):
+        scores, usage = result
+        return [(row_idx, col_name, scores, usage)]
+
+    def row_units(self, row_idx, step_items, result):
+        # A row-batched call is split back into one unit per step
+        scores, usage = result
+        return [
+            (row_idx, label, scores_for_step(scores, label, step), share)
+            for (label, _, step), share in zip(step_items, split_usage(usage, len(step_items)))
+        ]
+
+    def pack_units(self, col_name, result):
+        scores_by_row, usage_by_row = result
+        return [(row_idx, col_name, scores, usage_by_row[row_idx]) for row_idx, scores in scores_by_row.items()]
+
+    def results(self, completed_rows):
+        """(results_df, eval_tokens) for the given rows, in order."""
+        results_df = pd.DataFrame([self.row_scores[row_idx] for row_idx in completed_rows])
+        return results_df, [self.row_eval_tokens[row_idx] for row_idx in completed_rows]
+
+
+def stream_baseline_and_evaluate(
+    prompt,
+    model_name,
+    sample=None,
+    progress_callback=None,
+    max_eval_workers=None,
+    queue_size=None,
+    evaluation_mode=EVALUATION_MODE_STEP,
+    checkpoint=None,
+):
+    """
+    Generate baseline responses and evaluate each step as soon as it is produced.
+
+    Args:
+        prompt (dict): Experiment payload including seed, steps, and iterations
+        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
+        sample (dict): Sample data containing persona array
+        progress_callback (callable, optional): Called once per generated step and once per
+            evaluated step, i.e. 2 * rows * steps times in total
+        max_eval_workers (int, optional): Evaluation worker threads (defaults to enough to fill
+            the adaptive concurrency ceiling; in-flight calls are bounded by utils.concurrency)
+        queue_size (int, optional): Maximum responses waiting to be scored before
+            generation blocks (defaults to 4 * max_eval_workers)
+        evaluation_mode (str): EVALUATION_MODE_STEP scores each step as it is generated;
+            EVALUATION_MODE_ROW scores each persona row in one call as soon as the row completes;
+            EVALUATION_MODE_PACKED scores a step for many personas in one call once a pack fills
+        checkpoint (RunCheckpoint, optional): Units completed by an earlier attempt are
+            restored from it instead of calling the LLM; new results are saved to it per
+            (row, step) as they complete
+
+    Returns:
+        tuple: (final_df, prompt_tokens, results_df, eval_tokens) where:
+            - final_df (pd.DataFrame): Generated responses, persona first
+            - prompt_tokens (list): Generation token usage per row
+            - results_df (pd.DataFrame): Evaluation scores, row-aligned with final_df
+            - eval_tokens (list): Evaluation token usage per row
+    """
+    steps = prompt.get('steps', [])
+    df, selected_personas = prepare_baseline_frame(prompt, sample)
+    steps_by_label = {step['label']: step for step in steps}
+
+    max_eval_workers = max_eval_workers or executor_workers(df.shape[0] * max(1, len(steps)))
+    eval_queue = queue.Queue(maxsize=queue_size or 4 * max_eval_workers)
+
+    # Per-row evaluation state, written by evaluation workers
+    board = ScoreBoard(df.shape[0], steps, checkpoint, progress_callback)
+
+    # Packed mode: one packer per step, shared by all generation threads
+    packers = {label: EvaluationPacker(label, step) for label, step in steps_by_label.items()}
+    packer_lock = threading.Lock()
+
+    def on_step(row_idx, col_name, response):
+        if progress_callback:
+            progress_callback()
+        if col_name not in steps_by_label:
+            return
+        if evaluation_mode != EVALUATION_MODE_ROW and board.restore(row_idx, col_name):
+            return
+        if evaluation_mode == EVALUATION_MODE_PACKED:
+            with packer_lock:
+                pack = packers[col_name].add(row_idx, response)
+            if pack:
+                eval_queue.put((None, col_name, pack))
+        elif evaluation_mode != EVALUATION_MODE_ROW:
+            # Blocks when the evaluators are saturated (backpressure)
+            eval_queue.put((row_idx, col_name, response))
+
+    def eval_worker():
+        while True:
+            item = eval_queue.get()
+            if item is _DONE:
+                return
+            row_idx, col_name, response = item
+            units = 1
+            try:
+                if row_idx is None:
+                    # Packed mode: response is a list of (row_idx, step_output)
+                    units = len(response)
+                    result = evaluate_step_packed(col_name, steps_by_label[col_name], response, model_name)
+                    scored = board.pack_units(col_name, result)
+                elif col_name is None:
+                    # Row mode: response is the completed row_data; only unscored steps are sent
+                    step_items = board.row_items(df.columns, row_idx, response)
+                    units = len(step_items)
+                    if not step_items:
+                        continue
+                    scored = board.row_units(row_idx, step_items, evaluate_row_batched(step_items, model_name))
+                else:
+                    result = evaluate_step(col_name, response, steps_by_label[col_name], model_name)
+                    scored = board.step_units(row_idx, col_name, result)
+                board.record(scored)
+                board.save(scored)
+            except Exception:
+                logger.exception("Streaming evaluation failed for row %s step %s", row_idx, col_name)
+            finally:
+                if progress_callback:
+                    for _ in range(units):
+                        progress_callback()
+
+    # Workers run in copies of the caller's context so LLM calls reach its usage tracker
+    workers = [
+        threading.Thread(target=contextvars.copy_context().run, args=(eval_worker,), name=f"stream-eval-{i}", daemon=True)
+        for i in range(max_eval_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Generation: rows in parallel, each row emitting its steps as they complete
+    results = {}
+    prompt_tokens = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=executor_workers(df.shape[0])) as executor:
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run, process_row_with_chat, row_idx, df, prompt, model_name,
+                    BASELINE_SYSTEM_PROMPT, selected_personas[row_idx], on_step, checkpoint
+                ): row_idx
+                for row_idx in range(df.shape[0])
+            }
+            for future in concurrent.futures.as_completed(futures):
+                row_idx = futures[future]
+                try:
+                    row_data, tokens_dict = future.result()
+                    results[row_idx] = row_data
+                    prompt_tokens[row_idx] = tokens_dict
+                    if evaluation_mode == EVALUATION_MODE_ROW:
+                        eval_queue.put((row_idx, None, row_data))
+                except Exception:
+                    logger.exception("Streaming generation failed for row %s", row_idx)
+        if evaluation_mode == EVALUATION_MODE_PACKED:
+            # Score whatever is left in partially filled packs
+            for label, packer in packers.items():
+                pack = packer.flush()
+                if pack:
+                    eval_queue.put((None, label, pack))
+    finally:
+        for _ in workers:
+            eval_queue.put(_DONE)
+        for worker in workers:
+            worker.join()
+
+    # Rows whose generation failed are dropped from both outputs to keep them aligned
+    completed_rows = list(results.keys())
+    final_df = assemble_baseline_frame([results[row_idx] for row_idx in completed_rows])
+    results_df, eval_tokens = board.results(completed_rows)
+
+    return final_df, [prompt_tokens[row_idx] for row_idx in completed_rows], results_df, eval_tokens
@@ -3,13 +3,18 @@ Pricing utility for LLM token cost calculation.
 
 Supports multiple models with a fallback pricing table.
 For Gemini 2.0 Flash, live rates can be fetched from the Google Cloud Billing
-Catalog API when GCP_BILLING_API_KEY is set.
+Catalog API when GCP_BILLING_API_KEY is set. They are kept in a PricingIndex
+that is persisted to a JSON snapshot and refreshed in the background, so cost
+lookups never wait on the API.
 """
 
 import os
 import json
 import logging
-from typing import Tuple
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Tuple
 from urllib.request import Request, urlopen
 from urllib.error import URLError, HTTPError
 
@@ -38,8 +43,11 @@ MODEL_PRICING: dict = {
     # "claude-3-5-haiku-20241022":     {"input_per_million": 0.80,  "output_per_million": 4.00},
 }
 
-# In-memory cache for rates (avoids API calls on every simulation)
-_cached_rates: Tuple[float, float] | None = None
+# Catalog SKUs (input, output) of each model with live rates. Every SKU is
+# priced in the same catalog pass, so adding a model here costs no extra requests.
+MODEL_SKUS: Dict[str, Tuple[str, str]] = {
+    "gemini-2.0-flash": (GEMINI_2_FLASH_INPUT_SKU, GEMINI_2_FLASH_OUTPUT_SKU),
+}
 
 
 def _parse_price_per_token(pe: dict, price_per_unit: float) -> float:
@@ -103,71 +111,211 @@ def _iter_skus(api_key: str):
             return
 
 
-def _fetch_sku_price(api_key: str, sku_id: str) -> float | None:
+def _sku_price_per_token(sku: dict) -> float | None:
+    """USD per token from a SKU's first tiered rate, or None when it has no usable price."""
+    pricing_info = sku.get("pricingInfo") or []
+    if not pricing_info:
+        return None
+    pe = pricing_info[0].get("pricingExpression") or {}
+    tiered = pe.get("tieredRates") or []
+    if not tiered:
+        return None
+    rate = tiered[0]
+    unit_price = rate.get("unitPrice") or {}
+    units = int(unit_price.get("units", 0) or 0)
+    nanos = int(unit_price.get("nanos", 0) or 0)
+    price_per_unit = units + nanos / 1e9
+    return _parse_price_per_token(pe, price_per_unit)
+
+
+def fetch_sku_prices(api_key: str, sku_ids) -> Dict[str, float]:
     """
-    Fetch price per token for a SKU from Cloud Billing Catalog API.
-    Returns USD per token, or None on failure / not found.
+    Price per token (USD) for every requested SKU, from a single pass over the
+    catalog that stops as soon as all of them have been seen. SKUs that are
+    missing or unpriced are left out.
     """
+    wanted = set(sku_ids)
+    prices: Dict[str, float] = {}
     for sku in _iter_skus(api_key):
-        if sku.get("skuId") != sku_id:
-            continue
-        pricing_info = sku.get("pricingInfo") or []
-        if not pricing_info:
+        sku_id = sku.get("skuId")
+        if sku_id not in wanted:
             continue
-        pe = pricing_info[0].get("pricingExpression") or {}
-        tiered = pe.get("tieredRates") or []
-        if not tiered:
+        price = _sku_price_per_token(sku)
+        if price is None:
             continue
-        rate = tiered[0]
-        unit_price = rate.get("unitPrice") or {}
-        units = int(unit_price.get("units", 0) or 0)
-        nanos = int(unit_price.get("nanos", 0) or 0)
-        price_per_unit = units + nanos / 1e9
-        return _parse_price_per_token(pe, price_per_unit)
+        prices[sku_id] = price
+        wanted.discard(sku_id)
+        if not wanted:
+            break
 
     # SKU IDs are hardcoded and can be deprecated/renamed by Google. If the
     # configured SKU is missing, the caller falls back to static rates silently;
     # log it so a stale SKU ID is visible rather than failing quietly.
-    logger.warning(
-        "SKU %s not found in Cloud Billing Catalog response for service %s",
-        sku_id,
-        VERTEX_AI_SERVICE_ID,
-    )
-    return None
+    for sku_id in wanted:
+        logger.warning(
+            "SKU %s not found in Cloud Billing Catalog response for service %s",
+            sku_id,
+            VERTEX_AI_SERVICE_ID,
+        )
+    return prices
+
+
+class PricingIndex:
+    """
+    Live per-token rates for every model in MODEL_SKUS, built in one catalog
+    pass and persisted to a small JSON snapshot.
+
+    Lookups only read memory: a stale or missing index starts a background
+    refresh (at most one at a time, and not more often than retry_seconds
+    after a failed one) and the caller gets the current rates or None
+    meanwhile. A snapshot file is used as-is when there is no API key, so a
+    copied snapshot works offline.
+
+    Args:
+        snapshot_path: JSON file the index is loaded from and saved to
+        ttl_seconds: Age after which the index is refreshed
+        retry_seconds: Minimum time between refresh attempts
+    """
+
+    def __init__(self, snapshot_path: str, ttl_seconds: float, retry_seconds: float = 300.0):
+        self.snapshot_path = snapshot_path
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._rates: Dict[str, Tuple[float, float]] = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._refreshing = False
+        self.refreshes = 0
+        self.failures = 0
+        self._load_snapshot()
+
+    def _load_snapshot(self) -> None:
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            rates = {model: (float(r[0]), float(r[1])) for model, r in snapshot["rates"].items()}
+            fetched_at = float(snapshot["fetched_at"])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            logger.warning("Ignoring unreadable pricing snapshot %s: %s", self.snapshot_path, e)
+            return
+        with self._lock:
+            self._rates, self._fetched_at = rates, fetched_at
+
+    def _save_snapshot(self, rates: Dict[str, Tuple[float, float]], fetched_at: float) -> None:
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": fetched_at, "rates": rates}, f, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.warning("Could not write pricing snapshot %s: %s", self.snapshot_path, e)
+
+    def refresh(self, api_key: str) -> bool:
+        """Rebuild the index from the catalog (blocking); True when any model was priced."""
+        prices = fetch_sku_prices(api_key, {sku for skus in MODEL_SKUS.values() for sku in skus})
+        fetched = {
+            model: (prices[input_sku], prices[output_sku])
+            for model, (input_sku, output_sku) in MODEL_SKUS.items()
+            if input_sku in prices and output_sku in prices
+        }
+        now = time.time()
+        with self._lock:
+            self._last_attempt = now
+            if not fetched:
+                self.failures += 1
+                return False
+            # Models the catalog did not price this time keep their last known rates
+            self._rates = {**self._rates, **fetched}
+            self._fetched_at = now
+            self.refreshes += 1
+            rates = dict(self._rates)
+        self._save_snapshot(rates, now)
+        return True
+
+    def refresh_in_background(self) -> None:
+        """Start a refresh thread when the index is stale and an API key is configured."""
+        api_key = os.environ.get("GCP_BILLING_API_KEY", "").strip()
+        if not api_key:
+            return
+        now = time.time()
+        with self._lock:
+            if (
+                self._refreshing
+                or now - self._fetched_at < self.ttl_seconds
+                or now - self._last_attempt < self.retry_seconds
+            ):
+                return
+            self._refreshing = True
+            self._last_attempt = now
+
+        def run():
+            try:
+                self.refresh(api_key)
+            except Exception:
+                logger.exception("Pricing index refresh failed")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="pricing-refresh", daemon=True).start()
+
+    def rates(self, model_name: str) -> Tuple[float, float] | None:
+        """(input, output) USD per token for a model, or None when it is not indexed yet."""
+        self.refresh_in_background()
+        with self._lock:
+            return self._rates.get(model_name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "models": sorted(self._rates),
+                "age_seconds": round(time.time() - self._fetched_at) if self._fetched_at else None,
+                "refreshing": self._refreshing,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+            }
+
+
+_index: PricingIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_pricing_index() -> PricingIndex:
+    """Process-wide index backed by PRICING_SNAPSHOT_PATH, refreshed every PRICING_SNAPSHOT_TTL seconds."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PricingIndex(
+                os.environ.get("PRICING_SNAPSHOT_PATH")
+                or os.path.join(tempfile.gettempdir(), "pricing_snapshot.json"),
+                float(os.environ.get("PRICING_SNAPSHOT_TTL", 24 * 3600)),
+            )
+        return _index
+
+
+def get_pricing_stats() -> Dict[str, Any]:
+    """Indexed models, snapshot age and refresh counters."""
+    return get_pricing_index().stats()
 
 
 def get_gemini_2_flash_rates() -> Tuple[float, float]:
     """
     Get input and output token rates (USD per token) for Gemini 2.0 Flash.
-    Uses Cloud Billing Catalog API when GCP_BILLING_API_KEY is set.
-    """
-    global _cached_rates
-    if _cached_rates is not None:
-        return _cached_rates
-
-    api_key = os.environ.get("GCP_BILLING_API_KEY", "").strip()
-    input_per_token = None
-    output_per_token = None
-
-    if api_key:
-        input_per_token = _fetch_sku_price(api_key, GEMINI_2_FLASH_INPUT_SKU)
-        output_per_token = _fetch_sku_price(api_key, GEMINI_2_FLASH_OUTPUT_SKU)
-
-    # Only cache when both rates came from the live API. Caching fallback rates
-    # would let a transient API failure (or a not-yet-set key) lock the process
-    # into fallback for its entire lifetime; instead we retry the API next call.
-    if input_per_token is not None and output_per_token is not None:
-        _cached_rates = (input_per_token, output_per_token)
-        return _cached_rates
-
-    if input_per_token is None:
-        input_per_token = FALLBACK_INPUT_PER_MILLION / 1_000_000
-        logger.debug("Using fallback input rate: $%.6f per token", input_per_token)
-    if output_per_token is None:
-        output_per_token = FALLBACK_OUTPUT_PER_MILLION / 1_000_000
-        logger.debug("Using fallback output rate: $%.6f per token", output_per_token)
-
-    return (input_per_token, output_per_token)
+    Uses the pricing index (live Cloud Billing Catalog rates when
+    GCP_BILLING_API_KEY is set or a snapshot exists) and never waits on the API.
+    """
+    rates = get_pricing_index().rates("gemini-2.0-flash")
+    if rates is not None:
+        return rates
+    logger.debug(
+        "Using fallback rates: $%.6f input, $%.6f output per token",
+        FALLBACK_INPUT_PER_MILLION / 1_000_000,
+        FALLBACK_OUTPUT_PER_MILLION / 1_000_000,
+    )
+    return (FALLBACK_INPUT_PER_MILLION / 1_000_000, FALLBACK_OUTPUT_PER_MILLION / 1_000_000)
 
 
 def compute_cost(
@@ -1,12 +1,139 @@
 """
 Thread-safe progress updater for evaluation workflows.
-Used by baseline_prompt and evaluate to report progress to Supabase
-as rows complete in ThreadPoolExecutor as_completed loops.
+Used by the generate-and-evaluate pipelines to report progress to Supabase
+as steps are generated and scored.
+
+Workers never write to Supabase themselves: each completion only records the
+new percentage, and a background flusher per experiment writes the latest
+value at most once per flush interval (and immediately on completion).
 """
 
+import os
 import threading
+import time
 from typing import Any, Callable, Optional
 
+from .experiment_state import experiment_states
+
+# Seconds over which progress events are coalesced into a single write
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 1.0))
+
+
+class ProgressUpdater:
+    """
+    Callable progress reporter with a background flusher thread.
+
+    Call the instance after each item completes; call flush() at phase
+    boundaries and close() when the phase is over so the final value is
+    written and the flusher thread exits.
+    """
+
+    def __init__(
+        self,
+        uuid: str,
+        supabase: Any,
+        min_pct: float,
+        max_pct: float,
+        total_items: int,
+        *,
+        get_client: Optional[Callable] = None,
+        jwt: Optional[str] = None,
+        no_throttle: bool = False,
+        flush_interval: Optional[float] = None,
+    ):
+        self.uuid = uuid
+        self.supabase = supabase
+        self.min_pct = min_pct
+        self.max_pct = max_pct
+        self.total_items = total_items
+        self.get_client = get_client
+        self.jwt = jwt
+        self.no_throttle = no_throttle
+        self.flush_interval = PROGRESS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._completed = 0
+        self._last_queued = min_pct
+        self._pending = None  # latest percentage not yet written
+        self._last_written = round(min_pct)
+        self._closed = False
+        self._thread = None
+        self.writes = 0
+
+    def _get_client(self):
+        if self.get_client and self.jwt is not None:
+            return self.get_client(self.jwt)
+        return self.supabase
+
+    def _done(self) -> bool:
+        return self._completed >= self.total_items
+
+    def __call__(self):
+        with self._cond:
+            self._completed += 1
+            if self.total_items > 0:
+                pct = self.min_pct + (self.max_pct - self.min_pct) * (self._completed / self.total_items)
+            else:
+                pct = self.max_pct
+            # Queue every change if no_throttle, else only +1% steps or the last item
+            if not (self.no_throttle or pct - self._last_queued >= 1 or self._done()):
+                return
+            self._last_queued = pct
+            self._pending = round(pct)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"progress-{self.uuid}", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    # close() writes whatever is left
+                    return
+                # Coalescing window: later events just overwrite _pending.
+                # Completion or close() cut the window short.
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and not self._done():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        """Write the latest pending percentage now, if it is newer than the last write."""
+        with self._write_lock:
+            with self._cond:
+                pct_to_write, self._pending = self._pending, None
+            if pct_to_write is None or pct_to_write <= self._last_written:
+                return
+            try:
+                client = self._get_client()
+                print(f"[progress] Writing progress: {pct_to_write}", flush=True)
+                client.table("experiments").update({"progress": pct_to_write}).eq("experiment_id", self.uuid).execute()
+            except Exception:
+                return  # Don't fail evaluation on progress write errors
+            self._last_written = pct_to_write
+            self.writes += 1
+            # Published only once stored, so in-process readers never see a value the database lacks
+            experiment_states.publish(self.uuid, {"progress": pct_to_write})
+
+    def close(self):
+        """Stop the flusher thread and write the final value."""
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.flush()
+
 
 def create_progress_updater(
     uuid: str,
@@ -18,9 +145,10 @@ def create_progress_updater(
     get_client: Optional[Callable] = None,
     jwt: Optional[str] = None,
     no_throttle: bool = False,
+    flush_interval: Optional[float] = None,
 ):
     """
-    Returns a callback for as_completed loops. Thread-safe.
+    Returns a callback for as_completed loops. Thread-safe and non-blocking.
 
     Args:
         uuid: experiment_id for the row to update
@@ -28,43 +156,17 @@ def create_progress_updater(
         min_pct: Start of progress range (e.g. 10)
         max_pct: End of progress range (e.g. 30)
         total_items: Total number of items to process
-        get_client: Optional factory (e.g. get_supabase_client) for fresh client per write (thread-safe)
+        get_client: Optional factory (e.g. get_supabase_client) for a client per write (thread-safe)
         jwt: JWT to pass to get_client when creating client
-        no_throttle: If True, write on every completion (for long-running phases like evaluate)
+        no_throttle: If True, every completion updates the pending value (for long-running
+            phases like evaluate); writes are still coalesced over flush_interval
+        flush_interval: Seconds between writes (defaults to PROGRESS_FLUSH_INTERVAL)
 
     Returns:
-        Callable that should be invoked after each item completes
+        ProgressUpdater that should be invoked after each item completes, with
+        flush() and close() for phase boundaries
     """
-    lock = threading.Lock()
-    completed = [0]  # mutable for closure
-    last_written = [min_pct]
-
-    def _get_client():
-        if get_client and jwt is not None:
-            return get_client(jwt)
-        return supabase
-
-    def on_item_completed():
-        with lock:
-            completed[0] += 1
-            pct = min_pct + (max_pct - min_pct) * (completed[0] / total_items) if total_items > 0 else max_pct
-            # Write: every time if no_throttle, else when +1% or last item
-            should_write = (
-                no_throttle or
-                pct - last_written[0] >= 1 or
-                completed[0] >= total_items
-            )
-            if should_write:
-                last_written[0] = pct
-                pct_to_write = round(pct)
-            else:
-                pct_to_write = None
-        if pct_to_write is not None:
-            try:
-                client = _get_client()
-                print(f"[progress] Writing progress: {pct_to_write}", flush=True)
-                client.table("experiments").update({"progress": pct_to_write}).eq("experiment_id", uuid).execute()
-            except Exception:
-                pass  # Don't fail evaluation on progress write errors
-
-    return on_item_completed
+    return ProgressUpdater(
+        uuid, supabase, min_pct, max_pct, total_items,
+        get_client=get_client, jwt=jwt, no_throttle=no_throttle, flush_interval=flush_interval,
+    )
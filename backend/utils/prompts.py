@@ -5,19 +5,36 @@ It includes utilities for handling persona-based responses and parallel processi
 
 import pandas as pd
 import json
-import concurrent.futures
+import asyncio
+import logging
 import random
 
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 
-from .llm import invoke_structured, BaseResponse
+from .llm import invoke_structured, invoke_structured_async, BaseResponse, BudgetExceeded, estimate_tokens
+from .response_cache import CACHE_SITE_GENERATION
 from .personas import personas
 from .used_prompts import (
-    BASELINE_SYSTEM_PROMPT,
     get_baseline_first_column_user_prompt,
-    get_baseline_subsequent_column_user_prompt
+    get_baseline_subsequent_column_user_prompt,
+    get_baseline_conversation_step_user_prompt,
 )
 
+logger = logging.getLogger(__name__)
+
+_NO_USAGE = {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0}
+
+# Generation modes: "replay" (default) sends one self-contained prompt per step
+# that repeats the persona and every earlier prompt/response; "conversation"
+# keeps a System/Human/AI message history per row and only adds the new step,
+# so input tokens grow linearly with the number of steps and the stable prefix
+# can be served from the provider's context cache.
+GENERATION_MODE_REPLAY = "replay"
+GENERATION_MODE_CONVERSATION = "conversation"
+
+# Placeholder stored for a step whose generation call failed (never checkpointed)
+GENERATION_ERROR_RESPONSE = "Error processing row ignore in simulation"
+
 
 def persona_dict_to_string(persona):
     """
@@ -44,45 +61,134 @@ def persona_dict_to_string(persona):
     return str(persona)
 
 
-def process_row_with_chat(row_idx, df, prompt, model_name, system_prompt, persona):
+def init_row_data(row_idx, df):
     """
-    Process a single row of data using the Gemini AI model with chat-based interaction.
-    
-    Args:
-        row_idx (int): Index of the row to process
-        df (pd.DataFrame): DataFrame containing the data to process
-        prompt (list): List containing prompt configuration and steps
-        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
-        system_prompt (str): System-level instructions for the AI model
-        persona (dict or str): The persona to use for this row (can be dict or string)
-    
+    Create the starting row_data and token counters for one persona row.
+
     Returns:
-        tuple: (row_data, tokens_dict) where:
-            - row_data (dict): Processed response data for the row
-            - tokens_dict (dict): Token usage statistics
+        tuple: (row_data, tokens_dict)
     """
-    # Convert persona to string if it's a dictionary
-    persona_str = persona_dict_to_string(persona)
-    
     # Initialize row data based on whether seed column exists
     if "seed" in df.columns:
         row_data = {'seed': df.iloc[row_idx]['seed']}
-        seed_value = df.iloc[row_idx]['seed']
     else:
         row_data = {}
-        seed_value = "no-seed"  # Default value when seed is not included
-
-    # Get the steps array from the prompt
-    steps = prompt['steps']
-
-    prompt_list = []
 
     # Initialize token usage tracking
     tokens_dict = {
         'prompt_tokens': 0,
         'response_tokens': 0,
-        'total_tokens': 0
+        'total_tokens': 0,
+        # Input tokens served from the provider's context cache
+        'cached_prompt_tokens': 0,
+        # Estimated input tokens conversation mode avoided sending
+        'saved_prompt_tokens': 0,
     }
+    return row_data, tokens_dict
+
+
+def build_step_messages(df, steps, system_prompt, persona_str, prompt_list, row_data, col_idx, col_name, instructions):
+    """
+    Build the chat messages for one step of a persona row.
+
+    The first processed step introduces the persona; its prompt is appended to
+    prompt_list and reused as the base for every later step, which also replays
+    the earlier prompts and responses stored in row_data.
+
+    Returns:
+        list: [SystemMessage, HumanMessage] for the step
+    """
+    # Handle first processed step differently (initial prompt with persona)
+    # Check if this is the first step we're processing (prompt_list is empty)
+    if len(prompt_list) == 0:
+        llm_prompt = get_baseline_first_column_user_prompt(persona_str, col_name, instructions)
+        prompt_list.append(llm_prompt)
+    else:
+        # Build prompt including previous steps and responses
+        # Use the first prompt (which includes persona) as the base
+        llm_prompt = get_baseline_subsequent_column_user_prompt(
+            prompt_list[0],
+            list(df.columns),
+            steps,
+            row_data,
+            col_idx,
+            col_name,
+            instructions
+        )
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=llm_prompt),
+    ]
+
+
+def build_conversation_messages(df, steps, system_prompt, persona_str, prompt_list, conversation,
+                                row_data, col_idx, col_name, instructions, tokens_dict):
+    """
+    Build the chat messages for one step in conversation mode.
+
+    The first step is the same as in replay mode. Later steps append only a
+    short Human turn to conversation (which already holds the earlier AI
+    responses), and the tokens the replay prompt would have cost on top of that
+    are added to tokens_dict['saved_prompt_tokens'].
+
+    Returns:
+        list: Copy of the conversation history ending with this step's HumanMessage
+    """
+    if not conversation:
+        conversation.extend(build_step_messages(
+            df, steps, system_prompt, persona_str, prompt_list, row_data, col_idx, col_name, instructions
+        ))
+    else:
+        replay_messages = build_step_messages(
+            df, steps, system_prompt, persona_str, prompt_list, row_data, col_idx, col_name, instructions
+        )
+        conversation.append(HumanMessage(content=get_baseline_conversation_step_user_prompt(col_name, instructions)))
+        tokens_dict['saved_prompt_tokens'] += max(0, estimate_tokens(replay_messages) - estimate_tokens(conversation))
+    return list(conversation)
+
+
+def record_step_result(row_data, tokens_dict, col_name, parsed, usage, conversation=None):
+    """
+    Store a step's parsed response in row_data and add its token usage to tokens_dict.
+    In conversation mode the response is also appended to the history as an AI turn.
+    """
+    # Track token usage
+    tokens_dict['prompt_tokens'] += usage['input_tokens']
+    tokens_dict['response_tokens'] += usage['output_tokens']
+    tokens_dict['total_tokens'] += usage['total_tokens']
+    tokens_dict['cached_prompt_tokens'] += usage.get('cached_tokens', 0)
+
+    # Process the response
+    if parsed is not None:
+        row_data[col_name] = parsed.response
+    else:
+        row_data[col_name] = GENERATION_ERROR_RESPONSE
+
+    if conversation is not None:
+        conversation.append(AIMessage(content=row_data[col_name]))
+
+
+def _chat_row_steps(row_idx, df, prompt, system_prompt, persona, on_step, checkpoint):
+    """
+    Walks one row's steps for process_row_with_chat and its asyncio version.
+
+    A generator: yields (col_name, messages, temperature) for each step that needs an
+    LLM call and expects the (parsed, usage) result sent back, so the sync and async
+    drivers differ only in how they invoke the model. Returns (row_data, tokens_dict).
+    """
+    # Convert persona to string if it's a dictionary
+    persona_str = persona_dict_to_string(persona)
+    row_data, tokens_dict = init_row_data(row_idx, df)
+
+    # Get the steps array from the prompt
+    steps = prompt['steps']
+
+    prompt_list = []
+    # Message history for conversation mode (None in replay mode)
+    conversation = [] if prompt.get('generation_mode') == GENERATION_MODE_CONVERSATION else None
+    # Responses checkpointed by an earlier attempt, by step label
+    resumed = checkpoint.generated_for_row(row_idx) if checkpoint is not None else {}
 
     # Process each column in the row
     for col_idx in range(0, df.shape[1]):
@@ -93,73 +199,144 @@ def process_row_with_chat(row_idx, df, prompt, model_name, system_prompt, person
             (step for step in steps if step['label'] == col_name), None)
 
         if matching_step:
-            instructions = matching_step['instructions']
-            temperature = matching_step['temperature']
-
-            # Handle first processed step differently (initial prompt with persona)
-            # Check if this is the first step we're processing (prompt_list is empty)
-            if len(prompt_list) == 0:
-                llm_prompt = get_baseline_first_column_user_prompt(persona_str, col_name, instructions)
-                prompt_list.append(llm_prompt)
+            if conversation is not None:
+                messages = build_conversation_messages(
+                    df, steps, system_prompt, persona_str, prompt_list, conversation, row_data,
+                    col_idx, col_name, matching_step['instructions'], tokens_dict
+                )
             else:
-                # Build prompt including previous steps and responses
-                # Use the first prompt (which includes persona) as the base
-                llm_prompt = get_baseline_subsequent_column_user_prompt(
-                    prompt_list[0],
-                    list(df.columns),
-                    steps,
-                    row_data,
-                    col_idx,
-                    col_name,
-                    instructions
+                messages = build_step_messages(
+                    df, steps, system_prompt, persona_str, prompt_list, row_data,
+                    col_idx, col_name, matching_step['instructions']
                 )
 
-            # Invoke the LLM with structured output via LangChain
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=llm_prompt),
-            ]
-            parsed, usage = invoke_structured(
-                model_name, BaseResponse, messages, temperature=temperature / 100.0
-            )
-
-            # Track token usage
-            tokens_dict['prompt_tokens'] += usage['input_tokens']
-            tokens_dict['response_tokens'] += usage['output_tokens']
-            tokens_dict['total_tokens'] += usage['total_tokens']
-
-            # Process the response
-            if parsed is not None:
-                row_data[col_name] = parsed.response
+            saved = resumed.get(col_name)
+            if saved is not None:
+                # Generated before a restart: reuse the checkpointed response
+                parsed, usage = BaseResponse(response=saved[0]), saved[1]
             else:
-                row_data[col_name] = "Error processing row ignore in simulation"
+                parsed, usage = yield col_name, messages, matching_step['temperature'] / 100.0
+            record_step_result(row_data, tokens_dict, col_name, parsed, usage, conversation)
+
+            if on_step:
+                on_step(row_idx, col_name, row_data[col_name])
         else:
             row_data[col_name] = "No matching instructions found"
-    
+
     # Add persona information to the row data (store the original persona, not the string version)
     row_data['persona'] = persona
 
     return row_data, tokens_dict
 
 
-def baseline_prompt(prompt, model_name, sample=None, progress_callback=None):
-    """
-    Process multiple rows in parallel using threading and combine results into a DataFrame.
+def _generation_failed(row_idx, col_name, exc):
+    """(parsed, usage) for a step whose LLM call raised; call from the except block."""
+    # A step that fails is marked, not the whole row dropped. BudgetExceeded means the
+    # cost ceiling was reached without calling the provider, so it is not logged.
+    if not isinstance(exc, BudgetExceeded):
+        logger.exception("Generation failed for row %s step %s", row_idx, col_name)
+    return None, dict(_NO_USAGE)
+
 
+def process_row_with_chat(row_idx, df, prompt, model_name, system_prompt, persona, on_step=None, checkpoint=None):
+    """
+    Process a single row of data using the Gemini AI model with chat-based interaction.
+    
     Args:
-        prompt (list): List containing prompt configuration including seed, steps, and iterations
+        row_idx (int): Index of the row to process
+        df (pd.DataFrame): DataFrame containing the data to process
+        prompt (list): List containing prompt configuration and steps
         model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
-        sample (dict): Sample data containing persona array (list of 10 persona dicts)
-        progress_callback (callable, optional): Called after each row completes for progress tracking
+        system_prompt (str): System-level instructions for the AI model
+        persona (dict or str): The persona to use for this row (can be dict or string)
+        on_step (callable, optional): Called as on_step(row_idx, col_name, response) as soon as
+            each step's response is produced, so downstream stages can start on it
+        checkpoint (RunCheckpoint, optional): Steps already checkpointed for this row are reused
+            without an LLM call; newly generated steps are checkpointed as they complete
+
+    prompt['generation_mode'] selects GENERATION_MODE_REPLAY (default) or
+    GENERATION_MODE_CONVERSATION (see build_conversation_messages).
     
     Returns:
-        tuple: (final_df, tokens_ls) where:
-            - final_df (pd.DataFrame): DataFrame containing all processed responses
-            - tokens_ls (list): List of token usage dictionaries for each row
+        tuple: (row_data, tokens_dict) where:
+            - row_data (dict): Processed response data for the row
+            - tokens_dict (dict): Token usage statistics
     """
-    # System-level instructions for the AI model
-    system_prompt = BASELINE_SYSTEM_PROMPT
+    row_steps = _chat_row_steps(row_idx, df, prompt, system_prompt, persona, on_step, checkpoint)
+    result = None
+    while True:
+        try:
+            col_name, messages, temperature = row_steps.send(result)
+        except StopIteration as done:
+            return done.value
+        try:
+            # Invoke the LLM with structured output via LangChain (transient errors are retried there)
+            result = invoke_structured(
+                model_name, BaseResponse, messages, temperature=temperature,
+                cache_site=CACHE_SITE_GENERATION,
+            )
+        except Exception as exc:
+            result = _generation_failed(row_idx, col_name, exc)
+        if checkpoint is not None and result[0] is not None:
+            checkpoint.save_generation(row_idx, col_name, result[0].response, result[1])
 
+
+async def process_row_with_chat_async(
+    row_idx, df, prompt, model_name, system_prompt, persona, on_step=None, checkpoint=None
+):
+    """
+    Asyncio version of process_row_with_chat: same prompts and outputs, but each
+    step is awaited with invoke_structured_async so many rows share one event loop.
+
+    Args:
+        row_idx (int): Index of the row to process
+        df (pd.DataFrame): DataFrame containing the data to process
+        prompt (list): List containing prompt configuration and steps
+        model_name (str): LLM model identifier (e.g. "gemini-2.0-flash")
+        system_prompt (str): System-level instructions for the AI model
+        persona (dict or str): The persona to use for this row (can be dict or string)
+        on_step (callable, optional): Called as on_step(row_idx, col_name, response) from the
+            event loop as soon as each step's response is produced; must not block
+        checkpoint (RunCheckpoint, optional): As process_row_with_chat
+
+    Returns:
+        tuple: (row_data, tokens_dict), as process_row_with_chat
+    """
+    row_steps = _chat_row_steps(row_idx, df, prompt, system_prompt, persona, on_step, checkpoint)
+    result = None
+    while True:
+        try:
+            col_name, messages, temperature = row_steps.send(result)
+        except StopIteration as done:
+            return done.value
+        try:
+            result = await invoke_structured_async(
+                model_name, BaseResponse, messages, temperature=temperature,
+                cache_site=CACHE_SITE_GENERATION,
+            )
+        except Exception as exc:
+            result = _generation_failed(row_idx, col_name, exc)
+        if checkpoint is not None and result[0] is not None:
+            # SQLite write off the loop so in-flight calls are not stalled
+            await asyncio.to_thread(checkpoint.save_generation, row_idx, col_name, result[0].response, result[1])
+
+
+def prepare_baseline_frame(prompt, sample=None):
+    """
+    Build the empty response DataFrame and persona list for a baseline run.
+
+    Repeated step labels are made unique in place (e.g. "Recall_1", "Recall_2") so
+    each step maps to exactly one column.
+
+    Args:
+        prompt (list): List containing prompt configuration including seed, steps, and iterations
+        sample (dict): Sample data containing persona array (list of 10 persona dicts)
+
+    Returns:
+        tuple: (df, selected_personas) where:
+            - df (pd.DataFrame): One row per persona, one column per step (plus seed if set)
+            - selected_personas (list): Persona for each row of df
+    """
     seed = prompt['seed']
     iterations = prompt['iters']
 
@@ -206,10 +383,8 @@ def baseline_prompt(prompt, model_name, sample=None, progress_callback=None):
     if seed != "no-seed":
         cols.insert(0, "seed")
 
-    # Initialize DataFrame
-    df = pd.DataFrame(columns=cols)
-
     # Create rows based on iteration count
+    rows = []
     for i in range(iterations):
         if seed != "no-seed":
             new_row = {'seed': seed}
@@ -220,25 +395,24 @@ def baseline_prompt(prompt, model_name, sample=None, progress_callback=None):
         else:
             new_row = {}
 
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-
-    # Process rows in parallel
-    results = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = {executor.submit(process_row_with_chat, row_idx, df, prompt, model_name, system_prompt, selected_personas[row_idx]): row_idx for row_idx in range(df.shape[0])}
-        tokens_ls = []
-
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                row_data, tokens_dict = future.result()
-                results.append(row_data)
-                tokens_ls.append(tokens_dict)
-                if progress_callback:
-                    progress_callback()
-            except Exception:
-                pass
-
-    # Convert results to DataFrame
+        rows.append(new_row)
+
+    # Built in one go rather than concatenated row by row (quadratic in iterations)
+    df = pd.DataFrame(rows, columns=cols, index=range(iterations), dtype=object)
+
+    return df, selected_personas
+
+
+def assemble_baseline_frame(results):
+    """
+    Combine per-row results into the final response DataFrame with persona first.
+
+    Args:
+        results (list): row_data dictionaries returned by process_row_with_chat
+
+    Returns:
+        pd.DataFrame: One row per result, persona as the first column
+    """
     final_df = pd.DataFrame(results)
     
     # Reorder columns to make persona the first column
@@ -246,4 +420,4 @@ def baseline_prompt(prompt, model_name, sample=None, progress_callback=None):
         cols = ['persona'] + [col for col in final_df.columns if col != 'persona']
         final_df = final_df[cols]
 
-    return final_df, tokens_ls
+    return final_df
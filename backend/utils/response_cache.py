@@ -0,0 +1,268 @@
+"""
+Content-addressed cache for LLM responses.
+
+Responses are keyed by a hash of (resolved model, output schema, messages,
+temperature) and stored in two tiers: a small in-process LRU and a
+SQLite file shared by every worker on the instance. Entries expire after a TTL
+and the oldest-used rows are evicted once the file exceeds its entry limit.
+
+Caching is opt-in per call site through LLM_CACHE_SITES, e.g.
+
+    LLM_CACHE_SITES="evaluation,persona"
+
+Only deterministic calls (temperature 0) are cached. A sampled call is meant
+to vary between identical requests (evaluation at temperature 1 averages
+that variance away over repeated scores), and replaying one stored response
+would silently remove it, so sampled calls always reach the model.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Call sites that can opt in to caching
+CACHE_SITE_GENERATION = "generation"
+CACHE_SITE_EVALUATION = "evaluation"
+CACHE_SITE_GENERATE_STEPS = "generate_steps"
+CACHE_SITE_PERSONA = "persona"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def _parse_sites(spec: str) -> Set[str]:
+    # "a,b" -> {"a", "b"}
+    sites = set()
+    for entry in spec.split(","):
+        name, _, seed = entry.strip().partition(":")
+        if seed:
+            # Older configs gave sampled sites a replay seed ("evaluation:7")
+            logger.warning("Ignoring seed in LLM_CACHE_SITES entry %r; sampled calls are never cached", entry.strip())
+        if name.strip():
+            sites.add(name.strip())
+    return sites
+
+
+def _message_fingerprint(messages: List) -> List[Tuple[str, Any]]:
+    return [(getattr(m, "type", type(m).__name__), getattr(m, "content", m)) for m in messages]
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + SQLite) store of serialized LLM responses.
+
+    Args:
+        db_path: SQLite file for the on-disk tier (created if missing)
+        sites: Opted-in call site names
+        ttl_seconds: Age after which an entry is no longer served
+        max_entries: Maximum rows kept on disk before least-recently-used eviction
+        memory_entries: Size of the in-process LRU tier
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        sites: Set[str],
+        *,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 50_000,
+        memory_entries: int = 1024,
+    ):
+        self.db_path = db_path
+        self.sites = set(sites)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self.memory_entries = max(1, int(memory_entries))
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "bypassed": 0,
+            "disk_evictions": 0,
+            "errors": 0,
+        }
+        self._disk_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        if not self._disk_ready:
+            conn.executescript(_SCHEMA)
+            self._disk_ready = True
+        return conn
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def key_for(
+        self,
+        site: Optional[str],
+        model_name: str,
+        schema_id: str,
+        messages: List,
+        temperature: float,
+    ) -> Optional[str]:
+        """
+        Cache key for a call, or None when the call must bypass the cache
+        (site not opted in, or sampled with temperature > 0).
+        """
+        if not site or site not in self.sites:
+            return None
+        if temperature > 0:
+            self._count("bypassed")
+            return None
+        material = json.dumps(
+            [model_name, schema_id, _message_fingerprint(messages), round(float(temperature), 4)],
+            default=str,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for key, checking memory before disk."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ? AND created_at >= ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            logger.exception("Response cache read failed")
+            self._count("errors")
+            row = None
+
+        if row is None:
+            self._count("misses")
+            return None
+        self._remember(key, row[0], row[1])
+        self._count("disk_hits")
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Store value in both tiers."""
+        now = time.time()
+        self._remember(key, value, now)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                with self._lock:
+                    self._counters["writes"] += 1
+                    self._writes_since_evict += 1
+                    evict = self._writes_since_evict >= 100
+                    if evict:
+                        self._writes_since_evict = 0
+                if evict:
+                    self._evict(conn, now)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            logger.exception("Response cache write failed")
+            self._count("errors")
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        # Expired rows first, then least recently used rows beyond max_entries
+        removed = conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (excess,),
+            ).rowcount
+        if removed:
+            self._count("disk_evictions", removed)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM responses")
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            logger.exception("Response cache clear failed")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_size"] = len(self._memory)
+        stats["sites"] = sorted(self.sites)
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache configured from the LLM_CACHE_* environment variables."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                os.environ.get("LLM_CACHE_PATH")
+                or os.path.join(tempfile.gettempdir(), "llm_response_cache.sqlite3"),
+                _parse_sites(os.environ.get("LLM_CACHE_SITES", "")),
+                ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+                max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 50_000)),
+                memory_entries=int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", 1024)),
+            )
+        return _cache
+
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/write counts for the response cache."""
+    return get_response_cache().stats()
@@ -0,0 +1,71 @@
+"""
+Short-lived signed tokens for /api/progress/stream.
+
+EventSource cannot send an Authorization header, and putting the user's JWT in
+the URL leaks it into proxy and access logs. Instead the client exchanges its
+JWT (in the header) for a token bound to one experiment and user, valid for a
+minute or so, and opens the stream with that. A token is an HMAC-SHA256 over
+"<task_id>:<user_id>:<expiry>", so any instance sharing the secret can verify
+it without a lookup.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class StreamTokenSigner:
+    """
+    Issues and verifies stream tokens.
+
+    Args:
+        secret: HMAC key; None generates a per-process key, so tokens only
+            verify on the instance that issued them
+        ttl_seconds: How long an issued token is accepted
+    """
+
+    def __init__(self, secret: Optional[str], ttl_seconds: float = 60.0):
+        if not secret:
+            logger.warning(
+                "No stream token secret configured; progress stream tokens only verify on the issuing instance")
+            secret = secrets.token_hex(32)
+        self._key = secret.encode("utf-8")
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()
+
+    def issue(self, task_id: str, user_id: str, now: Optional[float] = None) -> str:
+        """Token granting access to task_id's progress stream until now + ttl_seconds."""
+        expires = int((time.time() if now is None else now) + self.ttl_seconds)
+        payload = json.dumps([str(task_id), str(user_id), expires], separators=(",", ":")).encode("utf-8")
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    def verify(self, token: Optional[str], now: Optional[float] = None) -> Optional[Dict[str, str]]:
+        """{task_id, user_id} for a valid unexpired token, else None."""
+        try:
+            encoded_payload, encoded_signature = (token or "").split(".")
+            payload = _b64decode(encoded_payload)
+            if not hmac.compare_digest(_b64decode(encoded_signature), self._sign(payload)):
+                return None
+            task_id, user_id, expires = json.loads(payload)
+        except (ValueError, TypeError):
+            return None
+        if (time.time() if now is None else now) >= expires:
+            return None
+        return {"task_id": task_id, "user_id": user_id}
@@ -0,0 +1,172 @@
+"""
+Thread-safe pool of Supabase clients keyed by JWT.
+
+Creating a client and calling auth.set_session costs an HTTP client, an auth
+round-trip and (with auto-refresh) a timer per call. Progress writes happen
+hundreds of times per simulation with the same JWT, so clients are reused
+until the token they were built for expires. The service-role client has its
+own slot and is created once per process.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Key of the client built without a JWT (anon key only)
+_ANON = "anon"
+
+# PostgREST error codes for a rejected JWT (missing secret, expired, invalid claims)
+_JWT_ERROR_CODES = {"PGRST300", "PGRST301", "PGRST302", "PGRST303"}
+
+
+def jwt_expiry(jwt: str) -> Optional[float]:
+    """
+    Read the exp claim (epoch seconds) from a JWT without verifying it.
+
+    The token is only used to decide how long a client may be cached;
+    Supabase still verifies it on every request.
+    """
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        exp = claims.get("exp")
+        return float(exp) if exp is not None else None
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return None
+
+
+def is_auth_error(exc: BaseException) -> bool:
+    """True when a Supabase call failed because its JWT was rejected (HTTP 401 or a JWT error)."""
+    if str(getattr(exc, "code", "") or "") in _JWT_ERROR_CODES | {"401"}:
+        return True
+    if getattr(getattr(exc, "response", None), "status_code", None) == 401:
+        return True
+    return "jwt" in str(getattr(exc, "message", None) or exc).lower()
+
+
+class SupabaseClientPool:
+    """
+    Reuses Supabase clients per JWT until shortly before the JWT expires.
+
+    Args:
+        create_client: Callable(jwt or None) returning a new authenticated client
+        create_service_client: Callable returning the service-role client (or None
+            when no service key is configured)
+        max_size: Maximum cached JWT clients; least recently used are dropped first
+        default_ttl: Lifetime in seconds for clients whose JWT has no exp claim
+            (and for the anon client)
+        expiry_margin: Seconds before a JWT's exp at which its client is replaced
+    """
+
+    def __init__(
+        self,
+        create_client: Callable[[Optional[str]], Any],
+        create_service_client: Callable[[], Any],
+        *,
+        max_size: int = 256,
+        default_ttl: float = 3600.0,
+        expiry_margin: float = 30.0,
+    ):
+        self.create_client = create_client
+        self.create_service_client = create_service_client
+        self.max_size = max(1, int(max_size))
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+
+        self._clients: "OrderedDict[str, tuple]" = OrderedDict()
+        self._service = None
+        self._lock = threading.Lock()
+        self._service_lock = threading.Lock()
+        self.creations = 0
+        self.reuses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.auth_invalidations = 0
+
+    def _expires_at(self, jwt: Optional[str], now: float) -> float:
+        exp = jwt_expiry(jwt) if jwt else None
+        if exp is None:
+            return now + self.default_ttl
+        return exp - self.expiry_margin
+
+    def get(self, jwt: Optional[str] = None) -> Any:
+        """Return a client authenticated with jwt (anon when None), creating one if needed."""
+        key = hashlib.sha256(jwt.encode("utf-8")).hexdigest() if jwt else _ANON
+        now = time.time()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None:
+                client, expires_at = entry
+                if now < expires_at:
+                    self._clients.move_to_end(key)
+                    self.reuses += 1
+                    return client
+                del self._clients[key]
+                self.expirations += 1
+
+        # Build outside the lock: set_session makes a network call
+        client = self.create_client(jwt)
+        expires_at = self._expires_at(jwt, now)
+        with self._lock:
+            self.creations += 1
+            if expires_at > now:
+                self._clients[key] = (client, expires_at)
+                self._clients.move_to_end(key)
+                while len(self._clients) > self.max_size:
+                    self._clients.popitem(last=False)
+                    self.evictions += 1
+        return client
+
+    def get_service(self) -> Any:
+        """Return the shared service-role client, or None if it cannot be created."""
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    self._service = self.create_service_client()
+                    if self._service is not None:
+                        with self._lock:
+                            self.creations += 1
+                    return self._service
+        with self._lock:
+            self.reuses += 1
+        return self._service
+
+    def invalidate(self, jwt: Optional[str] = None) -> None:
+        """Drop the cached client for jwt (e.g. after an auth error)."""
+        key = hashlib.sha256(jwt.encode("utf-8")).hexdigest() if jwt else _ANON
+        with self._lock:
+            self._clients.pop(key, None)
+
+    def invalidate_on_auth_error(self, jwt: Optional[str], exc: BaseException) -> bool:
+        """
+        Drop jwt's client when exc is an auth error, so the next request builds a
+        fresh one instead of reusing a session Supabase has rejected.
+        """
+        if not is_auth_error(exc):
+            return False
+        self.invalidate(jwt)
+        with self._lock:
+            self.auth_invalidations += 1
+        logger.info("Dropped pooled Supabase client after an auth error: %s", exc)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "creations": self.creations,
+                "reuses": self.reuses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "auth_invalidations": self.auth_invalidations,
+                "service_client": self._service is not None,
+            }
@@ -72,38 +72,16 @@ VALIDATION: Before returning your response, verify that:
 - If no study title was provided in the context, you have included a "title" field with a concise study title (3-8 words) that describes the study"""
 
 
-# System prompt for baseline prompt generation (from utils/prompts.py - baseline_prompt)
+# System prompt for baseline prompt generation (from utils/prompts.py - process_row_with_chat)
 BASELINE_SYSTEM_PROMPT = """
         You are an AI participating in an interview-style interaction. Your task is to generate concise and structured responses based on a given question.
         Do not use any newline characters or separate your answer with new lines. Provide the response in plain text format as a single continuous sentence.
         """
 
 
-# System prompt for evaluation (from utils/evaluate.py - process_row)
-def get_evaluation_system_prompt(measures: str) -> str:
-    """
-    Generate the evaluation system prompt with specific measures.
-    
-    Args:
-        measures: Formatted string containing measure descriptions, ranges, and reference points
-    
-    Returns:
-        str: Complete system prompt for evaluation
-    """
-    return f"""# Instruction
-You are an expert evaluator. Your task is to evaluate the quality of responses based on specific simulation steps and their associated measures.
-
-You will be provided with:
-1. The simulation step title and instructions
-2. The actual response/output for that step
-3. Specific measures with their ranges and reference points for evaluation
-
-Your task is to evaluate how well the response aligns with the step requirements and meets the specified measures.
-
-# Measures used for evaluation
-{measures}
-
-## Scoring Rubric - CRITICAL INSTRUCTIONS
+# Scoring rubric and evaluation process shared by the per-step and row-batched
+# evaluation system prompts
+EVALUATION_SCORING_RUBRIC = """## Scoring Rubric - CRITICAL INSTRUCTIONS
 
 For each measure, you MUST:
 
@@ -150,7 +128,34 @@ STEP 3: Assign a score
 STEP 4: Verify your score
 - Does this score accurately reflect the quality?
 - Is it using the appropriate part of the range?
-- Would a different response receive a different score?
+- Would a different response receive a different score?"""
+
+
+# System prompt for evaluation (from utils/evaluate.py - evaluate_step)
+def get_evaluation_system_prompt(measures: str) -> str:
+    """
+    Generate the evaluation system prompt with specific measures.
+    
+    Args:
+        measures: Formatted string containing measure descriptions, ranges, and reference points
+    
+    Returns:
+        str: Complete system prompt for evaluation
+    """
+    return f"""# Instruction
+You are an expert evaluator. Your task is to evaluate the quality of responses based on specific simulation steps and their associated measures.
+
+You will be provided with:
+1. The simulation step title and instructions
+2. The actual response/output for that step
+3. Specific measures with their ranges and reference points for evaluation
+
+Your task is to evaluate how well the response aligns with the step requirements and meets the specified measures.
+
+# Measures used for evaluation
+{measures}
+
+{EVALUATION_SCORING_RUBRIC}
 
 ## Output Format
 
@@ -166,6 +171,90 @@ IMPORTANT:
 - DO NOT default to middle values - use the full range appropriately"""
 
 
+# System prompt for row-batched evaluation (from utils/evaluate.py - evaluate_row_batched)
+def get_row_evaluation_system_prompt(measures_by_step: str) -> str:
+    """
+    Generate the system prompt for scoring every step of one participant in a single request.
+    
+    Args:
+        measures_by_step: Measure descriptions grouped under a heading per step
+    
+    Returns:
+        str: Complete system prompt for row-batched evaluation
+    """
+    return f"""# Instruction
+You are an expert evaluator. Your task is to evaluate the quality of one participant's responses across several simulation steps, each with its own associated measures.
+
+You will be provided with, for every step:
+1. The simulation step title and instructions
+2. The actual response/output for that step
+3. The measures for that step, defined below with their ranges and reference points
+
+Evaluate each step independently: score a step's response only against that step's instructions and measures.
+
+# Measures used for evaluation, by step
+{measures_by_step}
+
+{EVALUATION_SCORING_RUBRIC}
+
+## Output Format
+
+Provide a JSON response with:
+- "steps": array with one entry per step, in the order the steps are given, where each entry has:
+  - "step": the exact step title
+  - "metric": array of that step's measure titles in the exact order they appear
+  - "score": array of numeric scores (one per measure) within the specified ranges
+
+IMPORTANT: 
+- Every step MUST have an entry, and each of its measures MUST have a score
+- Scores MUST be within the specified range for each measure
+- Scores MUST vary based on actual quality assessment
+- If a measure is truly not applicable, score it as the minimum value (not 0 unless that's the minimum)
+- DO NOT default to middle values - use the full range appropriately"""
+
+
+# System prompt for packed evaluation (from utils/evaluate.py - evaluate_step_packed)
+def get_packed_evaluation_system_prompt(measures: str) -> str:
+    """
+    Generate the system prompt for scoring many participants' responses to the same step.
+    
+    Args:
+        measures: Formatted string containing measure descriptions, ranges, and reference points
+    
+    Returns:
+        str: Complete system prompt for packed evaluation
+    """
+    return f"""# Instruction
+You are an expert evaluator. Your task is to evaluate the quality of several responses to the same simulation step, each written by a different participant, based on the step and its associated measures.
+
+You will be provided with:
+1. The simulation step title and instructions
+2. A numbered list of responses/outputs for that step
+3. Specific measures with their ranges and reference points for evaluation
+
+Evaluate every response independently. Each response must be scored on its own merits: never let one response influence the score of another, and never combine responses.
+
+# Measures used for evaluation
+{measures}
+
+{EVALUATION_SCORING_RUBRIC}
+
+## Output Format
+
+Provide a JSON response with:
+- "metric": array of measure titles in the exact order they appear
+- "items": array with one entry per response, where each entry has:
+  - "item": the response number exactly as given
+  - "score": array of numeric scores (one per measure, in "metric" order) within the specified ranges
+
+IMPORTANT: 
+- Every response MUST have an entry, and each measure MUST have a score
+- Scores MUST be within the specified range for each measure
+- Scores MUST vary based on actual quality assessment
+- If a measure is truly not applicable, score it as the minimum value (not 0 unless that's the minimum)
+- DO NOT default to middle values - use the full range appropriately"""
+
+
 # ============================================================================
 # USER PROMPTS
 # ============================================================================
@@ -284,6 +373,27 @@ def get_baseline_subsequent_column_user_prompt(
     return llm_prompt
 
 
+# User prompt for later steps in conversation mode (from utils/prompts.py - build_conversation_messages)
+def get_baseline_conversation_step_user_prompt(col_name: str, instructions: str) -> str:
+    """
+    Generate the user prompt for a step after the first in conversation mode.
+
+    Earlier steps and responses are already in the message history, so only
+    the new step is sent.
+
+    Args:
+        col_name: Name of the current column/step
+        instructions: Instructions for this step
+
+    Returns:
+        str: Formatted user prompt for the next conversation turn
+    """
+    return f"""The current step is: {str.upper(col_name)}
+                Please respond to the following: {instructions}
+
+                Please respond with ONLY the response and absolutely no additional text or explanation. Do not use any newline characters or separate your answer with new lines."""
+
+
 # User prompt for persona generation (from utils/evaluate.py - generate_persona_from_attributes)
 def get_persona_generation_user_prompt(attributes_text: str) -> str:
     """
@@ -310,7 +420,7 @@ Please create a persona that:
 Respond with ONLY the persona description, no additional text or formatting."""
 
 
-# User prompt for evaluation (from utils/evaluate.py - process_row)
+# User prompt for evaluation (from utils/evaluate.py - evaluate_step)
 def get_evaluation_user_prompt(step_label: str, step_instructions: str, step_output: str, step_measures_list: str) -> str:
     """
     Generate the user prompt for evaluation.
@@ -335,3 +445,76 @@ Measures to use for evaluation:
 
 Please evaluate this response against the measures defined for this step. Provide scores that accurately reflect the quality of the response relative to the step instructions and measure criteria. Use the full range of scores available - do not default to middle values."""
 
+
+# User prompt for row-batched evaluation (from utils/evaluate.py - evaluate_row_batched)
+def get_row_evaluation_user_prompt(step_sections: list) -> str:
+    """
+    Generate the user prompt for scoring every step of one participant in a single request.
+    
+    Args:
+        step_sections: One dict per step with 'label', 'instructions', 'output' and
+            'measures_list' (numbered list of measure titles)
+    
+    Returns:
+        str: Formatted user prompt for row-batched evaluation
+    """
+    prompt = "Evaluate each of the following steps completed by the same participant.\n"
+    for idx, section in enumerate(step_sections):
+        prompt += f"""
+## Step {idx + 1}
+
+Step Title: {section['label']}
+
+Step Instructions: {section['instructions']}
+
+Output/Response: {section['output']}
+
+Measures to use for evaluation: 
+{section['measures_list']}
+"""
+    prompt += "\nPlease evaluate each response against the measures defined for its step. Provide scores that accurately reflect the quality of each response relative to its step instructions and measure criteria. Use the full range of scores available - do not default to middle values."
+    return prompt
+
+
+# Response block for packed evaluation (from utils/evaluate.py - EvaluationPacker)
+def get_packed_evaluation_item(item_number: int, step_output: str) -> str:
+    """
+    Format one numbered response for a packed evaluation request.
+    
+    Args:
+        item_number: 1-based number the evaluator must echo back
+        step_output: The actual response/output for the step
+    
+    Returns:
+        str: Formatted response block
+    """
+    return f"""### Response {item_number}
+{step_output}
+
+"""
+
+
+# User prompt for packed evaluation (from utils/evaluate.py - evaluate_step_packed)
+def get_packed_evaluation_user_prompt(step_label: str, step_instructions: str, responses: str, step_measures_list: str) -> str:
+    """
+    Generate the user prompt for scoring many participants' responses to the same step.
+    
+    Args:
+        step_label: Title/label of the step being evaluated
+        step_instructions: Instructions for the step
+        responses: Concatenated blocks from get_packed_evaluation_item
+        step_measures_list: Numbered list of measures to evaluate
+    
+    Returns:
+        str: Formatted user prompt for packed evaluation
+    """
+    return f"""Step Title: {step_label}
+
+Step Instructions: {step_instructions}
+
+Measures to use for evaluation: 
+{step_measures_list}
+
+Responses to evaluate:
+
+{responses}Please evaluate each numbered response independently against the measures defined for this step. Return one entry per response number. Provide scores that accurately reflect the quality of each response relative to the step instructions and measure criteria. Use the full range of scores available - do not default to middle values."""
@@ -34,7 +34,7 @@ interface ProgressData {
   id: string;
   task_id: string;
   progress: number;
-  status: 'Running' | 'Completed' | 'Failed';
+  status: 'Running' | 'Completed' | 'Failed' | 'Stopped';
   error_message?: string;
 }
 
@@ -112,7 +112,7 @@ export default function ActionButtons({
   // Handle completion/failure from Realtime progress updates
   const hasHandledCompletionRef = useRef(false);
   useEffect(() => {
-    if (!progressState.isComplete && !progressState.isFailed) return;
+    if (!progressState.isComplete && !progressState.isFailed && !progressState.isStopped) return;
     if (hasHandledCompletionRef.current) return;
     hasHandledCompletionRef.current = true;
 
@@ -121,12 +121,12 @@ export default function ActionButtons({
     setIsProcessing(false);
     setLoading(false);
 
-    if (progressState.isComplete) {
+    if (progressState.isComplete || progressState.isStopped) {
       const progressData: ProgressData = {
         id: "",
         task_id: taskId ?? "",
         progress: 100,
-        status: "Completed",
+        status: progressState.isStopped ? "Stopped" : "Completed",
       };
       setProgress(progressData);
       onProgressUpdate(progressData);
@@ -134,12 +134,15 @@ export default function ActionButtons({
         setDownload(progressState.url);
         setIsDisabled(false);
       }
+      if (progressState.isStopped) {
+        alert("Simulation stopped at its cost limit. The partial results can be downloaded; add credits to resume it.");
+      }
     } else {
       setProgress(null);
       onProgressUpdate(null);
       alert("Simulation failed. Please try again.");
     }
-  }, [progressState.isComplete, progressState.isFailed, progressState.url, taskId]);
+  }, [progressState.isComplete, progressState.isFailed, progressState.isStopped, progressState.url, taskId]);
 
   // Reset completion handler when starting a new simulation
   useEffect(() => {
@@ -151,20 +154,27 @@ export default function ActionButtons({
   // Sync progress display from Realtime
   useEffect(() => {
     if (progressState.progress !== null) {
+      const progressStatus: ProgressData["status"] = progressState.isFailed
+        ? "Failed"
+        : progressState.isStopped
+        ? "Stopped"
+        : progressState.isComplete
+        ? "Completed"
+        : "Running";
       setProgress({
         id: "",
         task_id: taskId ?? "",
         progress: progressState.progress,
-        status: progressState.isFailed ? "Failed" : progressState.isComplete ? "Completed" : "Running",
+        status: progressStatus,
       });
       onProgressUpdate({
         id: "",
         task_id: taskId ?? "",
         progress: progressState.progress,
-        status: progressState.isFailed ? "Failed" : progressState.isComplete ? "Completed" : "Running",
+        status: progressStatus,
       });
     }
-  }, [progressState.progress, progressState.isComplete, progressState.isFailed, taskId]);
+  }, [progressState.progress, progressState.isComplete, progressState.isFailed, progressState.isStopped, taskId]);
 
   /**
    * Handles downloading of the simulation result file.
@@ -12,7 +12,7 @@ interface ProgressData {
   user_id: string;
   task_id: string;
   progress: number;
-  status: 'started' | 'processing' | 'completed' | 'failed';
+  status: 'started' | 'processing' | 'completed' | 'failed' | 'stopped';
   error_message?: string;
   created_at: string;
   updated_at: string;
@@ -50,6 +50,8 @@ export default function ProgressBanner({
         return 'Simulation completed!';
       case 'failed':
         return 'Simulation failed';
+      case 'stopped':
+        return 'Simulation stopped at its cost limit';
       default:
         return 'Processing...';
     }
@@ -64,6 +66,8 @@ export default function ProgressBanner({
         return 'bg-green-600';
       case 'failed':
         return 'bg-red-600';
+      case 'stopped':
+        return 'bg-orange-600';
       default:
         return 'bg-amber-500';
     }
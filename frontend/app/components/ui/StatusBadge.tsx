@@ -12,6 +12,8 @@ export default function StatusBadge({ status, progress }: StatusBadgeProps) {
         return 'bg-blue-100 text-blue-800';
       case 'Running':
         return 'bg-gray-200 text-gray-800'; // Light gray as shown in image
+      case 'Stopped':
+        return 'bg-amber-100 text-amber-800';
       case 'Draft':
         return 'bg-gray-100 text-gray-800';
       default:
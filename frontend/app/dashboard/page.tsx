@@ -161,6 +161,7 @@ export default function DashboardHistory() {
         url: string | null;
         isComplete: boolean;
         isFailed: boolean;
+        isStopped: boolean;
         id?: number;
         created_at?: string;
         experiment_data?: { title?: string; simulation_name?: string };
@@ -169,10 +170,17 @@ export default function DashboardHistory() {
       setProjects((prev) =>
         prev.map((project) => {
           if (project.experiment_id !== experimentId) return project;
-          const status = update.isFailed ? "Failed" : update.isComplete ? "Completed" : "Running";
-          const progress = update.isComplete || update.isFailed ? undefined : update.progress;
+          const status = update.isFailed
+            ? "Failed"
+            : update.isStopped
+            ? "Stopped"
+            : update.isComplete
+            ? "Completed"
+            : "Running";
+          const finished = update.isComplete || update.isFailed || update.isStopped;
+          const progress = finished ? undefined : update.progress;
           const updated: Project = { ...project, status, progress };
-          if ((update.isComplete || update.isFailed) && update.url) {
+          if (finished && update.url) {
             const expData = update.experiment_data || {};
             const newDownload: Download = {
               date: update.created_at ? new Date(update.created_at).toLocaleString() : new Date().toLocaleString(),
@@ -590,6 +598,8 @@ export default function DashboardHistory() {
           status = 'Completed';
         } else if (statusLower === 'failed' || statusLower === 'error') {
           status = 'Failed';
+        } else if (statusLower === 'stopped') {
+          status = 'Stopped';
         }
         
         const sampleName = experimentData.sample?.name || experiment.sample_name || experiment.description || "No seed";
@@ -721,7 +731,7 @@ export default function DashboardHistory() {
             const alreadyInList = existingIdx !== -1;
             if (alreadyInList) {
               const existing = formattedProjects[existingIdx];
-              if (existing.status === "Running" || existing.status === "Completed" || existing.status === "Failed") {
+              if (existing.status === "Running" || existing.status === "Completed" || existing.status === "Failed" || existing.status === "Stopped") {
                 // Backend has already updated the row; safe to clear pending
                 localStorage.removeItem("simulation-pending");
               } else {
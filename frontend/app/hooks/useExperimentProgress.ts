@@ -9,6 +9,7 @@ export interface ExperimentProgressState {
   url: string | null;
   isComplete: boolean;
   isFailed: boolean;
+  isStopped: boolean;
 }
 
 function normalizeProgress(value: number | undefined | null): number {
@@ -19,6 +20,8 @@ function normalizeProgress(value: number | undefined | null): number {
 
 function isCompleteStatus(status: string, progress: number): boolean {
   const s = status?.toLowerCase() ?? "";
+  // A run stopped at its cost ceiling also ends at 100%
+  if (s === "stopped") return false;
   return (
     progress >= 100 ||
     s === "completed" ||
@@ -32,6 +35,11 @@ function isFailedStatus(status: string): boolean {
   return s === "failed";
 }
 
+function isStoppedStatus(status: string): boolean {
+  const s = status?.toLowerCase() ?? "";
+  return s === "stopped";
+}
+
 /**
  * Subscribe to experiment progress via Supabase Realtime (Postgres changes).
  * Replaces database polling with WebSocket push updates.
@@ -118,6 +126,7 @@ export function useExperimentProgress(
   const progressVal = progress ?? 0;
   const isComplete = isCompleteStatus(status, progressVal);
   const isFailed = isFailedStatus(status);
+  const isStopped = isStoppedStatus(status);
 
   return {
     progress,
@@ -125,5 +134,6 @@ export function useExperimentProgress(
     url,
     isComplete,
     isFailed,
+    isStopped,
   };
 }
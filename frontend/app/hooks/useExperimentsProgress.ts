@@ -9,6 +9,7 @@ export interface ExperimentProgressUpdate {
   url: string | null;
   isComplete: boolean;
   isFailed: boolean;
+  isStopped: boolean;
   id?: number;
   created_at?: string;
   experiment_data?: { title?: string; simulation_name?: string };
@@ -54,9 +55,12 @@ export function useExperimentsProgress(
 
       const progress = normalizeProgress(row.progress);
       const status = row.status ?? "";
+      // A run stopped at its cost ceiling also ends at 100%
+      const isStopped = status.toLowerCase() === "stopped";
       const isComplete =
-        progress >= 100 ||
-        ["completed", "done", "finished"].includes(status.toLowerCase());
+        !isStopped &&
+        (progress >= 100 ||
+          ["completed", "done", "finished"].includes(status.toLowerCase()));
       const isFailed = status.toLowerCase() === "failed";
 
       stableOnProgress(experimentId, {
@@ -65,6 +69,7 @@ export function useExperimentsProgress(
         url: row.url ?? null,
         isComplete,
         isFailed,
+        isStopped,
         id: row.id,
         created_at: row.created_at,
         experiment_data: row.experiment_data,
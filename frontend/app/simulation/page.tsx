@@ -969,7 +969,7 @@ function SimulationPageContent() {
   // Handle completion/failure from Realtime progress updates
   const hasHandledCompletionRef = useRef(false);
   useEffect(() => {
-    if (!progressState.isComplete && !progressState.isFailed) return;
+    if (!progressState.isComplete && !progressState.isFailed && !progressState.isStopped) return;
     if (hasHandledCompletionRef.current) return;
     hasHandledCompletionRef.current = true;
 
@@ -981,10 +981,12 @@ function SimulationPageContent() {
 
     if (progressState.isFailed) {
       alert("Simulation failed. Please check your experiment settings and try again.");
+    } else if (progressState.isStopped) {
+      alert("Simulation stopped at its cost limit. Partial results are in the Dashboard; add credits to resume it.");
     } else {
       alert("Simulation completed successfully! You can view the results in the Dashboard.");
     }
-  }, [progressState.isComplete, progressState.isFailed]);
+  }, [progressState.isComplete, progressState.isFailed, progressState.isStopped]);
 
   // Reset completion handler when starting a new simulation
   useEffect(() => {
@@ -0,0 +1,5 @@
+-- Public URL of the Parquet copy of an experiment's results, uploaded next to
+-- the XLSX report in the llm-responses bucket. NULL for older experiments or
+-- when the backend runs without pyarrow.
+alter table public.experiments
+    add column if not exists results_parquet_url text;
@@ -0,0 +1,18 @@
+-- Per-(persona row, step) checkpoints of running, failed and stopped
+-- simulations, so POST /api/evaluate/resume works from any backend instance.
+-- kind 'run' holds the personas the run started with (row_idx -1, step '');
+-- 'generation' and 'evaluation' hold one completed unit each. Rows are
+-- deleted when the experiment completes. Only the backend's service role
+-- reads and writes them: RLS is enabled with no policies.
+create table if not exists public.simulation_checkpoints (
+    experiment_id text not null,
+    kind text not null check (kind in ('run', 'generation', 'evaluation')),
+    row_idx integer not null,
+    step text not null,
+    data jsonb not null,
+    usage jsonb not null default '{}'::jsonb,
+    created_at timestamptz not null default now(),
+    primary key (experiment_id, kind, row_idx, step)
+);
+
+alter table public.simulation_checkpoints enable row level security;